@@ -0,0 +1,123 @@
+"""Latency under overload with and without AdmissionMiddleware.
+
+An in-process app whose reads and writes each hold one of a few upstream
+slots for a few milliseconds (a slow dependency with bounded capacity)
+receives open-loop traffic, arrivals at a fixed rate whatever the
+responses do, at ``--overload`` times what it can serve, plus /health
+probes. Without admission control the backlog grows for as long as the
+overload lasts and so does every latency, /health included. With it,
+requests queue a bounded time, reads first, and the rest are refused
+with a fast 503, so the latency of what is served stays bounded.
+
+    python benchmarks/bench_admission.py [--seconds 5] [--overload 2] [--write-share 0.3]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+os.environ["METRICS_ENABLED"] = "false"
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "post-service"))
+
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+
+from app.admission import AdmissionController, AdmissionMiddleware  # noqa: E402
+
+UPSTREAM_SLOTS = 4
+UPSTREAM_SECONDS = 0.01
+CAPACITY = UPSTREAM_SLOTS / UPSTREAM_SECONDS
+
+
+def make_app(controller) -> FastAPI:
+    app = FastAPI()
+    upstream = asyncio.Semaphore(UPSTREAM_SLOTS)
+
+    async def call_upstream():
+        async with upstream:
+            await asyncio.sleep(UPSTREAM_SECONDS)
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy"}
+
+    @app.get("/api/v1/posts/{post_id}")
+    async def read(post_id: int):
+        await call_upstream()
+        return {"id": post_id}
+
+    @app.post("/api/v1/posts")
+    async def write():
+        await call_upstream()
+        return {"id": 1}
+
+    if controller is not None:
+        app.add_middleware(AdmissionMiddleware, controller=controller)
+    return app
+
+
+async def drive(app: FastAPI, seconds: float, rate: float, write_share: float) -> dict:
+    results = defaultdict(list)
+    rng = random.Random(1)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+
+        async def one(kind: str):
+            start = time.perf_counter()
+            if kind == "read":
+                response = await client.get(f"/api/v1/posts/{rng.randint(1, 1000)}")
+            elif kind == "write":
+                response = await client.post("/api/v1/posts", json={})
+            else:
+                response = await client.get("/health")
+            results[kind, response.status_code].append(time.perf_counter() - start)
+
+        tasks = []
+        start = time.perf_counter()
+        sent = 0
+        while (elapsed := time.perf_counter() - start) < seconds:
+            # Catch up to the schedule, then yield to the server
+            while sent < elapsed * rate:
+                kind = "write" if rng.random() < write_share else "read"
+                tasks.append(asyncio.ensure_future(one(kind)))
+                sent += 1
+                if sent % 50 == 0:
+                    tasks.append(asyncio.ensure_future(one("health")))
+            await asyncio.sleep(0.001)
+        await asyncio.gather(*tasks)
+    return results
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] * 1000 if values else float("nan")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--overload", type=float, default=2.0, help="offered load / capacity")
+    parser.add_argument("--write-share", type=float, default=0.3)
+    args = parser.parse_args()
+
+    rate = CAPACITY * args.overload
+    print(f"capacity {CAPACITY:.0f} req/s, offered {rate:.0f} req/s for {args.seconds:.0f}s")
+    print(f"{'admission':<10} {'kind':<7} {'ok':>6} {'429/503':>8} {'p50 ms':>8} {'p99 ms':>8} {'reject p99':>11}")
+    variants = {
+        "off": None,
+        "on": AdmissionController(concurrency=UPSTREAM_SLOTS * 2, read_max_wait=0.2, write_max_wait=0.1),
+    }
+    for name, controller in variants.items():
+        results = await drive(make_app(controller), args.seconds, rate, args.write_share)
+        for kind in ("read", "write", "health"):
+            ok = results[kind, 200]
+            rejected = results[kind, 503] + results[kind, 429]
+            print(f"{name:<10} {kind:<7} {len(ok):>6} {len(rejected):>8} {percentile(ok, 0.5):>8.1f} "
+                  f"{percentile(ok, 0.99):>8.1f} {percentile(rejected, 0.99):>11.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,74 @@
+"""Rows/s of the user-service /bulk endpoint against one POST per record.
+
+Runs in-process against the in-memory app (app.main) and against the
+SQLAlchemy routes (app.routes) on a throwaway SQLite file.
+
+    python benchmarks/bench_bulk.py [--rows 5000] [--batch 1000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "bench_bulk.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{DB_FILE}")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "user-service"))
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app import database, routes  # noqa: E402
+from app.main import app as memory_app  # noqa: E402
+
+
+def sql_app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(routes.router, prefix="/api/v1")
+
+    @app.on_event("startup")
+    async def create_tables():
+        async with database.engine.begin() as conn:
+            await conn.run_sync(database.Base.metadata.create_all)
+
+    return app
+
+
+def users(prefix: str, count: int):
+    return [
+        {"username": f"{prefix}{i}", "email": f"{prefix}{i}@example.com", "full_name": "Bench User"}
+        for i in range(count)
+    ]
+
+
+def single(client: TestClient, rows) -> float:
+    start = time.perf_counter()
+    for row in rows:
+        assert client.post("/api/v1/users", json=row).status_code == 200
+    return len(rows) / (time.perf_counter() - start)
+
+
+def bulk(client: TestClient, rows, batch: int) -> float:
+    start = time.perf_counter()
+    for i in range(0, len(rows), batch):
+        response = client.post("/api/v1/users/bulk", json=rows[i:i + batch])
+        assert response.json()["failed"] == 0
+    return len(rows) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'backend':<10} {'single rows/s':>14} {'bulk rows/s':>12} {'speedup':>8}")
+    for name, app in (("memory", memory_app), ("sqlite", sql_app())):
+        with TestClient(app) as client:
+            one = single(client, users(f"{name}-s", args.rows))
+            many = bulk(client, users(f"{name}-b", args.rows), args.batch)
+        print(f"{name:<10} {one:>14.0f} {many:>12.0f} {many / one:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Bytes on the wire and CPU per response for each encoding and compression.
+
+Builds pages of comments, posts and users shaped like what
+get_all_comments, get_posts and get_users return (default and maximum
+page size, text drawn from a fixed vocabulary so it compresses like
+prose, not like repeated filler), then reports:
+
+- per codec and level the middleware can use: compressed size, ratio,
+  and the time to compress (server) and decompress (client) one page;
+- JSON against MessagePack: size, encode time (ListEncoder), decode
+  time (decode_body), and size once compressed with zstd;
+- a full NDJSON export streamed through CompressionMiddleware, flushed
+  chunk by chunk, against the same body compressed in one go.
+
+    python benchmarks/bench_compression.py [--repeat 20]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+os.environ["METRICS_ENABLED"] = "false"
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "post-service"))
+
+import brotli  # noqa: E402
+import zlib  # noqa: E402
+import zstandard  # noqa: E402
+from pydantic import BaseModel  # noqa: E402
+from starlette.responses import StreamingResponse  # noqa: E402
+
+from app.negotiation import CODECS, CompressionMiddleware  # noqa: E402
+from app.serialization import MSGPACK_MEDIA_TYPE, ListEncoder, decode_body  # noqa: E402
+from app.streaming import ndjson_stream  # noqa: E402
+
+WORDS = (
+    "the a post comment user reply thread service latency cache page cursor query index read write "
+    "request response payload network bandwidth server client python fastapi database commit "
+    "stream batch search token score shard replica event bus worker process memory disk great "
+    "thanks agree disagree interesting question answer example really think would could should"
+).split()
+
+LEVELS = {"gzip": (1, 6, 9), "br": (1, 4, 11), "zstd": (1, 3, 10)}
+DECOMPRESS = {
+    "gzip": lambda data: zlib.decompress(data, 31),
+    "br": brotli.decompress,
+    "zstd": lambda data: zstandard.ZstdDecompressor().decompressobj().decompress(data),
+}
+
+
+class Comment(BaseModel):
+    id: int
+    content: str
+    post_id: int
+    author_id: int
+    created_at: str
+
+
+class Post(BaseModel):
+    id: int
+    title: str
+    content: str
+    author_id: int
+    created_at: str
+
+
+class User(BaseModel):
+    id: int
+    username: str
+    email: str
+    full_name: str
+    bio: str
+    created_at: str
+
+
+def text(rng: random.Random, low: int, high: int) -> str:
+    return " ".join(rng.choices(WORDS, k=rng.randint(low, high))).capitalize() + "."
+
+
+def records(kind: str, count: int, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    epoch = datetime(2024, 1, 1)
+    rows = []
+    for i in range(1, count + 1):
+        created_at = (epoch + timedelta(seconds=rng.randint(0, 10 ** 7))).isoformat()
+        if kind == "comments":
+            rows.append({"id": i, "content": text(rng, 5, 40), "post_id": rng.randint(1, 5000),
+                         "author_id": rng.randint(1, 1000), "created_at": created_at})
+        elif kind == "posts":
+            rows.append({"id": i, "title": text(rng, 3, 10), "content": text(rng, 50, 300),
+                         "author_id": rng.randint(1, 1000), "created_at": created_at})
+        else:
+            name = f"{rng.choice(WORDS)}{rng.randint(1, 9999)}"
+            rows.append({"id": i, "username": name, "email": f"{name}@example.com",
+                         "full_name": f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()}",
+                         "bio": text(rng, 0, 20), "created_at": created_at})
+    return rows
+
+
+def timed(fn, repeat: int) -> float:
+    """Best of ``repeat`` runs of ``fn()``, in milliseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def compress(name: str, level: int, body: bytes) -> bytes:
+    compressor = CODECS[name](level)
+    return compressor.compress(body) + compressor.finish()
+
+
+async def stream_export(body_chunks: list, accept_encoding: str) -> tuple:
+    """(wire bytes, chunks sent) for a streamed export through the middleware"""
+    app = CompressionMiddleware(StreamingResponse(iter(body_chunks), media_type="application/x-ndjson"))
+    sent = []
+
+    async def receive():
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            sent.append(len(message["body"]))
+
+    scope = {"type": "http", "method": "GET", "path": "/export", "headers": [(b"accept-encoding", accept_encoding.encode())]}
+    await app(scope, receive, send)
+    return sum(sent), len(sent)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    models = {"comments": Comment, "posts": Post, "users": User}
+    pages = [(kind, size) for kind in models for size in (100, 1000)]
+
+    print(f"{'page':<16} {'codec':<8} {'bytes':>9} {'ratio':>6} {'compress ms':>12} {'decompress ms':>14}")
+    for kind, size in pages:
+        body = ListEncoder(models[kind]).encode(records(kind, size))
+        label = f"{kind} x{size}"
+        print(f"{label:<16} {'identity':<8} {len(body):>9} {1:>6.1f} {0:>12.2f} {0:>14.2f}")
+        for name, levels in LEVELS.items():
+            for level in levels:
+                compressed = compress(name, level, body)
+                assert DECOMPRESS[name](compressed) == body
+                print(f"{'':<16} {f'{name}-{level}':<8} {len(compressed):>9} {len(body) / len(compressed):>6.1f} "
+                      f"{timed(lambda: compress(name, level, body), args.repeat):>12.2f} "
+                      f"{timed(lambda: DECOMPRESS[name](compressed), args.repeat):>14.2f}")
+
+    print()
+    print(f"{'page':<16} {'format':<8} {'bytes':>9} {'encode ms':>10} {'decode ms':>10} {'zstd-3 bytes':>13}")
+    for kind, size in pages:
+        encoder = ListEncoder(models[kind])
+        items = records(kind, size)
+        label = f"{kind} x{size}"
+        for name, encode, media_type in (
+            ("json", encoder.encode, "application/json"),
+            ("msgpack", encoder.encode_msgpack, MSGPACK_MEDIA_TYPE),
+        ):
+            body = encode(items)
+            assert decode_body(body, media_type) == items
+            print(f"{label:<16} {name:<8} {len(body):>9} {timed(lambda: encode(items), args.repeat):>10.2f} "
+                  f"{timed(lambda: decode_body(body, media_type), args.repeat):>10.2f} "
+                  f"{len(compress('zstd', 3, body)):>13}")
+            label = ""
+
+    print()
+    print(f"{'export':<16} {'codec':<8} {'bytes':>9} {'one-shot':>9} {'chunks':>7} {'ms':>8}")
+    chunks = list(ndjson_stream(records("comments", 50000), batch_size=1000))
+    whole = b"".join(chunks)
+    print(f"{'comments x50000':<16} {'identity':<8} {len(whole):>9} {len(whole):>9} {len(chunks):>7} {0:>8.1f}")
+    for name in LEVELS:
+        start = time.perf_counter()
+        wire, sent = asyncio.run(stream_export(chunks, name))
+        elapsed = (time.perf_counter() - start) * 1000
+        level = CompressionMiddleware(None).levels[name]
+        print(f"{'':<16} {f'{name}-{level}':<8} {wire:>9} {len(compress(name, level, whole)):>9} {sent:>7} {elapsed:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
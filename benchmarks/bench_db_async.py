@@ -0,0 +1,126 @@
+"""Throughput of the async SQLAlchemy routes against sync threadpool handlers.
+
+Both variants serve the same user-service reads and writes from one SQLite
+file under concurrent load: the baseline is the old style (``def`` handlers,
+a sync Session, FastAPI's threadpool), the other is app.routes on the async
+engine (aiosqlite). Requests go through httpx's in-process ASGI transport,
+so the numbers measure the app and the driver rather than the network.
+
+    python benchmarks/bench_db_async.py [--users 500] [--requests 2000] [--concurrency 50]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "bench_db_async.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{DB_FILE}")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "user-service"))
+
+import httpx  # noqa: E402
+from fastapi import Depends, FastAPI, HTTPException  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import Session, sessionmaker  # noqa: E402
+
+from app import database, models, routes, schemas  # noqa: E402
+
+
+def sync_app() -> FastAPI:
+    """The pre-async handlers: sync Session, one threadpool worker per request"""
+    engine = create_engine(os.environ["DATABASE_URL"], connect_args={"check_same_thread": False})
+    local = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+
+    def get_db():
+        db = local()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = FastAPI()
+
+    @app.post("/api/v1/users", response_model=schemas.User)
+    def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+        db_user = models.User(**user.model_dump())
+        db.add(db_user)
+        db.commit()
+        db.refresh(db_user)
+        return db_user
+
+    @app.get("/api/v1/users/{user_id}", response_model=schemas.User)
+    def get_user(user_id: int, db: Session = Depends(get_db)):
+        user = db.query(models.User).filter(models.User.id == user_id).first()
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        return user
+
+    return app
+
+
+def async_app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(routes.router, prefix="/api/v1")
+    return app
+
+
+async def create_tables():
+    async with database.engine.begin() as conn:
+        await conn.run_sync(database.Base.metadata.create_all)
+
+
+async def run(app: FastAPI, name: str, users: int, requests: int, concurrency: int) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        ids = []
+        for i in range(users):
+            row = {"username": f"{name}{i}", "email": f"{name}{i}@example.com", "full_name": "Bench User"}
+            ids.append((await client.post("/api/v1/users", json=row)).json()["id"])
+
+        queue = asyncio.Queue()
+        for i in range(requests):
+            queue.put_nowait(i)
+        latencies = []
+
+        async def worker():
+            while not queue.empty():
+                i = queue.get_nowait()
+                start = time.perf_counter()
+                if i % 10 == 0:
+                    row = {"username": f"{name}-w{i}", "email": f"{name}-w{i}@example.com", "full_name": "Bench User"}
+                    response = await client.post("/api/v1/users", json=row)
+                else:
+                    response = await client.get(f"/api/v1/users/{ids[i % len(ids)]}")
+                assert response.status_code == 200, response.text
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "rps": requests / elapsed,
+        "p50": latencies[len(latencies) // 2] * 1000,
+        "p99": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    await create_tables()
+    print(f"{'handlers':<10} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, app in (("sync", sync_app()), ("async", async_app())):
+        result = await run(app, name, args.users, args.requests, args.concurrency)
+        print(f"{name:<10} {result['rps']:>8.0f} {result['p50']:>8.1f} {result['p99']:>8.1f}")
+    await database.engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+"""Cost of polling an unchanged comment list, with and without If-None-Match.
+
+comment-service runs in-process on the in-memory store. A client polls one
+post's comments; the plain poll downloads and the server re-serializes the
+whole page every time, the conditional poll sends back the ETag it got and
+receives a bodiless 304 while nothing has changed.
+
+    python benchmarks/bench_etag.py [--comments 1000] [--requests 500]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "comment-service"))
+
+import httpx  # noqa: E402
+
+from app import main as comment_main  # noqa: E402
+
+POST_ID = 1
+
+
+async def poll(client: httpx.AsyncClient, path: str, requests: int, conditional: bool) -> dict:
+    headers = {}
+    if conditional:
+        headers["If-None-Match"] = (await client.get(path)).headers["etag"]
+    latencies, received, statuses = [], 0, set()
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = await client.get(path, headers=headers)
+        latencies.append(time.perf_counter() - start)
+        received += len(response.content)
+        statuses.add(response.status_code)
+    return {
+        "status": "/".join(map(str, sorted(statuses))),
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p99_ms": statistics.quantiles(latencies, n=100)[98] * 1000,
+        "bytes": received / requests,
+    }
+
+
+async def main_async(comments: int, requests: int):
+    comment_main.comments_db.insert_many(
+        {"content": f"comment {i} " * 8, "post_id": POST_ID, "author_id": i % 50 + 1,
+         "created_at": "2024-01-01T00:00:00"}
+        for i in range(comments)
+    )
+    transport = httpx.ASGITransport(app=comment_main.app)
+    path = f"/api/v1/comments/post/{POST_ID}?limit={comments}"
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"{'poll':<14} {'status':>7} {'mean':>9} {'p99':>9} {'bytes/req':>11}")
+        for name, conditional in (("plain", False), ("If-None-Match", True)):
+            r = await poll(client, path, requests, conditional)
+            print(f"{name:<14} {r['status']:>7} {r['mean_ms']:>7.2f}ms {r['p99_ms']:>7.2f}ms {r['bytes']:>11.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--comments", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(main_async(args.comments, args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Comment write latency: upstream existence checks vs replicas fed by events.
+
+comment-service runs in-process with a FileBus in a temporary directory.
+user-service and post-service are stubs behind --latency ms of network
+delay; a second FileBus stands in for them publishing their "created"
+events. Every comment names an author and post not seen before, so the
+existence cache never helps and only the replicas can.
+
+    python benchmarks/bench_events.py [--comments 300] [--latency 20]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ["EVENT_BUS_DIR"] = tempfile.mkdtemp()
+os.environ.setdefault("EVENT_BUS_POLL_MS", "20")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "comment-service"))
+
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from pydantic import BaseModel  # noqa: E402
+
+from app import main as comment_main  # noqa: E402
+from app.events import CREATED, FileBus  # noqa: E402
+
+
+class SlowTransport(httpx.AsyncBaseTransport):
+    def __init__(self, app, latency: float):
+        self.inner = httpx.ASGITransport(app=app)
+        self.latency = latency
+
+    async def handle_async_request(self, request):
+        await asyncio.sleep(self.latency)
+        return await self.inner.handle_async_request(request)
+
+
+class Ids(BaseModel):
+    ids: list
+
+
+def exists_stub(path: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.post(path)
+    def exists(request: Ids):
+        return {"existing": request.ids, "missing": []}
+
+    return app
+
+
+async def create_comments(client: httpx.AsyncClient, ids) -> dict:
+    samples = []
+    for i in ids:
+        start = time.perf_counter()
+        response = await client.post("/api/v1/comments", json={"content": "hi", "post_id": i, "author_id": i})
+        samples.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.text
+    samples.sort()
+    return {"p50": statistics.median(samples), "p99": samples[int(len(samples) * 0.99) - 1]}
+
+
+async def propagation_ms(publisher: FileBus, record_id: int) -> float:
+    start = time.perf_counter()
+    publisher.publish("users", CREATED, record_id)
+    while record_id not in comment_main.user_replica:
+        await asyncio.sleep(0.001)
+    return (time.perf_counter() - start) * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--comments", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=20.0, help="ms per upstream call")
+    args = parser.parse_args()
+    latency = args.latency / 1000
+
+    for service, path in ((comment_main.user_service, "/api/v1/users:exists"),
+                          (comment_main.post_service, "/api/v1/posts:exists")):
+        service._client = httpx.AsyncClient(transport=SlowTransport(exists_stub(path), latency),
+                                            base_url=service.base_url)
+
+    # The other services announce the ids the second half of the run uses
+    n = args.comments
+    publisher = FileBus(os.environ["EVENT_BUS_DIR"])
+    publisher.publish_many("users", CREATED, range(n + 1, 2 * n + 1))
+    publisher.publish_many("posts", CREATED, range(n + 1, 2 * n + 1))
+    await comment_main.bus.start()
+
+    transport = httpx.ASGITransport(app=comment_main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://comment-service") as client:
+        print(f"{n} comments, {args.latency}ms per upstream call")
+        print(f"{'existence checks':<22} {'p50 ms':>8} {'p99 ms':>8}")
+        for name, ids in (("upstream HTTP", range(1, n + 1)), ("local replica", range(n + 1, 2 * n + 1))):
+            result = await create_comments(client, ids)
+            print(f"{name:<22} {result['p50']:>8.2f} {result['p99']:>8.2f}")
+
+    lags = [await propagation_ms(publisher, 10 ** 6 + i) for i in range(20)]
+    print(f"event propagation: median {statistics.median(lags):.1f}ms "
+          f"(poll interval {os.environ['EVENT_BUS_POLL_MS']}ms)")
+    await comment_main.bus.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
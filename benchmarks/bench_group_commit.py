@@ -0,0 +1,120 @@
+"""Comments per second on one hot post, one commit per comment vs group commit.
+
+Concurrent clients POST single comments to the same post through
+comment-service's SQL routes on a SQLite file, first with a transaction
+per request, then through the GroupCommitWriter that COMMENT_GROUP_COMMIT
+turns on. SQLite runs in WAL mode with synchronous=FULL, so every commit
+is synced to disk, and a long busy timeout lets concurrent transactions
+queue for the write lock as they would on PostgreSQL instead of failing.
+Authors and the post
+are put in the local id replicas, so no upstream is called. Afterwards
+the rows and the post's comment counter are checked against the number
+of acknowledged requests.
+
+    python benchmarks/bench_group_commit.py [--requests 2000] [--concurrency 100]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "bench_group_commit.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{DB_FILE}")
+os.environ["METRICS_ENABLED"] = "false"
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "comment-service"))
+
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from sqlalchemy import event, func, select  # noqa: E402
+
+from app import database, models, routes  # noqa: E402
+from app.events import CREATED  # noqa: E402
+from app.writer import GroupCommitWriter  # noqa: E402
+
+AUTHORS = 1000
+
+
+@event.listens_for(database.engine.sync_engine, "connect")
+def configure_sqlite(connection, record):
+    cursor = connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=FULL")
+    cursor.execute("PRAGMA busy_timeout=60000")
+    cursor.close()
+
+
+async def run(client: httpx.AsyncClient, post_id: int, requests: int, concurrency: int) -> dict:
+    queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(i)
+    latencies = []
+
+    async def worker():
+        while not queue.empty():
+            i = queue.get_nowait()
+            row = {"content": f"comment {i} on a viral post", "post_id": post_id, "author_id": i % AUTHORS + 1}
+            start = time.perf_counter()
+            response = await client.post("/api/v1/comments", json=row)
+            assert response.status_code == 200, response.text
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "rps": requests / elapsed,
+        "p50": latencies[len(latencies) // 2] * 1000,
+        "p99": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+async def stored(post_id: int):
+    async with database.SessionLocal() as db:
+        rows = await db.scalar(select(func.count()).where(models.Comment.post_id == post_id))
+        counter = await db.scalar(select(models.CommentCount.count).where(
+            models.CommentCount.scope == "post", models.CommentCount.owner_id == post_id
+        ))
+    return rows, counter
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--window-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    async with database.engine.begin() as conn:
+        await conn.run_sync(database.Base.metadata.create_all)
+    for author_id in range(1, AUTHORS + 1):
+        routes.user_replica.apply({"type": CREATED, "id": author_id})
+    app = FastAPI()
+    app.include_router(routes.router, prefix="/api/v1")
+
+    variants = {
+        "commit per request": None,
+        "group commit": GroupCommitWriter(routes._commit_comments, window=args.window_ms / 1000),
+    }
+    print(f"{'writes':<20} {'comments/s':>11} {'p50 ms':>8} {'p99 ms':>8} {'speedup':>8}")
+    baseline = None
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for post_id, (name, writer) in enumerate(variants.items(), start=1):
+            routes.post_replica.apply({"type": CREATED, "id": post_id})
+            routes.comment_writer = writer
+            result = await run(client, post_id, args.requests, args.concurrency)
+            if writer is not None:
+                await writer.close()
+            baseline = baseline or result["rps"]
+            print(f"{name:<20} {result['rps']:>11.0f} {result['p50']:>8.1f} {result['p99']:>8.1f} "
+                  f"{result['rps'] / baseline:>7.1f}x")
+            rows, counter = await stored(post_id)
+            assert rows == counter == args.requests, (rows, counter)
+    print(f"every acknowledged comment stored and counted ({args.requests} per variant)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+"""Memory and speed of comment records as dicts and as columns.
+
+Fills comment-service's IndexedStore with the same comments twice, once
+with records as plain dicts and once in the COMMENT_COLUMNS layout of
+main.py, and reports the bytes each comment costs (tracemalloc, store and
+indexes included) scaled to a million, the insert rate, and the time to
+read a page of 100 and a single comment. The pages read back from both
+stores are compared, so the output served does not change.
+
+    python benchmarks/bench_memory.py [--comments 200000]
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "comment-service"))
+
+from app.main import COMMENT_COLUMNS  # noqa: E402
+from app.store import IndexedStore  # noqa: E402
+
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor".split()
+READS = 2000
+
+
+def comments(count: int):
+    rng = random.Random(42)
+    start = datetime(2024, 1, 1)
+    for i in range(count):
+        yield {
+            "content": " ".join(rng.choices(WORDS, k=rng.randint(4, 20))),
+            "post_id": rng.randint(1, count // 20 + 1),
+            "author_id": rng.randint(1, count // 100 + 1),
+            # A few comments per second, as from the API
+            "created_at": (start + timedelta(microseconds=i * 250_000 + rng.randint(0, 999))).isoformat(),
+        }
+
+
+def fill(columns, rows: list):
+    """The filled store, its bytes per record and its inserts per second.
+
+    The measured store gets freshly made comments, so it owns their
+    strings as it would behind the API. tracemalloc slows every
+    allocation down, so the inserts are timed on a second store, filled
+    from ``rows`` without it.
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    store = IndexedStore(indexed=("post_id", "author_id"), columns=columns)
+    for comment in comments(len(rows)):
+        store.insert(comment)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    timed = IndexedStore(indexed=("post_id", "author_id"), columns=columns)
+    start = time.perf_counter()
+    for row in rows:
+        timed.insert(row)
+    elapsed = time.perf_counter() - start
+    return store, used / len(rows), len(rows) / elapsed
+
+
+def read_us(store: IndexedStore, count: int):
+    rng = random.Random(7)
+    offsets = [rng.randint(0, count - 100) for _ in range(READS)]
+    start = time.perf_counter()
+    for after_id in offsets:
+        store.page(after_id, 100)
+    page = (time.perf_counter() - start) / READS * 1e6
+    start = time.perf_counter()
+    for after_id in offsets:
+        store.get(after_id + 1)
+    single = (time.perf_counter() - start) / READS * 1e6
+    return page, single
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--comments", type=int, default=200_000)
+    args = parser.parse_args()
+
+    print(f"{'records':<8} {'bytes/comment':>14} {'MiB/1M':>8} {'inserts/s':>10} {'page us':>8} {'get us':>7}")
+    rows = list(comments(args.comments))
+    stores = {}
+    for name, columns in (("dicts", None), ("columns", COMMENT_COLUMNS)):
+        store, per_record, rate = fill(columns, rows)
+        page, single = read_us(store, args.comments)
+        stores[name] = store
+        print(f"{name:<8} {per_record:>14.0f} {per_record * 1e6 / 2 ** 20:>8.0f} {rate:>10.0f} {page:>8.1f} {single:>7.2f}")
+
+    dicts, columns = stores["dicts"], stores["columns"]
+    for after_id in range(0, args.comments, 997):
+        expected = dicts.page(after_id, 100)
+        assert columns.page(after_id, 100) == expected
+        assert [list(record) for record in columns.page(after_id, 100)] == [list(record) for record in expected]
+    assert columns.find("post_id", 1) == dicts.find("post_id", 1)
+    print("pages identical")
+
+
+if __name__ == "__main__":
+    main()
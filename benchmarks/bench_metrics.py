@@ -0,0 +1,143 @@
+"""Cost of the /metrics instrumentation per request.
+
+Serves post-service's cheapest endpoint (GET /api/v1/posts/{id}) in-process,
+on the in-memory store and on the SQL routes (SQLite), with and without
+MetricsMiddleware and, for SQL, with and without the engine's statement
+listeners. Short rounds alternate between the variants so drift hits
+them all alike; the best round of each is reported. End to end, the
+difference is within this noise on a busy machine, so the middleware
+(around a bare ASGI app) and the statement listeners (called directly)
+are also timed on their own.
+
+    python benchmarks/bench_metrics.py [--requests 500] [--rounds 20]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+os.environ["METRICS_ENABLED"] = "false"
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench_metrics.db")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "post-service"))
+
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from sqlalchemy import event, insert  # noqa: E402
+
+from app import database, metrics, models, routes  # noqa: E402
+from app import main as post_main  # noqa: E402
+
+LISTENERS = (("before_cursor_execute", metrics._before_cursor_execute),
+             ("after_cursor_execute", metrics._after_cursor_execute))
+
+
+def sql_app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(routes.router, prefix="/api/v1")
+    return app
+
+
+def listen(enabled: bool):
+    sync_engine = database.engine.sync_engine
+    for name, listener in LISTENERS:
+        if enabled and not event.contains(sync_engine, name, listener):
+            event.listen(sync_engine, name, listener)
+        elif not enabled and event.contains(sync_engine, name, listener):
+            event.remove(sync_engine, name, listener)
+
+
+async def seed():
+    row = {"title": "post", "content": "lorem ipsum dolor sit amet " * 8, "author_id": 1}
+    post_main.posts_db.insert({**row, "created_at": "2024-01-01T00:00:00"})
+    async with database.engine.begin() as conn:
+        await conn.run_sync(database.Base.metadata.create_all)
+        await conn.execute(insert(models.Post), [row])
+
+
+async def round_us(app, requests: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        start = time.perf_counter()
+        for _ in range(requests):
+            response = await client.get("/api/v1/posts/1")
+            assert response.status_code == 200
+        return (time.perf_counter() - start) / requests * 1e6
+
+
+async def bare_app(scope, receive, send):
+    scope["route"] = post_main.app.routes[-1]
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def discard(message):
+    pass
+
+
+async def middleware_us(calls: int) -> float:
+    """Per-request cost of MetricsMiddleware itself"""
+    scope = {"type": "http", "method": "GET"}
+    best = {}
+    for app in (bare_app, metrics.MetricsMiddleware(bare_app)) * 3:
+        start = time.perf_counter()
+        for _ in range(calls):
+            await app(dict(scope), None, discard)
+        best[app] = min(best.get(app, float("inf")), (time.perf_counter() - start) / calls * 1e6)
+    bare, instrumented = best.values()
+    return instrumented - bare
+
+
+class Conn:
+    info = {}
+
+
+def listeners_us(calls: int) -> float:
+    """Per-statement cost of the two engine listeners"""
+    conn = Conn()
+    start = time.perf_counter()
+    for _ in range(calls):
+        metrics._before_cursor_execute(conn, None, "", None, None, False)
+        metrics._after_cursor_execute(conn, None, "", None, None, False)
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+async def run(requests: int, rounds: int):
+    await seed()
+    sql = sql_app()
+    variants = {
+        "memory": (post_main.app, False),
+        "memory+metrics": (metrics.MetricsMiddleware(post_main.app), False),
+        "sql": (sql, False),
+        "sql+metrics": (metrics.MetricsMiddleware(sql), True),
+    }
+    best = {name: float("inf") for name in variants}
+    for name, (app, listeners) in variants.items():
+        listen(listeners)
+        await round_us(app, requests // 5)
+    for _ in range(rounds):
+        for name, (app, listeners) in variants.items():
+            listen(listeners)
+            best[name] = min(best[name], await round_us(app, requests))
+
+    print(f"{'variant':<16} {'us/request':>11} {'overhead':>10}")
+    for name, us in best.items():
+        base = best[name.split("+")[0]]
+        overhead = "" if us == base else f"{us - base:+.1f}us ({(us - base) / base:+.1%})"
+        print(f"{name:<16} {us:>11.1f} {overhead:>10}")
+    print(f"middleware alone: {await middleware_us(50000):.1f}us per request")
+    print(f"SQL listeners alone: {listeners_us(50000):.1f}us per statement")
+    print(f"/metrics body: {len(metrics.REGISTRY.exposition())} bytes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500, help="per round")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Write latency and restart time of the persisted in-memory store.
+
+Inserts records into an IndexedStore with no persistence, and with the
+write-ahead log from one writer (an fsync per write) and from 16
+concurrent writers (which share fsyncs through group commit). Then it
+measures how long a restart takes to restore the
+same records from a snapshot, and from the log alone.
+
+    python benchmarks/bench_persistence.py [--records 1000000] [--writes 20000]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "comment-service"))
+
+from app.persistence import Persistence  # noqa: E402
+from app.store import IndexedStore  # noqa: E402
+
+
+def new_store() -> IndexedStore:
+    return IndexedStore(indexed=("post_id", "author_id"))
+
+
+def comment(i: int) -> dict:
+    return {
+        "content": f"comment number {i}",
+        "post_id": i % 1000,
+        "author_id": i % 5000,
+        "created_at": datetime.now().isoformat(),
+    }
+
+
+def write_us(writes: int, persisted: bool = True, writers: int = 1) -> tuple:
+    """(Wall time per insert in microseconds, fsyncs) for ``writers`` threads"""
+    directory = tempfile.mkdtemp()
+    store = new_store()
+    persistence = None
+    if persisted:
+        persistence = Persistence(directory, snapshot_every=10 ** 9)
+        persistence.attach(store)
+
+    def write(first: int):
+        for i in range(first, writes, writers):
+            store.insert(comment(i))
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(writers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    fsyncs = 0
+    if persistence is not None:
+        fsyncs = persistence.log.fsyncs
+        persistence.close(snapshot=False)
+    shutil.rmtree(directory)
+    return elapsed / writes * 1e6, fsyncs
+
+
+def restore_s(records: int, snapshot: bool) -> float:
+    directory = tempfile.mkdtemp()
+    store = new_store()
+    persistence = Persistence(directory, snapshot_every=10 ** 9)
+    persistence.attach(store)
+    batch = 10000
+    for i in range(0, records, batch):
+        store.insert_many(comment(j) for j in range(i, min(i + batch, records)))
+    persistence.close(snapshot=snapshot)
+
+    restored = new_store()
+    start = time.perf_counter()
+    persistence = Persistence(directory, snapshot_every=10 ** 9)
+    persistence.attach(restored)
+    elapsed = time.perf_counter() - start
+    assert len(restored) == records
+    persistence.close(snapshot=False)
+    shutil.rmtree(directory)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--writes", type=int, default=20_000)
+    args = parser.parse_args()
+
+    print(f"{'insert cost':<28} {'us/write':>10} {'fsyncs':>8}")
+    for label, writes, persisted, writers in (
+        ("memory only", args.writes, False, 1),
+        ("wal, 1 writer", min(args.writes, 2000), True, 1),
+        ("wal, 16 writers", args.writes, True, 16),
+    ):
+        per_write, fsyncs = write_us(writes, persisted, writers)
+        print(f"{label:<28} {per_write:>10.1f} {fsyncs:>8}")
+    print()
+    print(f"{'restore ' + str(args.records) + ' records':<28} {'seconds':>10}")
+    print(f"{'from snapshot':<28} {restore_s(args.records, True):>10.2f}")
+    print(f"{'from log only':<28} {restore_s(args.records, False):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Post page latency: client-side fan-out vs GET /api/v1/posts/{id}/page.
+
+post-service runs in-process; comment-service and user-service are small
+stubs. Every HTTP hop (browser to service, and service to service) is
+delayed by --latency ms to stand in for the network.
+
+    python benchmarks/bench_post_page.py [--comments 100] [--authors 40] [--latency 5]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "post-service"))
+
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from pydantic import BaseModel  # noqa: E402
+
+from app import main as post_main  # noqa: E402
+
+BROWSER_CONNECTIONS = 6
+RUNS = 30
+
+
+class SlowTransport(httpx.AsyncBaseTransport):
+    def __init__(self, app, latency: float):
+        self.inner = httpx.ASGITransport(app=app)
+        self.latency = latency
+
+    async def handle_async_request(self, request):
+        await asyncio.sleep(self.latency)
+        return await self.inner.handle_async_request(request)
+
+
+class Ids(BaseModel):
+    ids: list
+
+
+def stubs(comments: int, authors: int):
+    comment_app = FastAPI()
+    user_app = FastAPI()
+
+    def user(user_id: int):
+        return {"id": user_id, "username": f"user{user_id}", "email": f"user{user_id}@example.com",
+                "full_name": "Bench User", "bio": "", "created_at": "2024-01-01T00:00:00"}
+
+    @comment_app.get("/api/v1/comments/post/{post_id}")
+    def comments_by_post(post_id: int):
+        return [
+            {"id": i, "content": "nice post", "post_id": post_id, "author_id": i % authors + 1,
+             "created_at": "2024-01-01T00:00:00"}
+            for i in range(1, comments + 1)
+        ]
+
+    @user_app.get("/api/v1/users/{user_id}")
+    def get_user(user_id: int):
+        return user(user_id)
+
+    @user_app.post("/api/v1/users:batchGet")
+    def batch_get(request: Ids):
+        return {"users": [user(i) for i in request.ids], "missing": []}
+
+    return comment_app, user_app
+
+
+def client(app, base_url: str, latency: float) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=SlowTransport(app, latency), base_url=base_url)
+
+
+async def fanout(clients, parallel: bool):
+    post_client, comment_client, user_client = clients
+    post, comments = await asyncio.gather(
+        post_client.get("/api/v1/posts/1"), comment_client.get("/api/v1/comments/post/1")
+    )
+    author_ids = {post.json()["author_id"]} | {c["author_id"] for c in comments.json()}
+    if parallel:
+        # A browser keeps a handful of connections per origin
+        limit = asyncio.Semaphore(BROWSER_CONNECTIONS)
+
+        async def fetch(user_id):
+            async with limit:
+                return await user_client.get(f"/api/v1/users/{user_id}")
+
+        await asyncio.gather(*map(fetch, author_ids))
+    else:
+        for user_id in author_ids:
+            await user_client.get(f"/api/v1/users/{user_id}")
+
+
+async def aggregate(clients):
+    response = await clients[0].get("/api/v1/posts/1/page")
+    assert response.status_code == 200 and not response.json()["unavailable"]
+
+
+async def measure(fn) -> dict:
+    samples = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {"p50": statistics.median(samples), "p95": samples[int(len(samples) * 0.95) - 1]}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--comments", type=int, default=100)
+    parser.add_argument("--authors", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=5.0, help="ms per HTTP hop")
+    args = parser.parse_args()
+    latency = args.latency / 1000
+
+    comment_app, user_app = stubs(args.comments, args.authors)
+    post_main.posts_db.insert({"title": "Hello", "content": "World", "author_id": 1,
+                               "created_at": "2024-01-01T00:00:00"})
+    post_main.comment_service._client = client(comment_app, "http://comment-service", latency)
+    post_main.user_service._client = client(user_app, "http://user-service", latency)
+    clients = (
+        client(post_main.app, "http://post-service", latency),
+        client(comment_app, "http://comment-service", latency),
+        client(user_app, "http://user-service", latency),
+    )
+
+    print(f"{args.comments} comments, {args.authors} distinct authors, {args.latency}ms per hop")
+    print(f"{'strategy':<28} {'requests':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    rows = (
+        ("fan-out, sequential authors", 2 + args.authors, lambda: fanout(clients, False)),
+        (f"fan-out, {BROWSER_CONNECTIONS} connections", 2 + args.authors, lambda: fanout(clients, True)),
+        ("aggregate /page endpoint", 1, lambda: aggregate(clients)),
+    )
+    for name, requests, fn in rows:
+        result = await measure(fn)
+        print(f"{name:<28} {requests:>8} {result['p50']:>8.1f} {result['p95']:>8.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,121 @@
+"""GET /posts/{id} on the SQL routes with and without the response cache.
+
+Serves post-service's SQL routes (SQLite) in-process and reads posts with
+Zipf-distributed ids, as a front page full of popular posts would, from
+concurrent clients: once with the cache off (READ_CACHE_SIZE=0: nothing
+is kept, though concurrent reads of one post still share a query) and
+once with it on. Reports requests per second, latency and SQL
+statements per request. It then checks the guarantees: a burst of
+concurrent reads of a cold post runs one query (single flight), and a
+read after PUT /posts/{id} sees the update.
+
+    python benchmarks/bench_read_cache.py [--posts 2000] [--requests 5000] [--concurrency 50]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "bench_read_cache.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{DB_FILE}")
+os.environ["METRICS_ENABLED"] = "false"
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "post-service"))
+
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from sqlalchemy import event, insert  # noqa: E402
+
+from app import database, models, routes  # noqa: E402
+from app.cache import ResponseCache  # noqa: E402
+
+statements = 0
+
+
+@event.listens_for(database.engine.sync_engine, "before_cursor_execute")
+def count_statement(*args):
+    global statements
+    statements += 1
+
+
+def zipf_ids(posts: int, count: int, seed: int = 1):
+    weights = [1 / rank for rank in range(1, posts + 1)]
+    return random.Random(seed).choices(range(1, posts + 1), weights, k=count)
+
+
+async def run(client: httpx.AsyncClient, ids, concurrency: int) -> dict:
+    global statements
+    queue = asyncio.Queue()
+    for post_id in ids:
+        queue.put_nowait(post_id)
+    latencies = []
+
+    async def worker():
+        while not queue.empty():
+            post_id = queue.get_nowait()
+            start = time.perf_counter()
+            response = await client.get(f"/api/v1/posts/{post_id}")
+            assert response.status_code == 200, response.text
+            latencies.append(time.perf_counter() - start)
+
+    statements = 0
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "rps": len(ids) / elapsed,
+        "p50": latencies[len(latencies) // 2] * 1000,
+        "p99": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "queries": statements / len(ids),
+    }
+
+
+async def check(client: httpx.AsyncClient, cold_id: int, readers: int):
+    global statements
+    routes.post_cache = ResponseCache()
+    statements = 0
+    responses = await asyncio.gather(*(client.get(f"/api/v1/posts/{cold_id}") for _ in range(readers)))
+    assert all(response.status_code == 200 for response in responses)
+    print(f"{readers} concurrent reads of a cold post: {statements} SQL statement(s)")
+
+    before = (await client.get(f"/api/v1/posts/{cold_id}")).json()
+    await client.put(f"/api/v1/posts/{cold_id}", json={"title": "edited"})
+    after = (await client.get(f"/api/v1/posts/{cold_id}")).json()
+    assert before["title"] != "edited" and after["title"] == "edited", (before, after)
+    print("read after update sees the update")
+    print(routes.post_cache.stats())
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    async with database.engine.begin() as conn:
+        await conn.run_sync(database.Base.metadata.create_all)
+        await conn.execute(insert(models.Post), [
+            {"title": f"post {i}", "content": "lorem ipsum dolor sit amet " * 20, "author_id": i % 100 + 1}
+            for i in range(args.posts)
+        ])
+    app = FastAPI()
+    app.include_router(routes.router, prefix="/api/v1")
+
+    ids = zipf_ids(args.posts, args.requests)
+    print(f"{'cache':<6} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'queries/req':>12}")
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name, cache in (("off", ResponseCache(maxsize=0)), ("on", ResponseCache())):
+            routes.post_cache = cache
+            result = await run(client, ids, args.concurrency)
+            print(f"{name:<6} {result['rps']:>8.0f} {result['p50']:>8.1f} {result['p99']:>8.1f} "
+                  f"{result['queries']:>12.2f}")
+        await check(client, args.posts, args.concurrency)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
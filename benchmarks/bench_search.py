@@ -0,0 +1,103 @@
+"""Query latency of post search as the corpus grows.
+
+Compares the in-process InvertedIndex (in-memory backend) and SQLite FTS5
+(SQL backend) with the client-side workaround it replaces: pull every post
+and filter for the query terms. Posts are synthetic text drawn from a
+Zipf-like vocabulary, so common and rare terms both occur.
+
+    python benchmarks/bench_search.py [--sizes 1000,10000,100000] [--queries 200]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "post-service"))
+
+from app.search import InvertedIndex, tokenize  # noqa: E402
+
+VOCABULARY = [f"term{i}" for i in range(5000)]
+WEIGHTS = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+LINEAR_SCAN_LIMIT = 100_000
+
+
+def corpus(size: int):
+    rng = random.Random(size)
+    for i in range(1, size + 1):
+        words = rng.choices(VOCABULARY, WEIGHTS, k=rng.randint(20, 120))
+        yield i, " ".join(words[:6]), " ".join(words[6:])
+
+
+def queries(count: int):
+    rng = random.Random(0)
+    return [" ".join(rng.choices(VOCABULARY[:500], k=rng.randint(1, 3))) for _ in range(count)]
+
+
+def per_query_us(fn, qs) -> float:
+    start = time.perf_counter()
+    for q in qs:
+        fn(q)
+    return (time.perf_counter() - start) / len(qs) * 1e6
+
+
+def build_fts(posts):
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE posts (id INTEGER PRIMARY KEY, title TEXT, content TEXT)")
+    db.execute("CREATE VIRTUAL TABLE posts_fts USING fts5(title, content, content='posts', content_rowid='id')")
+    db.executemany("INSERT INTO posts VALUES (?, ?, ?)", posts)
+    db.execute("INSERT INTO posts_fts(posts_fts) VALUES ('rebuild')")
+    return db
+
+
+def fts_search(db, q: str):
+    match = " ".join(f'"{term}"' for term in tokenize(q))
+    return db.execute(
+        "SELECT posts.* FROM posts_fts JOIN posts ON posts.id = posts_fts.rowid "
+        "WHERE posts_fts MATCH ? ORDER BY bm25(posts_fts) LIMIT 20", (match,)
+    ).fetchall()
+
+
+def linear_search(posts, q: str):
+    terms = set(tokenize(q))
+    return [post for post in posts if terms <= set(tokenize(f"{post[1]} {post[2]}"))][:20]
+
+
+def run(size: int, qs) -> dict:
+    posts = list(corpus(size))
+    index = InvertedIndex()
+    start = time.perf_counter()
+    for post_id, title, content in posts:
+        index.add(post_id, f"{title} {content}")
+    build_s = time.perf_counter() - start
+    db = build_fts(posts)
+
+    result = {
+        "size": size,
+        "build_s": build_s,
+        "index_us": per_query_us(lambda q: index.search(q, 0, 20), qs),
+        "fts5_us": per_query_us(lambda q: fts_search(db, q), qs),
+        "linear_us": None,
+    }
+    if size <= LINEAR_SCAN_LIMIT:
+        result["linear_us"] = per_query_us(lambda q: linear_search(posts, q), qs[:5])
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    qs = queries(args.queries)
+    print(f"{'posts':>10} {'index build':>12} {'index':>10} {'fts5':>10} {'linear scan':>12}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        r = run(size, qs)
+        linear = f"{r['linear_us']:>10.0f}us" if r["linear_us"] else f"{'-':>12}"
+        print(f"{r['size']:>10} {r['build_s']:>11.2f}s {r['index_us']:>8.0f}us {r['fts5_us']:>8.0f}us {linear}")
+
+
+if __name__ == "__main__":
+    main()
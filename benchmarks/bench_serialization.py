@@ -0,0 +1,95 @@
+"""Requests/s and p99 for a 1000-item list, per serialization path.
+
+Runs post-service's list endpoint in-process on the in-memory store and
+on the SQL routes (SQLite), and serves the same page three ways:
+validated by FastAPI against response_model (the old path), encoded by
+ListEncoder through pydantic-core, and by ListEncoder with orjson (when
+installed). Every path must produce the same JSON.
+
+    python benchmarks/bench_serialization.py [--items 1000] [--requests 300]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench_serialization.db")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "post-service"))
+
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+from app import database, models, routes, serialization  # noqa: E402
+from app import main as post_main  # noqa: E402
+
+ORJSON = serialization.orjson
+
+
+def sql_app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(routes.router, prefix="/api/v1")
+    return app
+
+
+async def seed(items: int):
+    rows = [
+        {"title": f"post {i}", "content": "lorem ipsum dolor sit amet " * 8, "author_id": i % 50 + 1}
+        for i in range(items)
+    ]
+    post_main.posts_db.insert_many({**row, "created_at": "2024-01-01T00:00:00"} for row in rows)
+    async with database.engine.begin() as conn:
+        await conn.run_sync(database.Base.metadata.create_all)
+        await conn.execute(insert(models.Post), rows)
+
+
+def use(path: str):
+    serialization.FAST_SERIALIZATION = path != "validated"
+    serialization.orjson = ORJSON if path == "orjson" else None
+
+
+async def measure(client: httpx.AsyncClient, url: str, requests: int):
+    body = (await client.get(url)).content
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(requests):
+        t = time.perf_counter()
+        response = await client.get(url)
+        latencies.append(time.perf_counter() - t)
+        assert response.status_code == 200
+    elapsed = time.perf_counter() - start
+    return requests / elapsed, statistics.quantiles(latencies, n=100)[98] * 1000, body
+
+
+async def run(items: int, requests: int):
+    await seed(items)
+    paths = ["validated", "pydantic-core"] + (["orjson"] if ORJSON else [])
+    url = f"/api/v1/posts?limit={items}"
+    print(f"{'backend':<10} {'path':<14} {'req/s':>8} {'p99':>9}")
+    for backend, app in (("memory", post_main.app), ("sql", sql_app())):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            baseline = None
+            for path in paths:
+                use(path)
+                rps, p99, body = await measure(client, url, requests)
+                if baseline is None:
+                    baseline = json.loads(body)
+                assert json.loads(body) == baseline, f"{backend}/{path} output differs"
+                print(f"{backend:<10} {path:<14} {rps:>8.0f} {p99:>7.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+    asyncio.run(run(args.items, args.requests))
+
+
+if __name__ == "__main__":
+    main()
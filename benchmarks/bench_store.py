@@ -0,0 +1,87 @@
+"""Microbenchmark for the in-memory IndexedStore.
+
+Measures get-by-id, secondary index lookup and delete latency as the store
+grows from 1k to 1M records, next to the linear list scan it replaced.
+
+    python benchmarks/bench_store.py [--sizes 1000,10000,100000,1000000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "comment-service"))
+
+from app.store import IndexedStore  # noqa: E402
+
+LOOKUPS = 10_000
+LINEAR_SCAN_LIMIT = 100_000
+
+
+def build(size: int):
+    store = IndexedStore(indexed=("post_id",))
+    rows = []
+    now = datetime.now().isoformat()
+    for i in range(size):
+        record = store.insert({
+            "content": "comment",
+            "post_id": i % 1000,
+            "author_id": i % 5000,
+            "created_at": now,
+        })
+        rows.append(record)
+    return store, rows
+
+
+def per_op_ns(fn, keys) -> float:
+    start = time.perf_counter_ns()
+    for key in keys:
+        fn(key)
+    return (time.perf_counter_ns() - start) / len(keys)
+
+
+def linear_get(rows, record_id):
+    for row in rows:
+        if row["id"] == record_id:
+            return row
+    return None
+
+
+def run(size: int) -> dict:
+    store, rows = build(size)
+    ids = [random.randint(1, size) for _ in range(LOOKUPS)]
+    posts = [random.randrange(1000) for _ in range(LOOKUPS)]
+
+    result = {
+        "size": size,
+        "get_ns": per_op_ns(store.get, ids),
+        "count_by_post_ns": per_op_ns(lambda p: store.count("post_id", p), posts),
+    }
+    if size <= LINEAR_SCAN_LIMIT:
+        sample = ids[:100]
+        result["linear_get_ns"] = per_op_ns(lambda i: linear_get(rows, i), sample)
+    else:
+        result["linear_get_ns"] = None
+
+    victims = random.sample(range(1, size + 1), min(LOOKUPS, size))
+    result["delete_ns"] = per_op_ns(store.delete, victims)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000")
+    args = parser.parse_args()
+
+    print(f"{'records':>10} {'get':>10} {'count':>10} {'delete':>10} {'linear get':>12}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        r = run(size)
+        linear = f"{r['linear_get_ns']:>10.0f}ns" if r["linear_get_ns"] else f"{'-':>12}"
+        print(f"{r['size']:>10} {r['get_ns']:>8.0f}ns {r['count_by_post_ns']:>8.0f}ns "
+              f"{r['delete_ns']:>8.0f}ns {linear}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Per-request cost of TracingMiddleware, by sample rate.
+
+Wraps a bare ASGI app that opens one child span (like an upstream call or a
+SQL statement would) and times the middleware around it against the app
+alone, for requests that start a trace, follow a sampled traceparent or
+follow an unsampled one. Sampled requests pay for the spans and the ring
+buffer; the rest pay for a sampling decision and a contextvar.
+
+    python benchmarks/bench_tracing.py [--requests 50000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "post-service"))
+
+from app.tracing import Tracer, TracingMiddleware, end_span, start_span  # noqa: E402
+
+SAMPLED = b"00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+UNSAMPLED = b"00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-00"
+
+
+async def bare_app(scope, receive, send):
+    end_span(start_span("child", "client"))
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def discard(message):
+    pass
+
+
+async def per_request_us(app, headers, requests: int) -> float:
+    scope = {"type": "http", "method": "GET", "path": "/api/v1/posts/1", "headers": headers}
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(requests):
+            await app(dict(scope), None, discard)
+        best = min(best, (time.perf_counter() - start) / requests * 1e6)
+    return best
+
+
+async def run(requests: int):
+    bare = await per_request_us(bare_app, [], requests)
+    print(f"{'requests':<28} {'us/request':>11} {'overhead':>9}")
+    print(f"{'no middleware':<28} {bare:>11.2f}")
+    cases = [(f"new trace, rate {rate}", Tracer("bench", sample_rate=rate, max_per_second=1e9), [])
+             for rate in (0.0, 0.01, 1.0)]
+    cases.append(("new trace, rate 1.0, 10/s cap", Tracer("bench", sample_rate=1.0, max_per_second=10), []))
+    cases.append(("sampled traceparent", Tracer("bench"), [(b"traceparent", SAMPLED)]))
+    cases.append(("unsampled traceparent", Tracer("bench"), [(b"traceparent", UNSAMPLED)]))
+    for name, tracer, headers in cases:
+        us = await per_request_us(TracingMiddleware(bare_app, tracer), headers, requests)
+        print(f"{name:<28} {us:>11.2f} {us - bare:>+8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=50000)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Load test for the shared in-memory store under several uvicorn workers.
+
+Starts user-service with ``--workers N`` and STORE_SOCKET set, creates
+users from many concurrent clients (so requests land on every worker),
+then checks that every id is unique, that every worker sees every user and
+that the total matches. Reports create throughput for one worker and for N.
+
+    python benchmarks/load_multiworker.py [--workers 4] [--users 4000] [--concurrency 64]
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "user-service")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start(workers: int, store_socket: str, port: int) -> subprocess.Popen:
+    env = {**os.environ, "STORE_SOCKET": store_socket}
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=SERVICE_DIR, env=env,
+    )
+
+
+def stop(server: subprocess.Popen, store_socket: str):
+    server.send_signal(signal.SIGINT)
+    server.wait(timeout=30)
+    with open(f"{store_socket}.pid") as f:
+        os.kill(int(f.read()), signal.SIGTERM)
+
+
+async def wait_ready(client: httpx.AsyncClient):
+    for _ in range(200):
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.05)
+    raise RuntimeError("service did not start")
+
+
+async def run(workers: int, users: int, concurrency: int) -> dict:
+    store_socket = os.path.join(tempfile.mkdtemp(), "users.sock")
+    port = free_port()
+    server = start(workers, store_socket, port)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=30) as client:
+            await wait_ready(client)
+            queue = asyncio.Queue()
+            for i in range(users):
+                queue.put_nowait(i)
+            ids = []
+
+            async def worker():
+                while not queue.empty():
+                    i = queue.get_nowait()
+                    row = {"username": f"user{i}", "email": f"user{i}@example.com", "full_name": "Load Test"}
+                    response = await client.post("/api/v1/users", json=row)
+                    assert response.status_code == 200, response.text
+                    ids.append(response.json()["id"])
+
+            start_time = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start_time
+
+        # A fresh connection per request spreads the reads over the workers
+        fresh = httpx.Limits(max_keepalive_connections=0)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=fresh, timeout=30) as client:
+            totals = set()
+            for _ in range(workers * 4):
+                seen, cursor = 0, None
+                while True:
+                    params = {"limit": 1000, **({"cursor": cursor} if cursor else {})}
+                    response = await client.get("/api/v1/users", params=params)
+                    seen += len(response.json())
+                    cursor = response.headers.get("x-next-cursor")
+                    if not cursor:
+                        break
+                totals.add(seen)
+            duplicate = (await client.post("/api/v1/users", json={
+                "username": "user0", "email": "other@example.com", "full_name": "Dup",
+            })).status_code
+    finally:
+        stop(server, store_socket)
+
+    return {
+        "workers": workers,
+        "rps": users / elapsed,
+        "unique_ids": len(set(ids)) == len(ids) == users,
+        "consistent": totals == {users},
+        "duplicate_rejected": duplicate == 400,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--users", type=int, default=4000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    print(f"{'workers':>8} {'creates/s':>10} {'unique ids':>11} {'consistent':>11} {'dup rejected':>13}")
+    for workers in sorted({1, args.workers}):
+        r = await run(workers, args.users, args.concurrency)
+        print(f"{r['workers']:>8} {r['rps']:>10.0f} {str(r['unique_ids']):>11} "
+              f"{str(r['consistent']):>11} {str(r['duplicate_rejected']):>13}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,483 @@
+"""Mixed-workload load test of all three services, with a JSON report.
+
+Starts user-, post- and comment-service under uvicorn on free ports. With
+``--upstreams services`` each one calls the others, as in production;
+with ``--upstreams stubs`` every upstream call goes to stub_upstreams.py
+instead, so each service is measured on its own work. Seeds --users,
+--posts and --comments through the bulk endpoints (comments skewed to hot
+posts), then runs --concurrency clients for --duration seconds, each
+picking scenarios by the --mix weights:
+
+    post_page       GET  /posts/{id}/page on a hot post
+    get_post        GET  /posts/{id}
+    get_user        GET  /users/{id}
+    list_comments   GET  /comments/post/{id} on a hot post
+    comment_burst   --burst concurrent POST /comments on one hot post
+    list_posts      GET  /posts?limit=1000, walking the collection
+    list_users      GET  /users?limit=1000, walking the collection
+
+Posts are picked from a Zipf distribution (--zipf), so a few of them take
+most of the traffic. For every endpoint the report holds requests,
+errors, throughput and p50/p95/p99 latency, plus allocations per request:
+after the run each service is imported again in a child process, seeded
+the same way, and every one of its endpoints is replayed under
+tracemalloc (peak bytes above the baseline while the request runs, which
+includes the in-process client's share, so compare it between runs rather
+than reading it as absolute).
+
+With --baseline, endpoints whose throughput dropped or whose p95 or
+allocations grew by more than --tolerance against an earlier report are
+listed and the exit status is 1.
+
+    python benchmarks/load_suite.py [--upstreams services|stubs] [--duration 30]
+        [--concurrency 32] [--users 1000] [--posts 5000] [--comments 50000]
+        [--mix post_page=40,comment_burst=10,...] [--out report.json]
+        [--baseline old.json --tolerance 0.15]
+"""
+import argparse
+import asyncio
+import bisect
+import importlib
+import itertools
+import json
+import os
+import platform
+import random
+import signal
+import socket
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+SERVICES = ("user-service", "post-service", "comment-service")
+SEED_CHUNK = 1000
+
+DEFAULT_MIX = {
+    "post_page": 35,
+    "get_post": 15,
+    "get_user": 10,
+    "list_comments": 15,
+    "comment_burst": 10,
+    "list_posts": 5,
+    "list_users": 5,
+}
+
+# The service each scenario talks to; the probe replays a service's own scenarios
+SCENARIO_SERVICE = {
+    "post_page": "post-service",
+    "get_post": "post-service",
+    "list_posts": "post-service",
+    "get_user": "user-service",
+    "list_users": "user-service",
+    "list_comments": "comment-service",
+    "comment_burst": "comment-service",
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def parse_mix(text: Optional[str]) -> Dict[str, int]:
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIO_SERVICE:
+            raise SystemExit(f"unknown scenario {name!r}, expected one of {', '.join(SCENARIO_SERVICE)}")
+        mix[name] = int(weight)
+    return mix
+
+
+class Zipf:
+    """Draws ranks 0..n-1 with probability proportional to 1 / (rank + 1) ** s"""
+
+    def __init__(self, n: int, s: float, rng: random.Random):
+        self.rng = rng
+        self.cumulative = list(itertools.accumulate(1 / (rank + 1) ** s for rank in range(n)))
+
+    def __call__(self) -> int:
+        return bisect.bisect_left(self.cumulative, self.rng.random() * self.cumulative[-1])
+
+
+class Dataset:
+    """Seeded ids, and the rows that seed them (same --seed, same rows)"""
+
+    def __init__(self, args):
+        self.args = args
+        self.user_ids: List[int] = []
+        self.post_ids: List[int] = []
+
+    def users(self) -> List[dict]:
+        return [
+            {"username": f"load{i}", "email": f"load{i}@example.com", "full_name": f"Load User {i}",
+             "bio": "Seeded by load_suite.py"}
+            for i in range(self.args.users)
+        ]
+
+    def posts(self) -> List[dict]:
+        rng = random.Random(self.args.seed + 1)
+        return [
+            {"title": f"Post {i} about load", "content": "Lorem ipsum dolor sit amet. " * rng.randint(4, 40),
+             "author_id": rng.choice(self.user_ids)}
+            for i in range(self.args.posts)
+        ]
+
+    def comments(self) -> List[dict]:
+        rng = random.Random(self.args.seed + 2)
+        hot = Zipf(len(self.post_ids), self.args.zipf, rng)
+        return [
+            {"content": f"Comment {i}", "post_id": self.post_ids[hot()], "author_id": rng.choice(self.user_ids)}
+            for i in range(self.args.comments)
+        ]
+
+
+async def seed(client_for, data: Dataset, services=SERVICES):
+    """Create the seed rows through each service's bulk endpoint, in chunks.
+
+    ``client_for(service)`` returns the client to call it with. Services
+    left out of ``services`` are assumed to hold ids 1..n already, which
+    is what a fresh in-memory store assigns.
+    """
+    async def bulk(service: str, path: str, rows: List[dict]) -> List[int]:
+        ids = []
+        for start in range(0, len(rows), SEED_CHUNK):
+            response = await client_for(service).post(path, json=rows[start:start + SEED_CHUNK], timeout=300)
+            response.raise_for_status()
+            body = response.json()
+            if body["failed"]:
+                errors = [r["error"] for r in body["results"] if r["status"] != 201]
+                raise RuntimeError(f"seeding {path} failed: {errors[:3]}")
+            ids.extend(r["item"]["id"] for r in body["results"])
+        return ids
+
+    if "user-service" in services:
+        data.user_ids = await bulk("user-service", "/api/v1/users/bulk", data.users())
+    else:
+        data.user_ids = list(range(1, data.args.users + 1))
+    if "post-service" in services:
+        data.post_ids = await bulk("post-service", "/api/v1/posts/bulk", data.posts())
+    else:
+        data.post_ids = list(range(1, data.args.posts + 1))
+    if "comment-service" in services:
+        await bulk("comment-service", "/api/v1/comments/bulk", data.comments())
+
+
+class Workload:
+    """The scenarios, as coroutines recording (endpoint, seconds, ok) samples"""
+
+    def __init__(self, client_for, data: Dataset, args, rng: random.Random):
+        self.client_for = client_for
+        self.data = data
+        self.args = args
+        self.rng = rng
+        self.hot_post = Zipf(len(data.post_ids), args.zipf, rng)
+        self.cursors: Dict[str, Optional[str]] = {}
+        self.samples: List[tuple] = []
+
+    async def call(self, endpoint: str, method: str, path: str, **kwargs) -> Optional[httpx.Response]:
+        client = self.client_for(SCENARIO_SERVICE[endpoint])
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, path, **kwargs)
+        except httpx.HTTPError:
+            self.samples.append((endpoint, time.perf_counter() - start, False))
+            return None
+        self.samples.append((endpoint, time.perf_counter() - start, response.status_code < 400))
+        return response
+
+    def post_id(self) -> int:
+        return self.data.post_ids[self.hot_post()]
+
+    async def post_page(self):
+        await self.call("post_page", "GET", f"/api/v1/posts/{self.post_id()}/page", params={"limit": 20})
+
+    async def get_post(self):
+        await self.call("get_post", "GET", f"/api/v1/posts/{self.rng.choice(self.data.post_ids)}")
+
+    async def get_user(self):
+        await self.call("get_user", "GET", f"/api/v1/users/{self.rng.choice(self.data.user_ids)}")
+
+    async def list_comments(self):
+        await self.call("list_comments", "GET", f"/api/v1/comments/post/{self.post_id()}", params={"limit": 100})
+
+    async def comment_burst(self):
+        post_id = self.post_id()
+        await asyncio.gather(*(
+            self.call("comment_burst", "POST", "/api/v1/comments", json={
+                "content": "Burst comment", "post_id": post_id, "author_id": self.rng.choice(self.data.user_ids),
+            })
+            for _ in range(self.args.burst)
+        ))
+
+    async def _walk(self, endpoint: str, path: str):
+        cursor = self.cursors.get(endpoint)
+        params = {"limit": 1000, **({"cursor": cursor} if cursor else {})}
+        response = await self.call(endpoint, "GET", path, params=params)
+        # Start over from the first page once the collection is exhausted
+        self.cursors[endpoint] = response.headers.get("x-next-cursor") if response is not None else None
+
+    async def list_posts(self):
+        await self._walk("list_posts", "/api/v1/posts")
+
+    async def list_users(self):
+        await self._walk("list_users", "/api/v1/users")
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def summarize(samples: List[tuple], elapsed: float) -> Dict[str, dict]:
+    by_endpoint: Dict[str, List[tuple]] = {}
+    for sample in samples:
+        by_endpoint.setdefault(sample[0], []).append(sample)
+    report = {}
+    for endpoint, rows in sorted(by_endpoint.items()):
+        latencies = sorted(seconds * 1000 for _, seconds, _ in rows)
+        report[endpoint] = {
+            "requests": len(rows),
+            "errors": sum(1 for _, _, ok in rows if not ok),
+            "rps": round(len(rows) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 0.50), 3),
+            "p95_ms": round(percentile(latencies, 0.95), 3),
+            "p99_ms": round(percentile(latencies, 0.99), 3),
+        }
+    return report
+
+
+async def drive(client_for, data: Dataset, args, mix: Dict[str, int]) -> Dict[str, dict]:
+    names, weights = list(mix), list(mix.values())
+    deadline = time.perf_counter() + args.duration
+    workloads = [Workload(client_for, data, args, random.Random(args.seed + 100 + i)) for i in range(args.concurrency)]
+
+    async def client_loop(workload: Workload):
+        while time.perf_counter() < deadline:
+            await getattr(workload, workload.rng.choices(names, weights)[0])()
+
+    start = time.perf_counter()
+    await asyncio.gather(*map(client_loop, workloads))
+    elapsed = time.perf_counter() - start
+    return summarize([sample for workload in workloads for sample in workload.samples], elapsed)
+
+
+def start_services(args, ports: Dict[str, int], stub_port: Optional[int]) -> List[subprocess.Popen]:
+    def url(service: str) -> str:
+        port = stub_port if args.upstreams == "stubs" else ports[service]
+        return f"http://127.0.0.1:{port}"
+
+    env = {
+        **os.environ,
+        "USER_SERVICE_URL": url("user-service"),
+        "POST_SERVICE_URL": url("post-service"),
+        "COMMENT_SERVICE_URL": url("comment-service"),
+        "BULK_MAX_ITEMS": str(max(SEED_CHUNK, int(os.getenv("BULK_MAX_ITEMS", "10000")))),
+    }
+    servers = []
+    if stub_port is not None:
+        servers.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "stub_upstreams:app", "--port", str(stub_port), "--log-level", "warning"],
+            cwd=BENCH_DIR, env=env,
+        ))
+    for service, port in ports.items():
+        servers.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=os.path.join(ROOT, service), env=env,
+        ))
+    return servers
+
+
+def stop_services(servers: List[subprocess.Popen]):
+    for server in servers:
+        server.send_signal(signal.SIGINT)
+    for server in servers:
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+async def wait_ready(client: httpx.AsyncClient):
+    for _ in range(400):
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.05)
+    raise RuntimeError(f"{client.base_url} did not start")
+
+
+async def run_load(args, mix: Dict[str, int]) -> Dict[str, dict]:
+    ports = {service: free_port() for service in SERVICES}
+    stub_port = free_port() if args.upstreams == "stubs" else None
+    servers = start_services(args, ports, stub_port)
+    limits = httpx.Limits(max_connections=args.concurrency * args.burst, max_keepalive_connections=args.concurrency)
+    clients = {
+        service: httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=30)
+        for service, port in ports.items()
+    }
+    try:
+        for client in clients.values():
+            await wait_ready(client)
+        data = Dataset(args)
+        start = time.perf_counter()
+        await seed(clients.__getitem__, data)
+        print(f"seeded {args.users} users, {args.posts} posts, {args.comments} comments "
+              f"in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+        if args.warmup:
+            warmup = argparse.Namespace(**{**vars(args), "duration": args.warmup})
+            await drive(clients.__getitem__, data, warmup, mix)
+        return await drive(clients.__getitem__, data, args, mix)
+    finally:
+        for client in clients.values():
+            await client.aclose()
+        stop_services(servers)
+
+
+async def probe(args, service: str) -> Dict[str, dict]:
+    """Allocations per request for ``service``'s scenarios, in this process"""
+    sys.path.insert(0, os.path.join(ROOT, service))
+    main = importlib.import_module("app.main")
+    import stub_upstreams
+
+    # Upstream calls go to the stubs, in-process (user-service makes none)
+    for value in vars(main).values():
+        if type(value).__name__ == "ServiceClient":
+            value._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=stub_upstreams.app),
+                                              base_url=value.base_url)
+    await main.bus.start()
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://probe", timeout=300)
+    data = Dataset(args)
+    await seed(lambda _: client, data, services=(service,))
+
+    args = argparse.Namespace(**{**vars(args), "burst": 1})
+    workload = Workload(lambda _: client, data, args, random.Random(args.seed))
+    report = {}
+    tracemalloc.start()
+    for endpoint in (name for name, owner in SCENARIO_SERVICE.items() if owner == service):
+        scenario = getattr(workload, endpoint)
+        for _ in range(args.probe_warmup):
+            await scenario()
+        peaks = []
+        for _ in range(args.probe_requests):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            await scenario()
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        peaks.sort()
+        report[endpoint] = {"alloc_peak_kib": round(percentile(peaks, 0.50) / 1024, 1)}
+    tracemalloc.stop()
+    await client.aclose()
+    await main.bus.close()
+    return report
+
+
+def run_probes(args, mix: Dict[str, int]) -> Dict[str, dict]:
+    report = {}
+    for service in SERVICES:
+        if not any(SCENARIO_SERVICE[name] == service for name in mix):
+            continue
+        argv = [sys.executable, os.path.abspath(__file__), "--probe", service,
+                "--users", str(args.users), "--posts", str(args.posts), "--comments", str(args.comments),
+                "--seed", str(args.seed), "--zipf", str(args.zipf),
+                "--probe-requests", str(args.probe_requests), "--probe-warmup", str(args.probe_warmup)]
+        env = {**os.environ, "FAST_SERIALIZATION": os.getenv("FAST_SERIALIZATION", "true")}
+        env.pop("STORE_SOCKET", None)
+        env.pop("PERSIST_DIR", None)
+        result = subprocess.run(argv, cwd=BENCH_DIR, env=env, stdout=subprocess.PIPE, check=True)
+        report.update(json.loads(result.stdout))
+    return report
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    regressions = []
+    for endpoint, now in report["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(endpoint)
+        if before is None:
+            continue
+        if now["rps"] < before["rps"] * (1 - tolerance):
+            regressions.append(f"{endpoint}: rps {before['rps']} -> {now['rps']}")
+        for key in ("p95_ms", "alloc_peak_kib"):
+            if key in now and key in before and now[key] > before[key] * (1 + tolerance):
+                regressions.append(f"{endpoint}: {key} {before[key]} -> {now[key]}")
+    return regressions
+
+
+def print_table(report: dict):
+    print(f"{'endpoint':<15} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>8} "
+          f"{'p95 ms':>8} {'p99 ms':>8} {'alloc KiB':>10}", file=sys.stderr)
+    for endpoint, row in report["endpoints"].items():
+        alloc = row.get("alloc_peak_kib")
+        print(f"{endpoint:<15} {row['requests']:>9} {row['errors']:>7} {row['rps']:>8.1f} {row['p50_ms']:>8.2f} "
+              f"{row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f} {'-' if alloc is None else alloc:>10}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--upstreams", choices=("services", "stubs"), default="services")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--posts", type=int, default=5000)
+    parser.add_argument("--comments", type=int, default=50000)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of measured load")
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds of unmeasured load first")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--burst", type=int, default=10, help="concurrent comments per comment_burst")
+    parser.add_argument("--mix", help="scenario=weight,... (default: %s)" % ",".join(f"{k}={v}" for k, v in DEFAULT_MIX.items()))
+    parser.add_argument("--zipf", type=float, default=1.1, help="skew of post popularity")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-alloc", action="store_true", help="skip the allocation probes")
+    parser.add_argument("--probe-requests", type=int, default=50)
+    parser.add_argument("--probe-warmup", type=int, default=5)
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="earlier JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    parser.add_argument("--probe", choices=SERVICES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    if args.probe:
+        print(json.dumps(asyncio.run(probe(args, args.probe))))
+        return
+
+    endpoints = asyncio.run(run_load(args, mix))
+    if not args.no_alloc:
+        for endpoint, allocations in run_probes(args, mix).items():
+            if endpoint in endpoints:
+                endpoints[endpoint].update(allocations)
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "config": {key: getattr(args, key) for key in (
+            "upstreams", "users", "posts", "comments", "duration", "concurrency", "burst", "zipf", "seed")},
+        "mix": mix,
+        "endpoints": endpoints,
+    }
+    print_table(report)
+    encoded = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(encoded + "\n")
+    else:
+        print(encoded)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Stand-in for all three services' cross-service endpoints.
+
+Every id exists, every user is a fixed record and every post has the same
+page of comments, so a service under test does its own work while its
+upstream calls cost next to nothing. Used by load_suite.py, either served
+by uvicorn (``--upstreams stubs``) or in-process for allocation probes.
+
+    uvicorn stub_upstreams:app --port 9000
+"""
+from typing import List, Optional
+
+from fastapi import FastAPI, Query
+from pydantic import BaseModel
+
+COMMENTS_PER_POST = 20
+
+app = FastAPI(title="Upstream stubs")
+
+
+class Ids(BaseModel):
+    ids: List[int]
+
+
+def user(user_id: int) -> dict:
+    return {"id": user_id, "username": f"user{user_id}", "email": f"user{user_id}@example.com",
+            "full_name": "Stub User", "bio": "", "created_at": "2024-01-01T00:00:00"}
+
+
+@app.get("/health")
+def health():
+    return {"status": "healthy"}
+
+
+@app.post("/api/v1/users:exists")
+@app.post("/api/v1/posts:exists")
+def exists(request: Ids):
+    return {"existing": request.ids, "missing": []}
+
+
+@app.post("/api/v1/users:batchGet")
+def batch_get(request: Ids):
+    return {"users": [user(i) for i in request.ids], "missing": []}
+
+
+@app.get("/api/v1/comments/post/{post_id}")
+def comments_by_post(post_id: int, cursor: Optional[str] = None, limit: int = Query(100)):
+    return [
+        {"id": i, "content": "stub comment", "post_id": post_id, "author_id": i,
+         "created_at": "2024-01-01T00:00:00"}
+        for i in range(1, min(limit, COMMENTS_PER_POST) + 1)
+    ]
+
+
+@app.delete("/api/v1/cache/users/{user_id}")
+@app.delete("/api/v1/cache/posts/{post_id}")
+def invalidate():
+    return {"invalidated": False}
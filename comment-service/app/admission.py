@@ -0,0 +1,330 @@
+import asyncio
+import json
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional, Tuple
+
+from starlette.routing import Match
+
+from .metrics import REGISTRY
+
+READ = "read"
+WRITE = "write"
+
+ADMISSION_REJECTED = REGISTRY.counter(
+    "admission_rejected", "Requests turned away before reaching a handler", ("reason", "priority")
+)
+ADMISSION_WAIT_SECONDS = REGISTRY.histogram(
+    "admission_wait_seconds", "Time admitted requests waited for a slot", ("priority",)
+)
+ADMISSION_QUEUED = REGISTRY.gauge("admission_queued", "Requests waiting for a slot").labels()
+ADMISSION_SHEDDING = REGISTRY.gauge("admission_shedding", "1 while writes are being shed").labels()
+
+
+class TokenBucket:
+    """``rate`` requests a second on average, up to ``burst`` at once"""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, now: float) -> float:
+        """0 when a token was taken, else the seconds until there is one"""
+        if now > self.updated:
+            # A bucket made after the caller read the clock has not aged yet
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class Rejection(Exception):
+    def __init__(self, status: int, reason: str, retry_after: float = 1.0):
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Decides which requests get a handler now, which wait and which are refused.
+
+    - Rate limits: token buckets, one for the whole service and one per
+      client (its IP, or the ``client_header`` value). Over either, 429.
+    - Concurrency: at most ``concurrency`` requests in handlers at once
+      (keep it below the threadpool's 40 threads, so ``def`` handlers
+      never queue there where nobody can see or shed them), and at most
+      ``route_limits["METHOD /template"]`` in one route, past which that
+      route is refused at once with 503 and the others carry on.
+      The slots also cap group commit: a comment-service group holds at
+      most ``concurrency`` single-comment POSTs, however large
+      COMMENT_GROUP_COMMIT_MAX is, so raise both together.
+    - Streams: a response whose body is streamed (the NDJSON exports)
+      gives its slot back when the body starts and holds one of
+      ``streams`` stream slots until it ends, so slow downloads cannot
+      starve short requests. With every stream slot taken, it keeps its
+      ordinary slot instead. A route limit holds for the whole stream.
+    - Priority: requests over the limit wait, and a freed slot goes to
+      the oldest waiting read before any write. Reads wait up to
+      ``read_max_wait`` seconds, writes ``write_max_wait``, then 503.
+    - Shedding: if even the shortest wait seen over an ``interval`` was
+      above ``target_delay`` (the CoDel rule: a standing queue, not a
+      burst), writes that would have to wait are refused at once until a
+      request gets through quickly again.
+
+    Exempt paths (``/health``, ``/metrics``) skip all of it. Every limit
+    left at 0 is off.
+    """
+
+    def __init__(self, concurrency: int = 32, read_max_wait: float = 1.0, write_max_wait: float = 0.5,
+                 target_delay: float = 0.05, interval: float = 0.5, rate: float = 0.0, burst: float = 0.0,
+                 client_rate: float = 0.0, client_burst: float = 0.0, client_header: str = "",
+                 route_limits: Optional[Dict[str, int]] = None, exempt: Tuple[str, ...] = ("/health", "/metrics"),
+                 max_clients: int = 10000, streams: int = 4):
+        self.concurrency = concurrency
+        self.streams = streams
+        self.max_wait = {READ: read_max_wait, WRITE: write_max_wait}
+        self.target_delay = target_delay
+        self.interval = interval
+        self.bucket = TokenBucket(rate, burst or rate) if rate > 0 else None
+        self.client_rate = client_rate
+        self.client_burst = client_burst or client_rate
+        self.client_header = client_header.lower().encode("latin-1")
+        self.route_limits = route_limits or {}
+        self.exempt = frozenset(exempt)
+        self.max_clients = max_clients
+        self.shedding = False
+        self._clients: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._active = 0
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {READ: deque(), WRITE: deque()}
+        self._route_active: Dict[str, int] = {}
+        self._streaming = 0
+        self._window_start = time.monotonic()
+        self._window_min = math.inf
+
+    @classmethod
+    def from_env(cls) -> Optional["AdmissionController"]:
+        """None when ADMISSION_ENABLED is off"""
+        if os.getenv("ADMISSION_ENABLED", "true").lower() not in ("1", "true", "yes"):
+            return None
+        route_limits = {}
+        for item in filter(None, os.getenv("ADMISSION_ROUTE_LIMITS", "").split(",")):
+            route, _, limit = item.rpartition("=")
+            route_limits[route.strip()] = int(limit)
+        return cls(
+            concurrency=int(os.getenv("ADMISSION_CONCURRENCY", "32")),
+            streams=int(os.getenv("ADMISSION_STREAMS", "4")),
+            read_max_wait=float(os.getenv("ADMISSION_READ_MAX_WAIT_MS", "1000")) / 1000,
+            write_max_wait=float(os.getenv("ADMISSION_WRITE_MAX_WAIT_MS", "500")) / 1000,
+            target_delay=float(os.getenv("ADMISSION_TARGET_DELAY_MS", "50")) / 1000,
+            interval=float(os.getenv("ADMISSION_INTERVAL_MS", "500")) / 1000,
+            rate=float(os.getenv("ADMISSION_RATE", "0")),
+            burst=float(os.getenv("ADMISSION_BURST", "0")),
+            client_rate=float(os.getenv("ADMISSION_CLIENT_RATE", "0")),
+            client_burst=float(os.getenv("ADMISSION_CLIENT_BURST", "0")),
+            client_header=os.getenv("ADMISSION_CLIENT_HEADER", ""),
+            route_limits=route_limits,
+            exempt=tuple(filter(None, os.getenv("ADMISSION_EXEMPT", "/health,/metrics").split(","))),
+        )
+
+    @staticmethod
+    def priority(scope) -> str:
+        """Reads are GET/HEAD/OPTIONS and the POST lookups (/users:exists, /posts:batchGet)"""
+        if scope["method"] in ("GET", "HEAD", "OPTIONS") or ":" in scope["path"]:
+            return READ
+        return WRITE
+
+    def check_rate(self, scope):
+        """Raise a 429 Rejection when the service or this client is over its rate"""
+        now = time.monotonic()
+        if self.bucket is not None:
+            wait = self.bucket.take(now)
+            if wait:
+                raise Rejection(429, "rate", wait)
+        if self.client_rate > 0:
+            client = self._client_key(scope)
+            bucket = self._clients.get(client)
+            if bucket is None:
+                bucket = self._clients[client] = TokenBucket(self.client_rate, self.client_burst)
+                if len(self._clients) > self.max_clients:
+                    self._clients.popitem(last=False)
+            else:
+                self._clients.move_to_end(client)
+            wait = bucket.take(now)
+            if wait:
+                raise Rejection(429, "client_rate", wait)
+
+    def _client_key(self, scope) -> str:
+        if self.client_header:
+            for name, value in scope["headers"]:
+                if name == self.client_header:
+                    return value.decode("latin-1")
+        client = scope.get("client")
+        return client[0] if client else ""
+
+    def route_key(self, scope) -> Optional[str]:
+        """``"METHOD /template"`` of the route ``scope`` will reach, if it has a limit"""
+        app = scope.get("app")
+        for route in getattr(app, "routes", ()):
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                key = f"{scope['method']} {route.path}"
+                return key if key in self.route_limits else None
+        return None
+
+    def enter_route(self, key: str):
+        active = self._route_active.get(key, 0)
+        if active >= self.route_limits[key]:
+            raise Rejection(503, "route_limit")
+        self._route_active[key] = active + 1
+
+    def leave_route(self, key: str):
+        self._route_active[key] -= 1
+
+    async def acquire(self, priority: str):
+        """Wait for a slot, or raise a 503 Rejection"""
+        if self._active < self.concurrency and not (self._waiters[READ] or self._waiters[WRITE]):
+            self._active += 1
+            self._observe(0.0)
+            return
+        if priority == WRITE and self.shedding:
+            raise Rejection(503, "shed")
+
+        future = asyncio.get_running_loop().create_future()
+        waiters = self._waiters[priority]
+        waiters.append(future)
+        ADMISSION_QUEUED.value += 1
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(future, self.max_wait[priority])
+        except asyncio.TimeoutError:
+            raise Rejection(503, "queue_timeout")
+        except asyncio.CancelledError:
+            # The client went away, maybe just as a slot was handed over
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        finally:
+            ADMISSION_QUEUED.value -= 1
+            if not future.done() or future.cancelled():
+                try:
+                    waiters.remove(future)
+                except ValueError:
+                    pass
+        waited = time.monotonic() - start
+        ADMISSION_WAIT_SECONDS.labels(priority).observe(waited)
+        self._observe(waited)
+
+    def release(self):
+        """Hand the slot to the oldest waiting read, else write, else free it"""
+        for priority in (READ, WRITE):
+            waiters = self._waiters[priority]
+            while waiters:
+                future = waiters.popleft()
+                if not future.done():
+                    future.set_result(None)
+                    return
+        self._active -= 1
+
+    def start_stream(self) -> bool:
+        """Swap the caller's slot for a stream slot; False when none is free"""
+        if self._streaming >= self.streams:
+            return False
+        self._streaming += 1
+        self.release()
+        return True
+
+    def end_stream(self):
+        self._streaming -= 1
+
+    def _observe(self, delay: float):
+        self._window_min = min(self._window_min, delay)
+        now = time.monotonic()
+        if now - self._window_start >= self.interval:
+            self.shedding = self._window_min > self.target_delay
+            ADMISSION_SHEDDING.set(1 if self.shedding else 0)
+            self._window_start, self._window_min = now, math.inf
+        elif delay <= self.target_delay and self.shedding:
+            # Back under target: stop shedding without waiting out the window
+            self.shedding = False
+            ADMISSION_SHEDDING.set(0)
+
+
+class AdmissionMiddleware:
+    """Runs AdmissionController in front of every HTTP request.
+
+    Refusals are answered right here, a small JSON body and a
+    Retry-After header, without routing, validation or a handler, so
+    they stay cheap however many arrive. Add it before the metrics and
+    tracing middleware, so those still see the refused requests.
+    """
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        controller = self.controller
+        if scope["type"] != "http" or scope["path"] in controller.exempt:
+            await self.app(scope, receive, send)
+            return
+
+        priority = controller.priority(scope)
+        route = None
+        try:
+            controller.check_rate(scope)
+            if controller.route_limits:
+                route = controller.route_key(scope)
+                if route is not None:
+                    controller.enter_route(route)
+            try:
+                await controller.acquire(priority)
+            except Rejection:
+                if route is not None:
+                    controller.leave_route(route)
+                raise
+        except Rejection as rejection:
+            ADMISSION_REJECTED.labels(rejection.reason, priority).inc()
+            await self._reject(send, rejection)
+            return
+
+        holding, streaming = True, False
+
+        async def send_admitted(message):
+            nonlocal holding, streaming
+            if holding and message["type"] == "http.response.body" and message.get("more_body", False):
+                if controller.start_stream():
+                    holding, streaming = False, True
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_admitted)
+        finally:
+            if holding:
+                controller.release()
+            if streaming:
+                controller.end_stream()
+            if route is not None:
+                controller.leave_route(route)
+
+    @staticmethod
+    async def _reject(send, rejection: Rejection):
+        detail = "Too many requests" if rejection.status == 429 else "Service overloaded, retry later"
+        body = json.dumps({"detail": detail, "reason": rejection.reason}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": rejection.status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(rejection.retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,58 @@
+import os
+from operator import attrgetter
+from typing import Any, Dict, Iterable, List, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import insert
+
+# Upper bound on records accepted by one /bulk request
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "10000"))
+
+
+def validate_items(model: Type[BaseModel], items: Iterable[Any]) -> Tuple[List[Tuple[int, BaseModel]], List[dict]]:
+    """Validate each raw item on its own so one bad row does not sink the batch.
+
+    Returns the ``(index, model)`` pairs that passed and a 422 result for
+    each item that did not.
+    """
+    valid = []
+    errors = []
+    for index, raw in enumerate(items):
+        try:
+            valid.append((index, model.model_validate(raw)))
+        except ValidationError as exc:
+            detail = "; ".join(
+                f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+                for error in exc.errors()
+            )
+            errors.append(item_error(index, 422, detail))
+    return valid, errors
+
+
+def item_created(index: int, item) -> dict:
+    return {"index": index, "status": 201, "item": item}
+
+
+def item_error(index: int, status: int, detail: str) -> dict:
+    return {"index": index, "status": status, "error": detail}
+
+
+def summarize(results: List[dict]) -> dict:
+    results.sort(key=lambda result: result["index"])
+    created = sum(1 for result in results if result["status"] == 201)
+    return {"created": created, "failed": len(results) - created, "results": results}
+
+
+async def insert_returning(db, model, rows: List[Dict[str, Any]]) -> list:
+    """Insert ``rows`` with one multi-row INSERT ... RETURNING, in ``db``'s
+    transaction, and return the created rows in the order of ``rows``.
+
+    SQLite does not promise RETURNING order, so asking SQLAlchemy to sort
+    (``sort_by_parameter_order``) makes it fall back to an INSERT per
+    row there. A multi-row INSERT on SQLite hands out ascending rowids in
+    VALUES order, so the rows are sorted by id instead.
+    """
+    if db.bind.dialect.name == "sqlite":
+        created = (await db.scalars(insert(model).returning(model), rows)).all()
+        return sorted(created, key=attrgetter("id"))
+    return (await db.scalars(insert(model).returning(model, sort_by_parameter_order=True), rows)).all()
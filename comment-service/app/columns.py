@@ -0,0 +1,313 @@
+from array import array
+from datetime import datetime, timedelta
+from itertools import compress
+from typing import Dict, Iterator, List, Optional
+
+# Column kinds for RecordTable layouts
+INT = "int"                  # 64-bit ints (or None), 8 bytes each
+TIMESTAMP = "timestamp"      # naive ISO-8601 strings, as epoch microseconds
+TEXT = "text"                # strings (or None), as they are
+SHARED_TEXT = "shared_text"  # strings repeated across records, one object per value
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_INT_MIN, _INT_MAX = -2 ** 63, 2 ** 63 - 1
+# None in an INT or TIMESTAMP column
+_NULL = _INT_MIN
+
+
+def _decode_ints(values: List[int]) -> List[Optional[int]]:
+    if _NULL in values:
+        return [None if value == _NULL else value for value in values]
+    return values
+
+
+def _grow(column: array, size: int):
+    """Pad ``column`` with zeros up to ``size`` items"""
+    if size > len(column):
+        column.frombytes(bytes(column.itemsize * (size - len(column))))
+
+
+class IdArray:
+    """Mapping of positive ids to ints in one flat array, 0 meaning absent.
+
+    Takes 8 bytes per id up to the largest one stored, where a dict takes
+    about 100 per entry, which suits dense ids such as IndexedStore's.
+    """
+
+    __slots__ = ("_values",)
+
+    def __init__(self):
+        self._values = array("q")
+
+    def get(self, record_id: int, default: Optional[int] = None) -> Optional[int]:
+        values = self._values
+        value = values[record_id] if 0 <= record_id < len(values) else 0
+        return default if value == 0 else value
+
+    def __setitem__(self, record_id: int, value: int):
+        _grow(self._values, record_id + 1)
+        self._values[record_id] = value
+
+    def pop(self, record_id: int, default: Optional[int] = None) -> Optional[int]:
+        value = self.get(record_id, default)
+        if 0 <= record_id < len(self._values):
+            self._values[record_id] = 0
+        return value
+
+
+class RecordTable:
+    """Records of one fixed layout, stored column by column and keyed by id.
+
+    A dict per record costs several hundred bytes before its content: the
+    dict itself, an int object per number and a 26-character string per
+    ``datetime.now().isoformat()``. Here each INT or TIMESTAMP field is 8
+    bytes in an ``array('q')`` slot indexed by the record id, text fields
+    are pointers to their strings, and SHARED_TEXT values are deduplicated.
+
+    Reads build a fresh dict equal to the one stored, keys in the same
+    order, so callers see no difference. A record that cannot be stored
+    exactly that way (other keys, another key order, an int out of range,
+    a timestamp that would not print back the same) is kept as the dict
+    it is. Ids are allocated densely from 1, so addressing columns by id
+    wastes at most the slots of deleted records.
+
+    Writes come one at a time (IndexedStore holds its lock) but reads
+    take no lock, and a row spans several columns, so writers bump
+    ``_seq`` before and after touching a row and a reader that overlapped
+    a write reads again. Nobody sees a half-written record, as before
+    when an update swapped in a whole new dict.
+
+    It implements the parts of the dict interface IndexedStore uses, plus
+    ``value`` to read one field without building the record and ``rows``
+    to read a page of records at once.
+    """
+
+    def __init__(self, layout: Dict[str, str]):
+        self.layout = dict(layout)
+        self.keys = ("id", *self.layout)
+        self._fields = tuple(self.layout)
+        self._kinds = tuple(self.layout.values())
+        self._positions = {field: position for position, field in enumerate(self._fields)}
+        self._columns: List = [array("q") if kind in (INT, TIMESTAMP) else [] for kind in self._kinds]
+        self._present = bytearray()
+        self._size = 0
+        self._loose: Dict[int, dict] = {}
+        self._shared: Dict[str, str] = {}
+        # Odd while a write is under way
+        self._seq = 0
+        # Records inserted together share their created_at string, and
+        # records read together their day, often their second
+        self._last_encoded = (None, _NULL)
+        self._last_day = (None, "")
+        self._last_second = (None, "")
+        self._bind()
+
+    def _bind(self):
+        """(field, decoder of a list of values or None, column) per field"""
+        decoders = {INT: _decode_ints, TIMESTAMP: self._decode_timestamps}
+        self._readers = tuple(
+            (field, decoders.get(kind), column)
+            for field, kind, column in zip(self._fields, self._kinds, self._columns)
+        )
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, record_id: int) -> bool:
+        present = self._present
+        return 0 <= record_id < len(present) and present[record_id] == 1
+
+    def __iter__(self) -> Iterator[int]:
+        return compress(range(len(self._present)), self._present)
+
+    def __getitem__(self, record_id: int) -> dict:
+        record = self.get(record_id)
+        if record is None:
+            raise KeyError(record_id)
+        return record
+
+    def __setitem__(self, record_id: int, record: dict):
+        values = self._encode(record)
+        present = self._present
+        self._seq += 1
+        if record_id >= len(present):
+            present.extend(bytes(record_id + 1 - len(present)))
+            for column in self._columns:
+                if isinstance(column, array):
+                    _grow(column, record_id + 1)
+                else:
+                    column.extend([None] * (record_id + 1 - len(column)))
+        if values is None:
+            self._loose[record_id] = record
+        else:
+            if self._loose:
+                self._loose.pop(record_id, None)
+            for column, value in zip(self._columns, values):
+                column[record_id] = value
+        if not present[record_id]:
+            present[record_id] = 1
+            self._size += 1
+        self._seq += 1
+
+    def get(self, record_id: int, default=None) -> Optional[dict]:
+        records = self.rows([record_id])
+        return records[0] if records else default
+
+    def rows(self, record_ids: List[int]) -> List[dict]:
+        """The records of ``record_ids``, decoded a column at a time.
+
+        Much cheaper per record than ``get`` for a page of them. Ids not
+        stored are left out.
+        """
+        present = self._present
+        keys = self.keys
+        while True:
+            seq = self._seq
+            size = len(present)
+            stored = [record_id for record_id in record_ids if 0 <= record_id < size and present[record_id]]
+            columns = []
+            for _, decode, column in self._readers:
+                values = [column[record_id] for record_id in stored]
+                columns.append(values if decode is None else decode(values))
+            records = [dict(zip(keys, row)) for row in zip(stored, *columns)]
+            if self._loose:
+                loose = self._loose
+                records = [loose.get(record_id, record) for record_id, record in zip(stored, records)]
+            if seq == self._seq and not seq & 1:
+                return records
+
+    def value(self, record_id: int, field: str, default=None):
+        """One field of a record, without building the whole record"""
+        if record_id not in self:
+            return default
+        if self._loose:
+            loose = self._loose.get(record_id)
+            if loose is not None:
+                return loose.get(field, default)
+        position = self._positions.get(field)
+        if position is None:
+            return record_id if field == "id" else default
+        _, decode, column = self._readers[position]
+        value = column[record_id]
+        return value if decode is None else decode([value])[0]
+
+    def pop(self, record_id: int, default=None) -> Optional[dict]:
+        record = self.get(record_id)
+        if record is None:
+            return default
+        self._seq += 1
+        self._present[record_id] = 0
+        self._size -= 1
+        if self._loose:
+            self._loose.pop(record_id, None)
+        for column in self._columns:
+            if not isinstance(column, array):
+                # Let the strings go
+                column[record_id] = None
+        self._seq += 1
+        return record
+
+    def values(self) -> Iterator[dict]:
+        get = self.get
+        return (get(record_id) for record_id in self)
+
+    def frozen(self) -> "RecordTable":
+        """A copy that later writes to this table do not change.
+
+        Copies the columns and pointers, not the records, so it is cheap
+        enough to take under a lock and read after releasing it.
+        """
+        copy = RecordTable.__new__(RecordTable)
+        copy.__dict__.update(self.__dict__)
+        copy._columns = [column[:] for column in self._columns]
+        copy._present = bytearray(self._present)
+        copy._loose = dict(self._loose)
+        copy._bind()
+        return copy
+
+    def __getstate__(self) -> dict:
+        """The columns as they are, for pickling (snapshots)"""
+        return {"layout": self.layout, "columns": self._columns, "present": self._present,
+                "size": self._size, "loose": self._loose}
+
+    def __setstate__(self, state: dict):
+        self.__init__(state["layout"])
+        self._columns, self._present = state["columns"], state["present"]
+        self._size, self._loose = state["size"], state["loose"]
+        for kind, column in zip(self._kinds, self._columns):
+            if kind == SHARED_TEXT:
+                # Unpickled as one object per value already; keep sharing them
+                for value in column:
+                    if value is not None:
+                        self._shared.setdefault(value, value)
+        self._bind()
+
+    def _encode(self, record: dict) -> Optional[list]:
+        if tuple(record) != self.keys:
+            return None
+        values = []
+        for field, kind in zip(self._fields, self._kinds):
+            value = record[field]
+            if value is None:
+                values.append(_NULL if kind in (INT, TIMESTAMP) else None)
+            elif kind == INT:
+                if type(value) is not int or not _INT_MIN < value <= _INT_MAX:
+                    return None
+                values.append(value)
+            elif kind == TIMESTAMP:
+                encoded = self._encode_timestamp(value)
+                if encoded is None:
+                    return None
+                values.append(encoded)
+            elif type(value) is not str:
+                return None
+            elif kind == SHARED_TEXT:
+                values.append(self._shared.setdefault(value, value))
+            else:
+                values.append(value)
+        return values
+
+    def _encode_timestamp(self, text) -> Optional[int]:
+        last_text, last_value = self._last_encoded
+        if text == last_text:
+            return last_value
+        if type(text) is not str:
+            return None
+        try:
+            moment = datetime.fromisoformat(text)
+        except ValueError:
+            return None
+        # Only strings that print back identically, e.g. not "2024-01-01 10:00"
+        if moment.tzinfo is not None or moment.isoformat() != text:
+            return None
+        value = (moment - _EPOCH) // _MICROSECOND
+        if value == _NULL:
+            return None
+        self._last_encoded = (text, value)
+        return value
+
+    def _decode_timestamps(self, values: List[int]) -> List[Optional[str]]:
+        """What ``datetime.isoformat()`` printed, without building datetimes"""
+        decoded = []
+        append = decoded.append
+        last_seconds, prefix = self._last_second
+        for value in values:
+            if value == _NULL:
+                append(None)
+                continue
+            seconds, microseconds = divmod(value, 1_000_000)
+            if seconds != last_seconds:
+                last_seconds, prefix = seconds, self._timestamp_prefix(seconds)
+            append("%s.%06d" % (prefix, microseconds) if microseconds else prefix)
+        self._last_second = (last_seconds, prefix)
+        return decoded
+
+    def _timestamp_prefix(self, seconds: int) -> str:
+        """``YYYY-MM-DDTHH:MM:SS`` of ``seconds`` since the epoch"""
+        day, second = divmod(seconds, 86_400)
+        last_day, date = self._last_day
+        if day != last_day:
+            date = (_EPOCH + timedelta(days=day)).date().isoformat()
+            self._last_day = (day, date)
+        return "%sT%02d:%02d:%02d" % (date, second // 3600, second // 60 % 60, second % 60)
@@ -1,14 +1,45 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Body, FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional
 from datetime import datetime
-import requests
+import asyncio
 import os
 import uvicorn
+from .admission import AdmissionController, AdmissionMiddleware
+from .bulk import BULK_MAX_ITEMS, item_created, item_error, summarize, validate_items
+from .cache import ExistenceCache
+from .clients import ExistenceBatcher, ServiceClient, UpstreamUnavailable
+from .etag import ETAG_HEADER, check_not_modified, make_etag
+from .events import CREATED, DELETED, IdReplica, LocalBus
+from .metrics import EXISTENCE_CHECK_SECONDS, METRICS_ENABLED, MetricsMiddleware, metrics_response
+from .negotiation import COMPRESSION_ENABLED, CompressionMiddleware, MessagePackMiddleware
+from .pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, decode_cursor, paginate
+from .persistence import Persistence
+from .shared import SharedState
+from .search import DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT, InvertedIndex
+from .serialization import ListEncoder
+from .columns import INT, TEXT, TIMESTAMP
+from .store import IndexedStore
+from .streaming import EXPORT_BATCH_SIZE, NDJSON_MEDIA_TYPE, ndjson_stream
+from .tracing import Tracer, TracingMiddleware, traced
 
 app = FastAPI(title="Comment Service", version="1.0.0")
 
+# Concurrency and rate limits in front of every route, reads ahead of
+# writes, writes shed under overload. Added first so it runs innermost:
+# its 429s and 503s still carry CORS headers and show up in metrics.
+admission = AdmissionController.from_env()
+if admission is not None:
+    app.add_middleware(AdmissionMiddleware, controller=admission)
+
+# MessagePack for clients whose Accept asks for it (other services), then
+# gzip/br/zstd by Accept-Encoding for bodies of COMPRESSION_MIN_BYTES and up
+app.add_middleware(MessagePackMiddleware)
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+
 # CORS configuration for frontend
 app.add_middleware(
     CORSMiddleware,
@@ -16,15 +47,69 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, ETAG_HEADER],
 )
 
+# W3C traceparent in and out, sampled spans kept for /api/v1/traces
+tracer = Tracer.from_env("comment-service")
+app.add_middleware(TracingMiddleware, tracer=tracer)
+
+# Per-route latency, requests in flight and SQL per request, on /metrics
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # Configuration - Use environment variables for production
 USER_SERVICE_URL = os.getenv("USER_SERVICE_URL", "https://user-service-demoblog-archita.azurewebsites.net")
 POST_SERVICE_URL = os.getenv("POST_SERVICE_URL", "https://post-service-demoblog-archita.azurewebsites.net")
 
+# Pooled keep-alive clients, each with its own timeout and circuit breaker
+user_service = ServiceClient.from_env("user-service", USER_SERVICE_URL, "USER_SERVICE")
+post_service = ServiceClient.from_env("post-service", POST_SERVICE_URL, "POST_SERVICE")
+
+# Hot posts get many comments from the same few authors, so remember answers
+user_exists_cache = ExistenceCache.from_env()
+post_exists_cache = ExistenceCache.from_env()
+user_exists_batcher = ExistenceBatcher.from_env(user_service, "/api/v1/users:exists")
+post_exists_batcher = ExistenceBatcher.from_env(post_service, "/api/v1/posts:exists")
+
+# Change events: comments are published, and user and post ids are
+# replicated locally from the other services' events so existence checks
+# rarely leave the process
+bus = LocalBus.from_env()
+user_replica = IdReplica(on_deleted=user_exists_cache.invalidate)
+post_replica = IdReplica(on_deleted=post_exists_cache.invalidate)
+bus.subscribe("users", user_replica.apply)
+bus.subscribe("posts", post_replica.apply)
+
 # In-memory storage
-comments_db = []
-comment_id_counter = 1
+# The post_id and author_id indexes double as O(1) comment counters.
+# With STORE_SOCKET set, every worker shares one store and search index
+# in an owner process. Records are kept column by column in this layout
+# (see columns.py), about a quarter of the memory of a dict per comment.
+COMMENT_COLUMNS = {"content": TEXT, "post_id": INT, "author_id": INT, "created_at": TIMESTAMP}
+shared_state = SharedState.from_env()
+if shared_state is not None:
+    comments_db = shared_state.store("comments", indexed=("post_id", "author_id"), columns=COMMENT_COLUMNS)
+    comments_index = shared_state.index("comments", "comments", ("content",))
+else:
+    comments_db = IndexedStore(indexed=("post_id", "author_id"), columns=COMMENT_COLUMNS)
+    # Full-text index over content, kept in step with comments_db
+    comments_index = InvertedIndex()
+# Optional snapshot + write-ahead log under $PERSIST_DIR, off by default
+# (a shared store is persisted by its owner process instead)
+comments_persistence = None if shared_state else Persistence.from_env("comments")
+
+@app.on_event("startup")
+def restore_comments():
+    if comments_persistence is not None:
+        comments_persistence.attach(comments_db)
+        for comment in comments_db:
+            comments_index.add(comment["id"], comment["content"])
+
+@app.on_event("shutdown")
+def persist_comments():
+    if comments_persistence is not None:
+        comments_persistence.close()
 
 # Models
 class CommentCreate(BaseModel):
@@ -39,19 +124,72 @@ class Comment(BaseModel):
     author_id: int
     created_at: str
 
-def verify_user_exists(user_id: int):
-    try:
-        response = requests.get(f"{USER_SERVICE_URL}/api/v1/users/{user_id}", timeout=10)
-        return response.status_code == 200
-    except:
-        return False
+class CommentHit(Comment):
+    score: float
+
+class CommentSearchResponse(BaseModel):
+    total: int
+    results: List[CommentHit]
+
+class CountsRequest(BaseModel):
+    post_ids: List[int] = Field([], max_length=10000)
+    author_ids: List[int] = Field([], max_length=10000)
+
+class CountsResponse(BaseModel):
+    posts: Dict[int, int]
+    authors: Dict[int, int]
+
+class BulkItemResult(BaseModel):
+    index: int
+    status: int
+    item: Optional[Comment] = None
+    error: Optional[str] = None
+
+class BulkResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[BulkItemResult]
+
+# Compiled once; list endpoints encode the stored records through it
+comment_list = ListEncoder(Comment)
+
+user_check_seconds = EXISTENCE_CHECK_SECONDS.labels("user")
+post_check_seconds = EXISTENCE_CHECK_SECONDS.labels("post")
+
+# For demo purposes, skip verification if other services are not available
+# In production, you might want to handle this differently
+async def verify_user_exists(user_id: int):
+    with user_check_seconds.time(), traced("verify_user_exists"):
+        if user_id in user_replica:
+            return True
+        try:
+            return await user_exists_cache.get_or_load(
+                user_id, lambda: user_exists_batcher.exists(user_id)
+            )
+        except UpstreamUnavailable:
+            return True
 
-def verify_post_exists(post_id: int):
-    try:
-        response = requests.get(f"{POST_SERVICE_URL}/api/v1/posts/{post_id}", timeout=10)
-        return response.status_code == 200
-    except:
-        return False
+async def verify_post_exists(post_id: int):
+    with post_check_seconds.time(), traced("verify_post_exists"):
+        if post_id in post_replica:
+            return True
+        try:
+            return await post_exists_cache.get_or_load(
+                post_id, lambda: post_exists_batcher.exists(post_id)
+            )
+        except UpstreamUnavailable:
+            return True
+
+@app.on_event("startup")
+async def start_events():
+    await bus.start()
+
+@app.on_event("shutdown")
+async def close_clients():
+    await bus.close()
+    tracer.close()
+    await user_service.aclose()
+    await post_service.aclose()
 
 @app.get("/")
 def root():
@@ -61,47 +199,135 @@ def root():
 def health_check():
     return {"service": "comment-service", "status": "healthy", "timestamp": datetime.now().isoformat()}
 
+@app.get("/metrics")
+def get_metrics():
+    return metrics_response()
+
+# Recently sampled spans, newest first; a trace id comes from the
+# traceresponse header of a sampled response
+@app.get("/api/v1/traces")
+def get_traces(trace_id: Optional[str] = None, limit: int = Query(100, ge=1, le=10000)):
+    return tracer.buffer.spans(trace_id, limit)
+
+@app.get("/api/v1/cache/stats")
+async def get_cache_stats():
+    return {"users": user_exists_cache.stats(), "posts": post_exists_cache.stats()}
+
+# Called by user-service / post-service when a record is deleted
+@app.delete("/api/v1/cache/users/{user_id}")
+async def invalidate_user(user_id: int):
+    return {"invalidated": user_exists_cache.invalidate(user_id)}
+
+@app.delete("/api/v1/cache/posts/{post_id}")
+async def invalidate_post(post_id: int):
+    return {"invalidated": post_exists_cache.invalidate(post_id)}
+
 @app.post("/api/v1/comments", response_model=Comment)
-def create_comment(comment: CommentCreate):
-    global comment_id_counter
-    
-    # For demo purposes, skip verification if other services are not available
-    # In production, you might want to handle this differently
-    try:
-        if not verify_user_exists(comment.author_id):
-            raise HTTPException(status_code=400, detail="Author not found")
-        if not verify_post_exists(comment.post_id):
-            raise HTTPException(status_code=400, detail="Post not found")
-    except:
-        # Continue anyway for demo - in production handle this properly
-        pass
+async def create_comment(comment: CommentCreate):
+    # Check author and post concurrently
+    author_found, post_found = await asyncio.gather(
+        verify_user_exists(comment.author_id),
+        verify_post_exists(comment.post_id),
+    )
+    if not author_found:
+        raise HTTPException(status_code=400, detail="Author not found")
+    if not post_found:
+        raise HTTPException(status_code=400, detail="Post not found")
     
     new_comment = {
-        "id": comment_id_counter,
         "content": comment.content,
         "post_id": comment.post_id,
         "author_id": comment.author_id,
         "created_at": datetime.now().isoformat()
     }
     
-    comments_db.append(new_comment)
-    comment_id_counter += 1
-    
+    new_comment = comments_db.insert(new_comment)
+    comments_index.add(new_comment["id"], new_comment["content"])
+    bus.publish("comments", CREATED, new_comment["id"])
     return new_comment
 
+@app.post("/api/v1/comments/bulk", response_model=BulkResponse)
+async def create_comments_bulk(items: List[Dict[str, Any]] = Body(..., max_length=BULK_MAX_ITEMS)):
+    valid, results = validate_items(CommentCreate, items)
+    
+    # Each distinct author and post is checked once, all concurrently
+    author_ids = list({comment.author_id for _, comment in valid})
+    post_ids = list({comment.post_id for _, comment in valid})
+    checks = await asyncio.gather(
+        *map(verify_user_exists, author_ids), *map(verify_post_exists, post_ids)
+    )
+    authors_found = dict(zip(author_ids, checks[:len(author_ids)]))
+    posts_found = dict(zip(post_ids, checks[len(author_ids):]))
+    
+    accepted = []
+    for index, comment in valid:
+        if not authors_found[comment.author_id]:
+            results.append(item_error(index, 400, "Author not found"))
+        elif not posts_found[comment.post_id]:
+            results.append(item_error(index, 400, "Post not found"))
+        else:
+            accepted.append((index, comment))
+    
+    created_at = datetime.now().isoformat()
+    stored = comments_db.insert_many(
+        {
+            "content": comment.content,
+            "post_id": comment.post_id,
+            "author_id": comment.author_id,
+            "created_at": created_at
+        }
+        for _, comment in accepted
+    )
+    for (index, _), new_comment in zip(accepted, stored):
+        comments_index.add(new_comment["id"], new_comment["content"])
+        results.append(item_created(index, new_comment))
+    bus.publish_many("comments", CREATED, [new_comment["id"] for new_comment in stored])
+    return summarize(results)
+
+# Full collection as NDJSON, streamed page by page
+@app.get("/api/v1/comments/export")
+def export_comments():
+    return StreamingResponse(ndjson_stream(comments_db.scan(EXPORT_BATCH_SIZE)), media_type=NDJSON_MEDIA_TYPE)
+
+# Comment totals for a whole listing page in one call, O(1) per id
+@app.post("/api/v1/comments:counts", response_model=CountsResponse)
+def count_comments(request: CountsRequest):
+    return {
+        "posts": {i: comments_db.count("post_id", i) for i in request.post_ids},
+        "authors": {i: comments_db.count("author_id", i) for i in request.author_ids},
+    }
+
+# BM25-ranked full-text search, paged by offset
+@app.get("/api/v1/comments/search", response_model=CommentSearchResponse)
+def search_comments(q: str = Query(..., min_length=1, max_length=256), offset: int = Query(0, ge=0), limit: int = Query(DEFAULT_SEARCH_LIMIT, ge=1, le=MAX_SEARCH_LIMIT)):
+    total, hits = comments_index.search(q, offset, limit)
+    results = []
+    for comment_id, score in hits:
+        comment = comments_db.get(comment_id)
+        if comment is not None:
+            results.append({**comment, "score": score})
+    return {"total": total, "results": results}
+
 @app.get("/api/v1/comments/post/{post_id}", response_model=List[Comment])
-def get_comments_by_post(post_id: int):
-    comments = [c for c in comments_db if c["post_id"] == post_id]
-    return comments
+def get_comments_by_post(post_id: int, request: Request, response: Response, cursor: Optional[str] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)):
+    after_id = decode_cursor(cursor)[1] if cursor else 0
+    # Only writes to this post's comments change its bucket version
+    version = comments_db.collection_version("post_id", post_id)
+    check_not_modified(request, response, make_etag("comments", post_id, version, after_id, limit))
+    comments = paginate(response, comments_db.page(after_id, limit + 1, "post_id", post_id), limit)
+    return comment_list.response(comments, response)
 
 @app.get("/api/v1/comments", response_model=List[Comment])
-def get_all_comments():
-    return comments_db
+def get_all_comments(request: Request, response: Response, cursor: Optional[str] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)):
+    after_id = decode_cursor(cursor)[1] if cursor else 0
+    check_not_modified(request, response, make_etag("comments", comments_db.collection_version(), after_id, limit))
+    return comment_list.response(paginate(response, comments_db.page(after_id, limit + 1), limit), response)
 
 @app.delete("/api/v1/comments/{comment_id}")
 def delete_comment(comment_id: int):
-    global comments_db
-    comments_db = [c for c in comments_db if c["id"] != comment_id]
+    if comments_db.delete(comment_id) is not None:
+        comments_index.remove(comment_id)
+        bus.publish("comments", DELETED, comment_id)
     return {"message": "Comment deleted successfully"}
 
 # For local development
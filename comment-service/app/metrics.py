@@ -0,0 +1,337 @@
+import bisect
+import contextvars
+import os
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from fastapi import Response
+from sqlalchemy import event
+
+# With this off, main.py leaves the middleware out and database.py the SQL
+# listeners; /metrics still answers
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+# Starlette appends the charset
+METRICS_MEDIA_TYPE = "text/plain; version=0.0.4"
+
+# Seconds, from sub-millisecond cache hits to requests that time out
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Queries per request
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """A named metric family with one child per distinct label values.
+
+    Children are created on first use and kept, so hot paths look one up
+    once (``metric.labels(...)`` at import time) and then only touch
+    plain attributes. Every update happens on the event loop thread, SQL
+    events included (they run in greenlets of that thread), so nothing
+    is locked.
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values):
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {key}")
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def exposition(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+            for key, child in self._children.items()
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+            for key, child in self._children.items()
+        ]
+
+
+class _Buckets:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # One slot per bound plus +Inf; cumulated only when exposed
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def time(self) -> "_Timer":
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("buckets", "start")
+
+    def __init__(self, buckets: _Buckets):
+        self.buckets = buckets
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.buckets.observe(time.perf_counter() - self.start)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """The metrics of one process, rendered in the Prometheus text format.
+
+    Each uvicorn worker keeps its own, so with several workers every
+    scrape sees one worker; scrape them one by one or run one worker
+    per container.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.setdefault(metric.name, metric)
+        return self._metrics[metric.name]
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def exposition(self) -> str:
+        return "\n".join(metric.exposition() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.counter("http_requests", "HTTP requests by route and status", ("method", "route", "status"))
+REQUEST_SECONDS = REGISTRY.histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+IN_FLIGHT = REGISTRY.gauge("http_requests_in_flight", "HTTP requests being served").labels()
+REQUEST_QUERIES = REGISTRY.histogram(
+    "http_request_db_queries", "SQL statements run per HTTP request", ("route",), COUNT_BUCKETS
+)
+REQUEST_DB_SECONDS = REGISTRY.histogram("http_request_db_seconds", "Time in SQL statements per HTTP request", ("route",))
+DB_QUERIES = REGISTRY.counter("db_queries", "SQL statements executed").labels()
+DB_QUERY_SECONDS = REGISTRY.histogram("db_query_duration_seconds", "SQL statement latency").labels()
+UPSTREAM_SECONDS = REGISTRY.histogram(
+    "upstream_request_duration_seconds", "Calls to other services by outcome", ("upstream", "outcome")
+)
+EXISTENCE_CHECK_SECONDS = REGISTRY.histogram(
+    "existence_check_duration_seconds", "verify_*_exists latency, from replica, cache or upstream", ("kind",)
+)
+
+
+class _QueryStats:
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+# The SQL statements of the request being served, for the engine events
+_request_queries: contextvars.ContextVar[Optional[_QueryStats]] = contextvars.ContextVar(
+    "request_queries", default=None
+)
+
+
+class MetricsMiddleware:
+    """Times every HTTP request and counts the SQL it ran, per route.
+
+    A plain ASGI middleware rather than BaseHTTPMiddleware, so a request
+    costs two perf_counter calls and a few attribute updates, not an
+    extra task and a buffered body. Routes are labelled by their path
+    template ("/api/v1/posts/{post_id}"), which keeps the label set as
+    small as the route table.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._children: Dict[Tuple[str, str], tuple] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        stats = _QueryStats()
+        token = _request_queries.set(stats)
+        IN_FLIGHT.value += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            IN_FLIGHT.value -= 1
+            _request_queries.reset(token)
+            route = scope.get("route")
+            self._record(scope["method"], route.path if route is not None else "<unmatched>", status, elapsed, stats)
+
+    def _record(self, method: str, route: str, status: int, elapsed: float, stats: _QueryStats):
+        children = self._children.get((method, route))
+        if children is None:
+            children = self._children[(method, route)] = (
+                REQUEST_SECONDS.labels(method, route), REQUEST_QUERIES.labels(route), REQUEST_DB_SECONDS.labels(route)
+            )
+        latency, queries, db_seconds = children
+        latency.observe(elapsed)
+        REQUESTS.labels(method, route, status).inc()
+        if stats.queries:
+            queries.observe(stats.queries)
+            db_seconds.observe(stats.seconds)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    DB_QUERIES.value += 1
+    DB_QUERY_SECONDS.observe(elapsed)
+    # Async sessions run this in a greenlet that shares the request's context
+    stats = _request_queries.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.seconds += elapsed
+
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute: drop its start
+    starts = context.connection.info.get("query_start") if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def instrument_engine(engine):
+    """Count and time every statement ``engine`` (sync or async) runs"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+
+def upstream_timer(upstream: str):
+    """``(ok, error)`` histogram children for calls to ``upstream``"""
+    return UPSTREAM_SECONDS.labels(upstream, "ok"), UPSTREAM_SECONDS.labels(upstream, "error")
+
+
+def metrics_response() -> Response:
+    return Response(REGISTRY.exposition(), media_type=METRICS_MEDIA_TYPE)
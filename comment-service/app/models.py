@@ -1,7 +1,20 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
-from sqlalchemy.sql import func
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index, DDL, event, literal_column
+from sqlalchemy.dialects import postgresql  # noqa: F401 - registers func.to_tsvector and friends
+from sqlalchemy.sql import column, func, table
+from datetime import datetime, timezone
 from .database import Base
 
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+# Full-text search. PostgreSQL keeps an expression GIN index over the
+# tsvector; queries must repeat the exact expression (literals, not bind
+# parameters) for the planner to use it.
+SEARCH_CONFIG = literal_column("'english'::regconfig")
+
+def _search_vector(content):
+    return func.to_tsvector(SEARCH_CONFIG, content)
+
 class Comment(Base):
     __tablename__ = "comments"
     
@@ -9,4 +22,44 @@ class Comment(Base):
     content = Column(Text, nullable=False)
     post_id = Column(Integer, nullable=False)  # Foreign key to post service
     author_id = Column(Integer, nullable=False)  # Foreign key to user service
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    # Stamped by the app, like updated_at: SQLite's CURRENT_TIMESTAMP has
+    # no fraction of a second, and keyset cursors compare against values
+    # bound with microseconds. The server default covers other writers.
+    created_at = Column(DateTime(timezone=True), default=utcnow, server_default=func.now())
+    
+    # Back keyset pagination on (created_at, id), overall and per post
+    __table_args__ = (
+        Index("ix_comments_created_at_id", "created_at", "id"),
+        Index("ix_comments_post_id_created_at_id", "post_id", "created_at", "id"),
+        Index("ix_comments_search", _search_vector(content), postgresql_using="gin").ddl_if(dialect="postgresql"),
+    )
+
+# Comment totals per post and per author, kept up to date by the write
+# paths so a listing page reads k counters instead of counting k posts
+class CommentCount(Base):
+    __tablename__ = "comment_counts"
+    
+    scope = Column(String, primary_key=True)  # "post" or "author"
+    owner_id = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+def search_vector():
+    return _search_vector(Comment.__table__.c.content)
+
+# SQLite gets an FTS5 table over the content, kept in step by triggers
+comments_fts = table("comments_fts", column("rowid"))
+
+for statement in (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS comments_fts USING fts5(content, content='comments', content_rowid='id')",
+    """CREATE TRIGGER IF NOT EXISTS comments_fts_insert AFTER INSERT ON comments BEGIN
+        INSERT INTO comments_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS comments_fts_delete AFTER DELETE ON comments BEGIN
+        INSERT INTO comments_fts(comments_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS comments_fts_update AFTER UPDATE OF content ON comments BEGIN
+        INSERT INTO comments_fts(comments_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO comments_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+):
+    event.listen(Comment.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
@@ -0,0 +1,259 @@
+import glob
+import logging
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+from operator import itemgetter
+from typing import Iterator, List, Optional, Tuple, Union
+
+from .columns import RecordTable
+from .store import IndexedStore
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"IDXSNAP1"
+# Every log entry is framed as payload length + CRC32, then the pickled entry
+FRAME = struct.Struct("<II")
+
+
+def _fsync_directory(directory: str):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _segment_path(directory: str, segment: int) -> str:
+    return os.path.join(directory, f"wal.{segment:08d}.log")
+
+
+def _segments(directory: str) -> List[int]:
+    paths = glob.glob(os.path.join(directory, "wal.*.log"))
+    return sorted(int(os.path.basename(path).split(".")[1]) for path in paths)
+
+
+def read_segment(path: str) -> Iterator[Tuple]:
+    """Yield the entries of one log segment, stopping at a torn or corrupt tail"""
+    with open(path, "rb") as f:
+        data = f.read()
+    offset = 0
+    while offset + FRAME.size <= len(data):
+        length, checksum = FRAME.unpack_from(data, offset)
+        start = offset + FRAME.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != checksum:
+            logger.warning("Ignoring torn log tail in %s at byte %d", path, offset)
+            return
+        yield pickle.loads(payload)
+        offset = start + length
+
+
+class WriteAheadLog:
+    """Append-only journal of store mutations with group commit.
+
+    ``append`` is called under the store's lock, so it only encodes the
+    entry, queues it and returns its sequence number. The writer then
+    calls ``sync`` with that number outside the lock, and is acknowledged
+    only once the entry is on disk. The first writer to sync writes
+    everything queued with one ``write`` and one ``fsync``; writers that
+    queue entries meanwhile wait for it, then find theirs written or
+    write the next group. So concurrent writes share an fsync, and none
+    is acknowledged before it is durable.
+    """
+
+    def __init__(self, directory: str, segment: int):
+        self.directory = directory
+        self.segment = segment
+        self.appended = 0
+        self.durable = 0
+        self.fsyncs = 0
+        self._pending: List[bytes] = []
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._file = open(_segment_path(directory, segment), "ab")
+
+    def append(self, entry: Tuple) -> int:
+        payload = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+        frame = FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+        with self._lock:
+            self._pending.append(frame)
+            self.appended += 1
+            return self.appended
+
+    def sync(self, sequence: int):
+        """Return once the entry ``append`` numbered ``sequence`` is on disk"""
+        if self.durable < sequence:
+            self.flush(sequence)
+
+    def flush(self, sequence: Optional[int] = None):
+        """Write and fsync everything appended so far (unless ``sequence`` already is)"""
+        with self._io_lock:
+            if sequence is not None and self.durable >= sequence:
+                # Written by the group that went while this one waited
+                return
+            with self._lock:
+                frames, self._pending = self._pending, []
+                appended = self.appended
+            if frames:
+                self._file.write(b"".join(frames))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self.fsyncs += 1
+            self.durable = appended
+
+    def rotate(self) -> int:
+        """Start a new segment and return its number.
+
+        Everything appended before the call is in earlier segments.
+        """
+        with self._io_lock:
+            with self._lock:
+                frames, self._pending = self._pending, []
+                appended = self.appended
+                if frames:
+                    self._file.write(b"".join(frames))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self.segment += 1
+                self._file = open(_segment_path(self.directory, self.segment), "ab")
+            self.durable = appended
+        _fsync_directory(self.directory)
+        return self.segment
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+
+def write_snapshot(path: str, segment: int, next_id: int, records: Union[List[dict], RecordTable]):
+    """Write ``records`` and atomically replace ``path``.
+
+    A RecordTable (a store with a column layout) is written column by
+    column: ints and timestamps as the raw bytes of their arrays, and
+    text as lists in which pickle writes each repeated string once. Plain
+    dicts are written in id order as they are; pickle writes each
+    repeated field name once and refers back to it.
+    """
+    if isinstance(records, list):
+        records.sort(key=itemgetter("id"))
+    state = {"segment": segment, "next_id": next_id, "records": records}
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(SNAPSHOT_MAGIC)
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync_directory(os.path.dirname(path))
+
+
+def read_snapshot(path: str) -> Tuple[int, int, Union[List[dict], RecordTable]]:
+    """Map a snapshot into memory and return (segment, next_id, records)"""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        if mapped[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a store snapshot")
+        with memoryview(mapped) as view:
+            state = pickle.loads(view[len(SNAPSHOT_MAGIC):])
+    return state["segment"], state["next_id"], state["records"]
+
+
+class Persistence:
+    """Durable backing for one IndexedStore: a snapshot plus a log.
+
+    On ``attach`` the latest snapshot is loaded and every log segment
+    written after it is replayed; from then on the store journals into a
+    fresh segment, and each write returns once its entry is on disk.
+    Snapshots are taken in the background once
+    ``snapshot_every`` entries have been logged (checked every
+    ``snapshot_interval`` seconds), after which the segments they cover
+    are deleted.
+    """
+
+    def __init__(self, directory: str, snapshot_every: int = 100000, snapshot_interval: float = 60.0):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_path = os.path.join(directory, "snapshot.bin")
+        self.store: Optional[IndexedStore] = None
+        self.log: Optional[WriteAheadLog] = None
+        self._logged_at_snapshot = 0
+        self._snapshot_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._snapshotter: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_env(cls, name: str) -> Optional["Persistence"]:
+        """Persistence under ``$PERSIST_DIR/<name>``, or None when PERSIST_DIR is unset"""
+        root = os.getenv("PERSIST_DIR")
+        if not root:
+            return None
+        return cls(
+            os.path.join(root, name),
+            snapshot_every=int(os.getenv("PERSIST_SNAPSHOT_EVERY", "100000")),
+            snapshot_interval=float(os.getenv("PERSIST_SNAPSHOT_INTERVAL", "60")),
+        )
+
+    def attach(self, store: IndexedStore):
+        """Restore ``store`` from disk and journal its writes from now on"""
+        os.makedirs(self.directory, exist_ok=True)
+        start = time.perf_counter()
+        first_segment = 0
+        if os.path.exists(self.snapshot_path):
+            first_segment, next_id, records = read_snapshot(self.snapshot_path)
+            store.restore(records, next_id)
+        replayed = 0
+        segments = [s for s in _segments(self.directory) if s >= first_segment]
+        for segment in segments:
+            for entry in read_segment(_segment_path(self.directory, segment)):
+                store.replay(entry)
+                replayed += 1
+        logger.info(
+            "Restored %d records from %s (%d log entries) in %.2fs",
+            len(store), self.directory, replayed, time.perf_counter() - start,
+        )
+
+        # Never append after a possibly torn tail: always open a new segment
+        self.log = WriteAheadLog(self.directory, max(segments, default=first_segment) + 1)
+        # Replayed entries are not in the snapshot yet either
+        self._logged_at_snapshot = -replayed
+        self.store = store
+        store.journal = self.log
+        self._snapshotter = threading.Thread(target=self._run, name="snapshotter", daemon=True)
+        self._snapshotter.start()
+
+    def snapshot(self):
+        """Write a snapshot of the store now and drop the log it supersedes"""
+        with self._snapshot_lock:
+            segment, next_id, records = self.store.checkpoint(self.log.rotate)
+            self._logged_at_snapshot = self.log.appended
+            write_snapshot(self.snapshot_path, segment, next_id, records)
+            for old in _segments(self.directory):
+                if old < segment:
+                    os.remove(_segment_path(self.directory, old))
+
+    def close(self, snapshot: bool = True):
+        self._closed.set()
+        if self._snapshotter is not None:
+            self._snapshotter.join()
+        if self.log is None:
+            return
+        if snapshot:
+            self.snapshot()
+        self.store.journal = None
+        self.log.close()
+
+    def _run(self):
+        while not self._closed.wait(self.snapshot_interval):
+            if self.log.appended - self._logged_at_snapshot < self.snapshot_every:
+                continue
+            try:
+                self.snapshot()
+            except OSError:
+                logger.exception("Snapshot of %s failed", self.directory)
@@ -1,61 +1,295 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-import requests
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, delete, func, insert, literal, literal_column, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+import asyncio
 import os
 from . import models, schemas
-from .database import get_db
+from .bulk import BULK_MAX_ITEMS, insert_returning, item_created, item_error, summarize, validate_items
+from .cache import ExistenceCache
+from .clients import ExistenceBatcher, ServiceClient, UpstreamUnavailable
+from .database import SessionLocal, engine, get_db
+from .etag import check_not_modified, make_etag, row_version
+from .events import CREATED, DELETED, IdReplica, LocalBus
+from .metrics import EXISTENCE_CHECK_SECONDS
+from .pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, paginate
+from .search import DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT, tokenize
+from .serialization import ListEncoder
+from .streaming import EXPORT_BATCH_SIZE, NDJSON_MEDIA_TYPE, ndjson_astream
+from .tracing import traced
+from .writer import GroupCommitWriter
 
 router = APIRouter()
+# Compiled once; list endpoints encode rows through it
+comment_list = ListEncoder(schemas.Comment)
+
 USER_SERVICE_URL = os.getenv("USER_SERVICE_URL", "http://localhost:8001")
 POST_SERVICE_URL = os.getenv("POST_SERVICE_URL", "http://localhost:8002")
+user_service = ServiceClient.from_env("user-service", USER_SERVICE_URL, "USER_SERVICE")
+post_service = ServiceClient.from_env("post-service", POST_SERVICE_URL, "POST_SERVICE")
+user_exists_cache = ExistenceCache.from_env()
+post_exists_cache = ExistenceCache.from_env()
+user_exists_batcher = ExistenceBatcher.from_env(user_service, "/api/v1/users:exists")
+post_exists_batcher = ExistenceBatcher.from_env(post_service, "/api/v1/posts:exists")
+bus = LocalBus.from_env()
+user_replica = IdReplica(on_deleted=user_exists_cache.invalidate)
+post_replica = IdReplica(on_deleted=post_exists_cache.invalidate)
+bus.subscribe("users", user_replica.apply)
+bus.subscribe("posts", post_replica.apply)
+
+user_check_seconds = EXISTENCE_CHECK_SECONDS.labels("user")
+post_check_seconds = EXISTENCE_CHECK_SECONDS.labels("post")
+
+async def verify_user_exists(user_id: int):
+    with user_check_seconds.time(), traced("verify_user_exists"):
+        # Replicated from user-service's events: no upstream call needed
+        if user_id in user_replica:
+            return True
+        try:
+            return await user_exists_cache.get_or_load(
+                user_id, lambda: user_exists_batcher.exists(user_id)
+            )
+        except UpstreamUnavailable:
+            return False
+
+async def verify_post_exists(post_id: int):
+    with post_check_seconds.time(), traced("verify_post_exists"):
+        if post_id in post_replica:
+            return True
+        try:
+            return await post_exists_cache.get_or_load(
+                post_id, lambda: post_exists_batcher.exists(post_id)
+            )
+        except UpstreamUnavailable:
+            return False
+
+@router.on_event("startup")
+async def start_events():
+    await bus.start()
+
+@router.on_event("shutdown")
+async def close_clients():
+    await bus.close()
+    await user_service.aclose()
+    await post_service.aclose()
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    return {"users": user_exists_cache.stats(), "posts": post_exists_cache.stats()}
+
+@router.delete("/cache/users/{user_id}")
+async def invalidate_user(user_id: int):
+    return {"invalidated": user_exists_cache.invalidate(user_id)}
+
+@router.delete("/cache/posts/{post_id}")
+async def invalidate_post(post_id: int):
+    return {"invalidated": post_exists_cache.invalidate(post_id)}
+
+# ON CONFLICT DO UPDATE, by dialect; the counters need one of these
+COUNT_UPSERTS = {"postgresql": pg_insert, "sqlite": sqlite_insert}
+
+@router.on_event("startup")
+async def check_counts_dialect():
+    """Refuse to start on a database the counters cannot be kept in, rather than fail every write"""
+    dialect = engine.dialect.name
+    if dialect not in COUNT_UPSERTS:
+        raise RuntimeError(
+            f"comment counters need an ON CONFLICT upsert, which {dialect} lacks; "
+            f"use one of {', '.join(COUNT_UPSERTS)}"
+        )
+
+async def _bump_counts(db: AsyncSession, comments: Iterable, step: int):
+    """Add ``step`` to the post and author counters of each comment, in db's transaction.
+
+    Each counter row stays locked until the transaction commits, so
+    writes to one popular post queue on its row. With group commit a
+    group's comments add up to one update per counter, so a hot post's
+    row is taken once per group rather than once per comment.
+    """
+    deltas = Counter()
+    for comment in comments:
+        deltas["post", comment.post_id] += step
+        deltas["author", comment.author_id] += step
+    if not deltas:
+        return
+    # One ON CONFLICT upsert for every counter touched (the dialect is
+    # checked at startup). Rows go in key order, so two transactions lock
+    # shared counters in the same order and cannot deadlock
+    stmt = COUNT_UPSERTS[db.bind.dialect.name](models.CommentCount)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.CommentCount.scope, models.CommentCount.owner_id],
+        set_={"count": models.CommentCount.count + stmt.excluded.count},
+    )
+    await db.execute(stmt, [
+        {"scope": scope, "owner_id": owner_id, "count": count}
+        for (scope, owner_id), count in sorted(deltas.items())
+    ])
+
+async def _insert_comments(db: AsyncSession, rows: List[dict]) -> list:
+    """Insert ``rows`` and bump their counters in db's transaction, not committed"""
+    # Single multi-row INSERT ... RETURNING
+    created = await insert_returning(db, models.Comment, rows)
+    await _bump_counts(db, created, 1)
+    return created
 
-def verify_user_exists(user_id: int):
-    try:
-        response = requests.get(f"{USER_SERVICE_URL}/api/v1/users/{user_id}")
-        return response.status_code == 200
-    except requests.exceptions.RequestException:
-        return False
+async def _commit_comments(rows: List[dict]) -> list:
+    async with SessionLocal() as db:
+        created = await _insert_comments(db, rows)
+        await db.commit()
+    return created
 
-def verify_post_exists(post_id: int):
-    try:
-        response = requests.get(f"{POST_SERVICE_URL}/api/v1/posts/{post_id}")
-        return response.status_code == 200
-    except requests.exceptions.RequestException:
-        return False
+# With COMMENT_GROUP_COMMIT on, single comments from concurrent requests
+# share a transaction (see writer.py); None means one commit per request
+comment_writer = GroupCommitWriter.from_env(_commit_comments)
+
+@router.on_event("shutdown")
+async def close_writer():
+    if comment_writer is not None:
+        await comment_writer.close()
 
 @router.post("/comments", response_model=schemas.Comment)
-def create_comment(comment: schemas.CommentCreate, db: Session = Depends(get_db)):
-    # Verify user and post exist
-    if not verify_user_exists(comment.author_id):
+async def create_comment(comment: schemas.CommentCreate, db: AsyncSession = Depends(get_db)):
+    # Verify user and post exist, concurrently
+    author_found, post_found = await asyncio.gather(
+        verify_user_exists(comment.author_id),
+        verify_post_exists(comment.post_id),
+    )
+    if not author_found:
         raise HTTPException(status_code=400, detail="Author not found")
-    if not verify_post_exists(comment.post_id):
+    if not post_found:
         raise HTTPException(status_code=400, detail="Post not found")
     
-    db_comment = models.Comment(**comment.model_dump())
-    db.add(db_comment)
-    db.commit()
-    db.refresh(db_comment)
+    if comment_writer is not None:
+        # Acknowledged once the group holding it has committed
+        db_comment = await comment_writer.write(comment.model_dump())
+        bus.publish("comments", CREATED, db_comment.id)
+        return db_comment
+    
+    # Server defaults come back through RETURNING, no refresh needed
+    db_comment = await db.scalar(insert(models.Comment).values(**comment.model_dump()).returning(models.Comment))
+    await _bump_counts(db, [db_comment], 1)
+    await db.commit()
+    bus.publish("comments", CREATED, db_comment.id)
     return db_comment
 
+@router.post("/comments/bulk", response_model=schemas.BulkResponse)
+async def create_comments_bulk(items: List[Dict[str, Any]] = Body(..., max_length=BULK_MAX_ITEMS), db: AsyncSession = Depends(get_db)):
+    valid, results = validate_items(schemas.CommentCreate, items)
+    
+    author_ids = list({comment.author_id for _, comment in valid})
+    post_ids = list({comment.post_id for _, comment in valid})
+    checks = await asyncio.gather(
+        *map(verify_user_exists, author_ids), *map(verify_post_exists, post_ids)
+    )
+    authors_found = dict(zip(author_ids, checks[:len(author_ids)]))
+    posts_found = dict(zip(post_ids, checks[len(author_ids):]))
+    
+    accepted = []
+    for index, comment in valid:
+        if not authors_found[comment.author_id]:
+            results.append(item_error(index, 400, "Author not found"))
+        elif not posts_found[comment.post_id]:
+            results.append(item_error(index, 400, "Post not found"))
+        else:
+            accepted.append((index, comment))
+    
+    if accepted:
+        # One transaction for the whole batch
+        created = await _insert_comments(db, [c.model_dump() for _, c in accepted])
+        results.extend(item_created(index, comment) for (index, _), comment in zip(accepted, created))
+        await db.commit()
+        bus.publish_many("comments", CREATED, [comment.id for comment in created])
+    return summarize(results)
+
+@router.post("/comments:counts", response_model=schemas.CountsResponse)
+async def count_comments(request: schemas.CountsRequest, db: AsyncSession = Depends(get_db)):
+    """Comment totals for many posts and authors from one primary-key lookup"""
+    counts = {"post": dict.fromkeys(request.post_ids, 0), "author": dict.fromkeys(request.author_ids, 0)}
+    keys = [("post", i) for i in counts["post"]] + [("author", i) for i in counts["author"]]
+    if keys:
+        rows = await db.execute(select(models.CommentCount).where(
+            tuple_(models.CommentCount.scope, models.CommentCount.owner_id).in_(keys)
+        ))
+        for row in rows.scalars():
+            counts[row.scope][row.owner_id] = row.count
+    return {"posts": counts["post"], "authors": counts["author"]}
+
+def _search_comments(dialect: str, terms: List[str]):
+    """Comments containing every term with a relevance score, best first"""
+    if dialect == "postgresql":
+        vector = models.search_vector()
+        query = func.plainto_tsquery(models.SEARCH_CONFIG, " ".join(terms))
+        # Normalisation 1 divides by log(document length), as BM25 does
+        score = func.ts_rank_cd(vector, query, 1)
+        stmt = select(models.Comment, score.label("score")).where(vector.op("@@")(query))
+        return stmt.order_by(score.desc(), models.Comment.id)
+    if dialect == "sqlite":
+        # FTS5 ranks with BM25 natively; lower bm25() is better
+        rank = func.bm25(literal_column("comments_fts"))
+        match = " ".join(f'"{term}"' for term in terms)
+        stmt = select(models.Comment, (-rank).label("score"))
+        stmt = stmt.join(models.comments_fts, models.comments_fts.c.rowid == models.Comment.id)
+        return stmt.where(literal_column("comments_fts").op("MATCH")(match)).order_by(rank, models.Comment.id)
+    # No full-text index on this backend: unranked substring scan
+    return select(models.Comment, literal(0.0).label("score")).where(and_(*(
+        func.lower(models.Comment.content).contains(term, autoescape=True) for term in terms
+    ))).order_by(models.Comment.id)
+
+@router.get("/comments/search", response_model=schemas.CommentSearchResponse)
+async def search_comments(q: str = Query(..., min_length=1, max_length=256), offset: int = Query(0, ge=0), limit: int = Query(DEFAULT_SEARCH_LIMIT, ge=1, le=MAX_SEARCH_LIMIT), db: AsyncSession = Depends(get_db)):
+    terms = list(dict.fromkeys(tokenize(q)))
+    if not terms:
+        return {"total": 0, "results": []}
+    stmt = _search_comments(db.bind.dialect.name, terms)
+    total = await db.scalar(select(func.count()).select_from(stmt.order_by(None).subquery()))
+    rows = (await db.execute(stmt.offset(offset).limit(limit))).all()
+    results = [{**schemas.Comment.model_validate(comment).model_dump(), "score": score} for comment, score in rows]
+    return {"total": total, "results": results}
+
 @router.get("/comments/post/{post_id}", response_model=List[schemas.Comment])
-def get_comments_by_post(post_id: int, db: Session = Depends(get_db)):
-    comments = db.query(models.Comment).filter(models.Comment.post_id == post_id).all()
-    return comments
+async def get_comments_by_post(post_id: int, request: Request, response: Response, cursor: Optional[str] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), db: AsyncSession = Depends(get_db)):
+    # Keyset pagination on the (post_id, created_at, id) index
+    stmt = select(models.Comment).where(models.Comment.post_id == post_id)
+    if cursor:
+        stmt = stmt.where(tuple_(models.Comment.created_at, models.Comment.id) > decode_cursor(cursor))
+    stmt = stmt.order_by(models.Comment.created_at, models.Comment.id).limit(limit + 1)
+    comments = (await db.scalars(stmt)).all()
+    # Comments are never edited, so ids and timestamps pin the page down
+    check_not_modified(request, response, make_etag("comments", [(c.id, row_version(c)) for c in comments]))
+    return comment_list.response(paginate(response, comments, limit), response)
+
+async def _stream_comments():
+    # Own session so it lives as long as the response body, not the handler
+    async with SessionLocal() as db:
+        stmt = select(models.Comment).order_by(models.Comment.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+        async for comment in await db.stream_scalars(stmt):
+            yield comment
+
+@router.get("/comments/export")
+async def export_comments():
+    """Full collection as NDJSON from a server-side cursor"""
+    encode = lambda comment: schemas.Comment.model_validate(comment).model_dump_json()
+    return StreamingResponse(ndjson_astream(_stream_comments(), encode), media_type=NDJSON_MEDIA_TYPE)
 
 @router.get("/comments/{comment_id}", response_model=schemas.Comment)
-def get_comment(comment_id: int, db: Session = Depends(get_db)):
-    comment = db.query(models.Comment).filter(models.Comment.id == comment_id).first()
+async def get_comment(comment_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    comment = await db.get(models.Comment, comment_id)
     if not comment:
         raise HTTPException(status_code=404, detail="Comment not found")
+    check_not_modified(request, response, make_etag("comment", comment_id, row_version(comment)))
     return comment
 
 @router.delete("/comments/{comment_id}")
-def delete_comment(comment_id: int, db: Session = Depends(get_db)):
-    comment = db.query(models.Comment).filter(models.Comment.id == comment_id).first()
-    if not comment:
+async def delete_comment(comment_id: int, db: AsyncSession = Depends(get_db)):
+    stmt = delete(models.Comment).where(models.Comment.id == comment_id)
+    deleted = (await db.execute(stmt.returning(models.Comment.post_id, models.Comment.author_id))).first()
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Comment not found")
-    
-    db.delete(comment)
-    db.commit()
+    await _bump_counts(db, [deleted], -1)
+    await db.commit()
+    bus.publish("comments", DELETED, comment_id)
     return {"message": "Comment deleted successfully"}
\ No newline at end of file
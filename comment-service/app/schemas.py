@@ -1,5 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
+from typing import Dict, List, Optional
 
 class CommentBase(BaseModel):
     content: str
@@ -15,4 +16,30 @@ class Comment(CommentBase):
     created_at: datetime
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class CommentHit(Comment):
+    score: float
+
+class CommentSearchResponse(BaseModel):
+    total: int
+    results: List[CommentHit]
+
+class CountsRequest(BaseModel):
+    post_ids: List[int] = Field([], max_length=10000)
+    author_ids: List[int] = Field([], max_length=10000)
+
+class CountsResponse(BaseModel):
+    posts: Dict[int, int]
+    authors: Dict[int, int]
+
+class BulkItemResult(BaseModel):
+    index: int
+    status: int
+    item: Optional[Comment] = None
+    error: Optional[str] = None
+
+class BulkResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[BulkItemResult]
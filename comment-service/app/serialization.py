@@ -0,0 +1,92 @@
+import json
+import os
+from contextvars import ContextVar
+from typing import Any, List, Sequence, Type
+
+from fastapi import Response
+from pydantic import BaseModel, TypeAdapter
+from typing_extensions import TypedDict
+
+try:
+    import orjson
+except ImportError:  # optional, pydantic-core encodes everything without it
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional, every response is JSON without it
+    msgpack = None
+
+# With this off, list endpoints return their items for FastAPI to validate
+# against response_model again, item by item
+FAST_SERIALIZATION = os.getenv("FAST_SERIALIZATION", "true").lower() in ("1", "true", "yes")
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+# Set by MessagePackMiddleware for requests whose Accept prefers MessagePack
+prefer_msgpack: ContextVar[bool] = ContextVar("prefer_msgpack", default=False)
+
+
+def json_to_msgpack(body: bytes) -> bytes:
+    """Re-encode a JSON body as MessagePack"""
+    return msgpack.packb(orjson.loads(body) if orjson is not None else json.loads(body))
+
+
+def decode_body(content: bytes, content_type: str) -> Any:
+    """A response body as Python objects, whether JSON or MessagePack"""
+    if content_type.startswith(MSGPACK_MEDIA_TYPE) and msgpack is not None:
+        return msgpack.unpackb(content)
+    return orjson.loads(content) if orjson is not None else json.loads(content)
+
+
+class ListEncoder:
+    """Encodes a list response straight to JSON bytes, without validation.
+
+    FastAPI validates a returned list against ``response_model`` item by
+    item, converts it back to Python objects and only then encodes it. The
+    records a service reads back from its own store are already valid, so
+    this skips all of that. A TypeAdapter over a TypedDict with the
+    model's fields is compiled once per model and writes exactly those
+    fields. Dicts from the in-memory store hold exactly those fields
+    already, so they are dumped by orjson as they are when it is installed.
+    """
+
+    def __init__(self, model: Type[BaseModel]):
+        self.fields = tuple(model.model_fields)
+        shape = TypedDict(f"{model.__name__}Shape", {
+            name: field.annotation for name, field in model.model_fields.items()
+        })
+        self._adapter = TypeAdapter(List[shape])
+
+    def encode(self, items: Sequence) -> bytes:
+        if items and not isinstance(items[0], dict):
+            # ORM rows: read off just the response fields
+            fields = self.fields
+            items = [{name: getattr(item, name) for name in fields} for item in items]
+        elif orjson is not None:
+            return orjson.dumps(items)
+        return self._adapter.dump_json(items)
+
+    def encode_msgpack(self, items: Sequence) -> bytes:
+        """MessagePack of exactly what ``encode`` would write as JSON"""
+        if items and not isinstance(items[0], dict):
+            fields = self.fields
+            items = [{name: getattr(item, name) for name in fields} for item in items]
+            # Datetimes become the same strings the JSON carries
+            items = self._adapter.dump_python(items, mode="json")
+        return msgpack.packb(items)
+
+    def response(self, items: Sequence, response: Response):
+        """What a list endpoint returns: pre-encoded JSON (or MessagePack,
+        when the client asked for it) carrying the headers set on
+        ``response``, or ``items`` with the fast path off
+        """
+        if not FAST_SERIALIZATION:
+            return items
+        if prefer_msgpack.get() and msgpack is not None:
+            # Straight to MessagePack, not via JSON and back
+            encoded = Response(self.encode_msgpack(items), media_type=MSGPACK_MEDIA_TYPE)
+        else:
+            encoded = Response(self.encode(items), media_type="application/json")
+        encoded.headers.raw.extend(response.headers.raw)
+        return encoded
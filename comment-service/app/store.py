@@ -0,0 +1,432 @@
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import islice
+from threading import RLock
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from .columns import IdArray, RecordTable
+
+
+class DuplicateKeyError(Exception):
+    """Raised when an insert or update would break a unique index"""
+
+    def __init__(self, field: str, value):
+        super().__init__(f"{field} {value!r} already exists")
+        self.field = field
+        self.value = value
+
+    def __reduce__(self):
+        # Keep it picklable, so it crosses process boundaries (see shared.py)
+        return type(self), (self.field, self.value)
+
+
+class IdList:
+    """Ascending list of ids with O(1) removal and O(log n) seek.
+
+    Removed ids stay in the list as tombstones, recognised through the
+    ``alive`` predicate the caller passes in, and are swept out once they
+    outnumber the live ids. Ids are allocated in increasing order, so
+    appends keep the list sorted. They are kept in an ``array('q')``, 8
+    bytes each, rather than as int objects in a list.
+    """
+
+    __slots__ = ("ids", "size")
+
+    def __init__(self):
+        self.ids = array("q")
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def add(self, record_id: int):
+        ids = self.ids
+        if not ids or record_id > ids[-1]:
+            ids.append(record_id)
+        else:
+            # Re-added after an update moved it away and back
+            position = bisect_left(ids, record_id)
+            if position == len(ids) or ids[position] != record_id:
+                ids.insert(position, record_id)
+        self.size += 1
+
+    def discard(self, alive: Callable[[int], bool]):
+        self.size -= 1
+        if self.size * 2 < len(self.ids):
+            self.ids = array("q", [record_id for record_id in self.ids if alive(record_id)])
+
+    def after(self, record_id: int, alive: Callable[[int], bool]) -> Iterator[int]:
+        """Yield the live ids greater than ``record_id``, in order"""
+        ids = self.ids
+        for position in range(bisect_right(ids, record_id), len(ids)):
+            candidate = ids[position]
+            if alive(candidate):
+                yield candidate
+
+
+class _Records(dict):
+    """Records as the dicts they are, with RecordTable's extra methods"""
+
+    def value(self, record_id: int, field: str, default=None):
+        record = self.get(record_id)
+        return default if record is None else record.get(field, default)
+
+    def rows(self, record_ids: List[int]) -> List[dict]:
+        return [self[record_id] for record_id in record_ids if record_id in self]
+
+    def frozen(self) -> "_Records":
+        return _Records(self)
+
+
+# Never equal to a stored value
+_MISSING = object()
+
+
+def _table_rows(table: RecordTable, batch_size: int = 1000) -> Iterator[dict]:
+    """The records of ``table`` in id order, decoded a page at a time"""
+    ids = iter(table)
+    while True:
+        batch = list(islice(ids, batch_size))
+        if not batch:
+            return
+        yield from table.rows(batch)
+
+
+class IndexedStore:
+    """In-memory record store keyed by id, with secondary indexes.
+
+    Records are dicts. With a ``columns`` layout (see columns.py) they are
+    kept column by column in a RecordTable, and read back as equal dicts,
+    at a fraction of the memory. ``unique`` fields map a value to exactly one id
+    (username, email), ``indexed`` fields map a value to an IdList of every
+    id sharing it (author_id, post_id). Lookups, inserts and deletes are
+    O(1), and pages are read by seeking to the cursor id, so a deep page
+    costs the same as the first. Mutations hold a lock because the sync
+    endpoints run concurrently in the threadpool.
+
+    Stored records are never modified in place: an update swaps in a new
+    dict. Every write also stamps a version on the record and on the
+    collections it belongs to (the whole store, and its bucket of each
+    indexed field), which callers use as ETags. With a ``journal`` set, every mutation is passed to its
+    ``append`` as a tuple, under the lock, so the journal sees mutations
+    in the order they were applied. The write then waits on the journal's
+    ``sync`` with what ``append`` returned, outside the lock, and returns
+    only once the mutation is durable (see persistence.py).
+    """
+
+    def __init__(self, unique: Iterable[str] = (), indexed: Iterable[str] = (), journal=None,
+                 columns: Optional[Dict[str, str]] = None):
+        self.journal = journal
+        self._records = RecordTable(columns) if columns else _Records()
+        self._order = IdList()
+        self._unique: Dict[str, Dict[object, int]] = {field: {} for field in unique}
+        self._multi: Dict[str, Dict[object, IdList]] = {field: {} for field in indexed}
+        self._next_id = 1
+        self._lock = RLock()
+        # Versions count up from the wall clock at startup, so they keep
+        # increasing across restarts. Records and collections nobody has
+        # written to since then share the base version.
+        self._clock = self._base_version = time.time_ns()
+        self._versions = IdArray() if columns else {}
+        self._collection_versions: Dict[tuple, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, record_id: int) -> bool:
+        return record_id in self._records
+
+    def __iter__(self) -> Iterator[dict]:
+        return iter(self._records.values())
+
+    def all(self) -> List[dict]:
+        return list(self._records.values())
+
+    def page(self, after_id: int = 0, limit: int = 100, field: Optional[str] = None, value=None) -> List[dict]:
+        """Return up to ``limit`` records with ids above ``after_id``, in id order.
+
+        With ``field`` set, only records whose indexed ``field`` equals
+        ``value`` are returned.
+        """
+        if field is None:
+            ids, alive = self._order, self._records.__contains__
+        else:
+            ids = self._multi[field].get(value)
+            if ids is None:
+                return []
+            alive = self._bucket_alive(field, value)
+        return self._records.rows(list(islice(ids.after(after_id, alive), limit)))
+
+    def scan(self, batch_size: int = 1000, field: Optional[str] = None, value=None) -> Iterator[dict]:
+        """Iterate every record in id order, one page at a time.
+
+        Safe against concurrent writes: each page is a fresh seek past the
+        last id seen, rather than a live view of the underlying dict.
+        """
+        after_id = 0
+        while True:
+            records = self.page(after_id, batch_size, field, value)
+            yield from records
+            if len(records) < batch_size:
+                return
+            after_id = records[-1]["id"]
+
+    def get(self, record_id: int) -> Optional[dict]:
+        return self._records.get(record_id)
+
+    def get_versioned(self, record_id: int) -> Optional[Tuple[dict, int]]:
+        """Return a record together with its version, or None.
+
+        Writers store the record before its version and this reads them in
+        the opposite order, so a racing write can only pair a newer record
+        with an older version, never tag a stale record as current.
+        """
+        version = self._versions.get(record_id, self._base_version)
+        record = self._records.get(record_id)
+        return None if record is None else (record, version)
+
+    def collection_version(self, field: Optional[str] = None, value=None) -> int:
+        """Version of the whole store, or of the records whose indexed
+        ``field`` equals ``value``. Read it before the records it covers.
+        """
+        key = () if field is None else (field, value)
+        return self._collection_versions.get(key, self._base_version)
+
+    def get_many(self, record_ids: Iterable[int]) -> Dict[int, dict]:
+        """The stored records among ``record_ids``, keyed by id"""
+        records = self._records
+        return {i: records[i] for i in record_ids if i in records}
+
+    def get_by(self, field: str, value) -> Optional[dict]:
+        """Look a record up through a unique index"""
+        record_id = self._unique[field].get(value)
+        if record_id is None:
+            return None
+        return self._records[record_id]
+
+    def find(self, field: str, value) -> List[dict]:
+        """Return every record whose indexed ``field`` equals ``value``"""
+        ids = self._multi[field].get(value)
+        if ids is None:
+            return []
+        return [self._records[i] for i in ids.after(0, self._bucket_alive(field, value))]
+
+    def count(self, field: str, value) -> int:
+        ids = self._multi[field].get(value)
+        return 0 if ids is None else len(ids)
+
+    def insert(self, record: dict) -> dict:
+        """Store ``record`` under the next id and return the stored copy"""
+        with self._lock:
+            self._check_unique(record)
+            record = {"id": self._next_id, **record}
+            self._next_id += 1
+            self._add(record)
+            logged = self._log(("insert", record))
+        self._sync(logged)
+        return record
+
+    def insert_many(self, records: Iterable[dict]) -> List[Union[dict, DuplicateKeyError]]:
+        """Insert a batch under one lock acquisition.
+
+        Returns one entry per input, in order: the stored record, or the
+        DuplicateKeyError that rejected it. A duplicate inside the batch
+        itself is rejected like one already in the store.
+        """
+        results: List[Union[dict, DuplicateKeyError]] = []
+        with self._lock:
+            for record in records:
+                try:
+                    self._check_unique(record)
+                except DuplicateKeyError as exc:
+                    results.append(exc)
+                    continue
+                record = {"id": self._next_id, **record}
+                self._next_id += 1
+                self._add(record)
+                results.append(record)
+            stored = [record for record in results if isinstance(record, dict)]
+            logged = self._log(("insert_many", stored)) if stored else None
+        self._sync(logged)
+        return results
+
+    def update(self, record_id: int, changes: dict) -> Optional[dict]:
+        """Apply ``changes`` to a record, keeping the indexes in step"""
+        with self._lock:
+            record = self._apply_update(record_id, changes)
+            logged = self._log(("update", record_id, changes)) if record is not None else None
+        self._sync(logged)
+        return record
+
+    def delete(self, record_id: int) -> Optional[dict]:
+        with self._lock:
+            record = self._apply_delete(record_id)
+            logged = self._log(("delete", record_id)) if record is not None else None
+        self._sync(logged)
+        return record
+
+    def replay(self, entry: Tuple):
+        """Apply one journal entry without journaling it again"""
+        with self._lock:
+            op = entry[0]
+            if op == "insert":
+                self._restore(entry[1])
+            elif op == "insert_many":
+                for record in entry[1]:
+                    self._restore(record)
+            elif op == "update":
+                self._apply_update(entry[1], entry[2])
+            elif op == "delete":
+                self._apply_delete(entry[1])
+            else:
+                raise ValueError(f"Unknown journal entry {op!r}")
+
+    def restore(self, records: Union[Iterable[dict], RecordTable], next_id: int = 1):
+        """Load records that already carry their ids, e.g. from a snapshot.
+
+        Records arriving in ascending id order past everything stored take
+        a fast path that appends straight onto the indexes. A RecordTable
+        of this store's layout, restored into an empty store, is taken
+        over as it is and only indexed.
+        """
+        with self._lock:
+            adopted = False
+            if isinstance(records, RecordTable):
+                if (isinstance(self._records, RecordTable) and not self._records
+                        and records.layout == self._records.layout):
+                    self._records, adopted = records, True
+                records = _table_rows(records)
+            stored = self._records
+            order = self._order
+            unique = list(self._unique.items())
+            multi = list(self._multi.items())
+            last_id = order.ids[-1] if order.ids else 0
+            for record in records:
+                record_id = record["id"]
+                if record_id <= last_id:
+                    self._restore(record)
+                    continue
+                if not adopted:
+                    stored[record_id] = record
+                order.ids.append(record_id)
+                order.size += 1
+                for field, index in unique:
+                    index[record[field]] = record_id
+                for field, index in multi:
+                    ids = index.get(record[field])
+                    if ids is None:
+                        ids = index[record[field]] = IdList()
+                    ids.ids.append(record_id)
+                    ids.size += 1
+                last_id = record_id
+            self._next_id = max(self._next_id, next_id, last_id + 1)
+            # Everything not stamped individually moves to a new base version
+            self._base_version = self._stamp()
+            self._collection_versions.clear()
+
+    def checkpoint(self, mark: Callable[[], Any]) -> Tuple[Any, int, Union[List[dict], RecordTable]]:
+        """Run ``mark`` and copy out the store at the same instant.
+
+        No write can land between the two, so a snapshot of the returned
+        records plus every journal entry after ``mark`` is exactly the
+        store. Only a frozen copy of the records is taken under the lock,
+        shallow for dicts and column by column for a RecordTable, so the
+        lock is held only briefly.
+        """
+        with self._lock:
+            marked, next_id, records = mark(), self._next_id, self._records.frozen()
+        # A RecordTable is snapshotted column by column, as it is
+        return marked, next_id, records if isinstance(records, RecordTable) else list(records.values())
+
+    def _log(self, entry: Tuple):
+        """Journal ``entry`` (under the lock), returning what ``_sync`` waits on"""
+        if self.journal is None:
+            return None
+        return self.journal, self.journal.append(entry)
+
+    @staticmethod
+    def _sync(logged):
+        """Wait, outside the lock, until a journaled mutation is durable"""
+        if logged is not None:
+            journal, sequence = logged
+            journal.sync(sequence)
+
+    def _restore(self, record: dict):
+        if record["id"] in self._records:
+            self._apply_delete(record["id"])
+        self._add(record)
+        self._next_id = max(self._next_id, record["id"] + 1)
+
+    def _apply_update(self, record_id: int, changes: dict) -> Optional[dict]:
+        old = self._records.get(record_id)
+        if old is None:
+            return None
+        self._check_unique(changes, record_id)
+        record = {**old, **changes}
+        self._records[record_id] = record
+        version = self._versions[record_id] = self._collection_versions[()] = self._stamp()
+        for field, index in self._unique.items():
+            if field in changes and record[field] != old[field]:
+                if index.get(old[field]) == record_id:
+                    del index[old[field]]
+                index[record[field]] = record_id
+        for field in self._multi:
+            if field in changes and record[field] != old[field]:
+                self._drop_from_bucket(field, old[field])
+                self._multi[field].setdefault(record[field], IdList()).add(record_id)
+                self._collection_versions[field, old[field]] = version
+            self._collection_versions[field, record[field]] = version
+        return record
+
+    def _apply_delete(self, record_id: int) -> Optional[dict]:
+        record = self._records.pop(record_id, None)
+        if record is None:
+            return None
+        self._order.discard(self._records.__contains__)
+        self._versions.pop(record_id, None)
+        version = self._collection_versions[()] = self._stamp()
+        for field, index in self._unique.items():
+            if index.get(record[field]) == record_id:
+                del index[record[field]]
+        for field in self._multi:
+            self._drop_from_bucket(field, record[field])
+            self._collection_versions[field, record[field]] = version
+        return record
+
+    def _check_unique(self, values: dict, record_id: Optional[int] = None):
+        for field, index in self._unique.items():
+            if field not in values:
+                continue
+            owner = index.get(values[field])
+            if owner is not None and owner != record_id:
+                raise DuplicateKeyError(field, values[field])
+
+    def _add(self, record: dict):
+        record_id = record["id"]
+        self._records[record_id] = record
+        self._order.add(record_id)
+        version = self._versions[record_id] = self._collection_versions[()] = self._stamp()
+        for field, index in self._unique.items():
+            index[record[field]] = record_id
+        for field, index in self._multi.items():
+            index.setdefault(record[field], IdList()).add(record_id)
+            self._collection_versions[field, record[field]] = version
+
+    def _stamp(self) -> int:
+        self._clock += 1
+        return self._clock
+
+    def _bucket_alive(self, field: str, value) -> Callable[[int], bool]:
+        read = self._records.value
+
+        def alive(record_id: int) -> bool:
+            return read(record_id, field, _MISSING) == value
+
+        return alive
+
+    def _drop_from_bucket(self, field: str, value):
+        ids = self._multi[field][value]
+        ids.discard(self._bucket_alive(field, value))
+        if not ids:
+            del self._multi[field][value]
@@ -0,0 +1,121 @@
+import asyncio
+import contextvars
+import logging
+import os
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Rows per committed group
+GROUP_ROWS = REGISTRY.histogram(
+    "group_commit_rows", "Rows written per group commit", buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+).labels()
+GROUP_SECONDS = REGISTRY.histogram("group_commit_duration_seconds", "Time to write and commit one group").labels()
+
+
+class GroupCommitWriter:
+    """Writes rows in grouped transactions, one commit for many callers.
+
+    ``write(row)`` queues the row and waits; a single background task
+    takes whatever is queued ``window`` seconds after the first row (or
+    as soon as ``max_batch`` rows are), hands it to ``flush`` as one
+    transaction and resolves every waiter with its own result once that
+    transaction has committed. So a caller is acknowledged exactly when
+    it would be by a commit of its own, but a burst of N writes pays for
+    one commit, and one fsync, instead of N. Behind AdmissionMiddleware
+    a group is also bounded by ADMISSION_CONCURRENCY, since no more
+    requests than that are in handlers to queue rows.
+
+    The queue holds at most ``max_queue`` rows; past that, writers wait
+    for room, which pushes back on the clients rather than growing
+    memory. If a group fails, its rows are retried one transaction
+    each, so one bad row fails only its own caller.
+    """
+
+    def __init__(self, flush: Callable[[List[Any]], Awaitable[List[Any]]], window: float = 0.002,
+                 max_batch: int = 500, max_queue: int = 10000):
+        self.flush = flush
+        self.window = window
+        self.max_batch = max_batch
+        self._queue: "asyncio.Queue[Tuple[Any, asyncio.Future]]" = asyncio.Queue(max_queue)
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls, flush: Callable[[List[Any]], Awaitable[List[Any]]]) -> Optional["GroupCommitWriter"]:
+        """A writer when COMMENT_GROUP_COMMIT is on, else None (one commit per request)"""
+        if os.getenv("COMMENT_GROUP_COMMIT", "false").lower() not in ("1", "true", "yes"):
+            return None
+        return cls(
+            flush,
+            window=float(os.getenv("COMMENT_GROUP_COMMIT_WINDOW_MS", "2")) / 1000,
+            max_batch=int(os.getenv("COMMENT_GROUP_COMMIT_MAX", "500")),
+            max_queue=int(os.getenv("COMMENT_GROUP_COMMIT_QUEUE", "10000")),
+        )
+
+    async def write(self, row: Any) -> Any:
+        """``flush``'s result for ``row``, once it is committed"""
+        if self._task is None or self._task.done():
+            # A context of its own, or every statement the writer runs
+            # would be traced and counted as part of this first request
+            self._task = asyncio.get_running_loop().create_task(self._run(), context=contextvars.Context())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((row, future))
+        return await future
+
+    async def close(self):
+        """Commit what is queued, then stop"""
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            if queue.qsize() < self.max_batch - 1:
+                # Let the rest of the burst arrive
+                await asyncio.sleep(self.window)
+            while len(batch) < self.max_batch and not queue.empty():
+                batch.append(queue.get_nowait())
+            try:
+                await self._commit(batch)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    async def _commit(self, batch: List[Tuple[Any, asyncio.Future]]):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        try:
+            results = await self.flush([row for row, _ in batch])
+        except Exception as exc:
+            if len(batch) == 1:
+                self._resolve(batch[0][1], exc=exc)
+                return
+            logger.warning("Group of %d rows failed (%r), retrying one by one", len(batch), exc)
+            for item in batch:
+                await self._commit([item])
+            return
+        GROUP_ROWS.observe(len(batch))
+        GROUP_SECONDS.observe(loop.time() - start)
+        for (_, future), result in zip(batch, results):
+            self._resolve(future, result)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, result: Any = None, exc: Optional[BaseException] = None):
+        # The caller may have gone away (client disconnect); its row is
+        # committed all the same, as it would be with a commit of its own
+        if future.done():
+            return
+        if exc is not None:
+            future.set_exception(exc)
+        else:
+            future.set_result(result)
@@ -0,0 +1,33 @@
+"""comments table, as the first release created it
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases from before migrations already have it: adopt them as they are
+    if sa.inspect(op.get_bind()).has_table("comments"):
+        return
+    op.create_table(
+        "comments",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("content", sa.Text(), nullable=False),
+        sa.Column("post_id", sa.Integer(), nullable=False),
+        sa.Column("author_id", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index("ix_comments_id", "comments", ["id"])
+
+
+def downgrade():
+    op.drop_index("ix_comments_id", table_name="comments")
+    op.drop_table("comments")
@@ -0,0 +1,50 @@
+"""Full-text search: a GIN index on PostgreSQL, an FTS5 table on SQLite
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+SQLITE_FTS = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS comments_fts USING fts5(content, content='comments', content_rowid='id')",
+    """CREATE TRIGGER IF NOT EXISTS comments_fts_insert AFTER INSERT ON comments BEGIN
+        INSERT INTO comments_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS comments_fts_delete AFTER DELETE ON comments BEGIN
+        INSERT INTO comments_fts(comments_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS comments_fts_update AFTER UPDATE OF content ON comments BEGIN
+        INSERT INTO comments_fts(comments_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO comments_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+    # Index the rows written before the triggers existed
+    "INSERT INTO comments_fts(comments_fts) VALUES ('rebuild')",
+)
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == "postgresql":
+        op.execute(
+            "CREATE INDEX IF NOT EXISTS ix_comments_search ON comments "
+            "USING gin (to_tsvector('english'::regconfig, content))"
+        )
+    elif dialect == "sqlite":
+        for statement in SQLITE_FTS:
+            op.execute(statement)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_comments_search")
+    elif dialect == "sqlite":
+        for trigger in ("comments_fts_insert", "comments_fts_delete", "comments_fts_update"):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS comments_fts")
@@ -0,0 +1,39 @@
+"""comment_counts: per-post and per-author totals, counted from the comments
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Made by create_all already: its counters are live, leave them be
+    if sa.inspect(op.get_bind()).has_table("comment_counts"):
+        return
+    op.create_table(
+        "comment_counts",
+        sa.Column("scope", sa.String(), primary_key=True),
+        sa.Column("owner_id", sa.Integer(), primary_key=True),
+        sa.Column("count", sa.Integer(), nullable=False),
+    )
+    # Start from the comments already stored; the write paths keep it up
+    # to date from here on
+    op.execute(
+        "INSERT INTO comment_counts (scope, owner_id, count) "
+        "SELECT 'post', post_id, count(*) FROM comments GROUP BY post_id"
+    )
+    op.execute(
+        "INSERT INTO comment_counts (scope, owner_id, count) "
+        "SELECT 'author', author_id, count(*) FROM comments GROUP BY author_id"
+    )
+
+
+def downgrade():
+    op.drop_table("comment_counts")
@@ -0,0 +1,70 @@
+"""Comment counters per post and author"""
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import event
+
+from app import database, routes
+from app.events import CREATED, IdReplica
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def known_ids(monkeypatch):
+    monkeypatch.setattr(routes, "user_replica", IdReplica())
+    monkeypatch.setattr(routes, "post_replica", IdReplica())
+    for user_id in (1, 2):
+        routes.user_replica.apply({"type": CREATED, "id": user_id})
+    for post_id in (1, 2, 3):
+        routes.post_replica.apply({"type": CREATED, "id": post_id})
+
+
+async def counts(client, post_ids, author_ids) -> dict:
+    response = await client.post("/api/v1/comments:counts", json={"post_ids": post_ids, "author_ids": author_ids})
+    assert response.status_code == 200
+    return response.json()
+
+
+async def test_counters_follow_creates_and_deletes(client):
+    await client.post("/api/v1/comments", json={"content": "a", "post_id": 1, "author_id": 1})
+    await client.post("/api/v1/comments/bulk", json=[
+        {"content": "b", "post_id": 1, "author_id": 2},
+        {"content": "c", "post_id": 2, "author_id": 2},
+        {"content": "d", "post_id": 1, "author_id": 2},
+    ])
+    assert await counts(client, [1, 2, 3], [1, 2]) == {
+        "posts": {"1": 3, "2": 1, "3": 0}, "authors": {"1": 1, "2": 3},
+    }
+    await client.delete("/api/v1/comments/2")
+    assert await counts(client, [1], [2]) == {"posts": {"1": 2}, "authors": {"2": 2}}
+
+
+async def test_no_ids_reads_nothing(client, statements):
+    assert await counts(client, [], []) == {"posts": {}, "authors": {}}
+    assert statements == []
+
+
+async def test_counter_rows_are_upserted_in_key_order(client):
+    upserts = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if "comment_counts" in statement:
+            upserts.append([tuple(row[:2]) for row in parameters])
+
+    event.listen(database.engine.sync_engine, "before_cursor_execute", record)
+    try:
+        await client.post("/api/v1/comments/bulk", json=[
+            {"content": "x", "post_id": 3, "author_id": 2},
+            {"content": "y", "post_id": 1, "author_id": 1},
+        ])
+    finally:
+        event.remove(database.engine.sync_engine, "before_cursor_execute", record)
+    assert upserts == [[("author", 1), ("author", 2), ("post", 1), ("post", 3)]]
+
+
+async def test_unsupported_dialect_is_refused_at_startup(monkeypatch):
+    await routes.check_counts_dialect()
+    monkeypatch.setattr(routes, "engine", SimpleNamespace(dialect=SimpleNamespace(name="mysql")))
+    with pytest.raises(RuntimeError, match="mysql"):
+        await routes.check_counts_dialect()
@@ -0,0 +1,91 @@
+"""Group commit: many callers, one transaction"""
+import asyncio
+
+import pytest
+
+from app import routes
+from app.events import CREATED, IdReplica
+from app.writer import GroupCommitWriter
+
+pytestmark = pytest.mark.anyio
+
+
+class Flush:
+    """Records the groups it is given; rows equal to ``bad`` fail theirs"""
+
+    def __init__(self, bad=None):
+        self.bad = bad
+        self.groups = []
+
+    async def __call__(self, rows):
+        self.groups.append(list(rows))
+        if self.bad in rows:
+            raise ValueError(self.bad)
+        return [row * 10 for row in rows]
+
+
+async def test_a_burst_is_one_group_and_each_caller_gets_its_result():
+    flush = Flush()
+    writer = GroupCommitWriter(flush, window=0.01)
+    assert await asyncio.gather(*(writer.write(i) for i in range(20))) == [i * 10 for i in range(20)]
+    assert flush.groups == [list(range(20))]
+    await writer.close()
+
+
+async def test_groups_are_capped_at_max_batch():
+    flush = Flush()
+    writer = GroupCommitWriter(flush, window=0.01, max_batch=8)
+    await asyncio.gather(*(writer.write(i) for i in range(20)))
+    assert [len(group) for group in flush.groups] == [8, 8, 4]
+    assert sum(flush.groups, []) == list(range(20))
+    await writer.close()
+
+
+async def test_a_bad_row_fails_only_its_own_caller():
+    flush = Flush(bad=3)
+    writer = GroupCommitWriter(flush, window=0.01)
+    results = await asyncio.gather(*(writer.write(i) for i in range(5)), return_exceptions=True)
+    assert results[:3] == [0, 10, 20] and results[4] == 40
+    assert isinstance(results[3], ValueError)
+    # The group, then each row on its own
+    assert flush.groups == [[0, 1, 2, 3, 4], [0], [1], [2], [3], [4]]
+    await writer.close()
+
+
+async def test_close_commits_what_is_queued():
+    flush = Flush()
+    writer = GroupCommitWriter(flush, window=0.05)
+    pending = [asyncio.ensure_future(writer.write(i)) for i in range(3)]
+    await asyncio.sleep(0)
+    await writer.close()
+    assert [task.result() for task in pending] == [0, 10, 20]
+    await writer.close()
+
+
+def test_off_unless_enabled(monkeypatch):
+    monkeypatch.delenv("COMMENT_GROUP_COMMIT", raising=False)
+    assert GroupCommitWriter.from_env(Flush()) is None
+    monkeypatch.setenv("COMMENT_GROUP_COMMIT", "true")
+    monkeypatch.setenv("COMMENT_GROUP_COMMIT_MAX", "64")
+    writer = GroupCommitWriter.from_env(Flush())
+    assert writer.max_batch == 64 and writer.window == 0.002
+
+
+async def test_concurrent_comments_share_one_insert(client, statements, monkeypatch):
+    monkeypatch.setattr(routes, "user_replica", IdReplica())
+    monkeypatch.setattr(routes, "post_replica", IdReplica())
+    routes.user_replica.apply({"type": CREATED, "id": 1})
+    routes.post_replica.apply({"type": CREATED, "id": 1})
+    writer = GroupCommitWriter(routes._commit_comments, window=0.02)
+    monkeypatch.setattr(routes, "comment_writer", writer)
+
+    responses = await asyncio.gather(*(
+        client.post("/api/v1/comments", json={"content": f"c{i}", "post_id": 1, "author_id": 1})
+        for i in range(10)
+    ))
+    await writer.close()
+    assert all(response.status_code == 200 for response in responses)
+    assert sorted(response.json()["id"] for response in responses) == list(range(1, 11))
+    assert sum(statement.startswith("INSERT INTO comments ") for statement in statements) == 1
+    counts = (await client.post("/api/v1/comments:counts", json={"post_ids": [1], "author_ids": [1]})).json()
+    assert counts == {"posts": {"1": 10}, "authors": {"1": 10}}
@@ -0,0 +1,105 @@
+"""Alembic revisions bring any database up to the models"""
+import os
+import sqlite3
+
+import httpx
+import pytest
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from fastapi import FastAPI
+from sqlalchemy import create_engine
+
+from app import database, models, routes
+from app.events import CREATED, IdReplica
+from app.pagination import NEXT_CURSOR_HEADER
+
+from .conftest import DB_FILE
+
+pytestmark = pytest.mark.anyio
+
+ALEMBIC_INI = os.path.join(os.path.dirname(__file__), "..", "alembic.ini")
+
+# comments as the first release's create_all made it
+FIRST_RELEASE = """
+CREATE TABLE comments (
+    id INTEGER NOT NULL PRIMARY KEY,
+    content TEXT NOT NULL,
+    post_id INTEGER NOT NULL,
+    author_id INTEGER NOT NULL,
+    created_at DATETIME DEFAULT (CURRENT_TIMESTAMP)
+);
+CREATE INDEX ix_comments_id ON comments (id);
+"""
+
+
+def upgrade(revision: str = "head"):
+    config = Config(ALEMBIC_INI)
+    config.set_main_option("script_location", os.path.join(os.path.dirname(ALEMBIC_INI), "migrations"))
+    config.attributes["configure_logging"] = False
+    command.upgrade(config, revision)
+    return config
+
+
+def schema_differences() -> list:
+    engine = create_engine(f"sqlite:///{DB_FILE}")
+    with engine.connect() as conn:
+        context = MigrationContext.configure(conn, opts={
+            "include_object": lambda obj, name, type_, *args: not (type_ == "table" and name.startswith("comments_fts")),
+        })
+        differences = compare_metadata(context, models.Base.metadata)
+    engine.dispose()
+    return differences
+
+
+@pytest.fixture
+async def empty_file():
+    await database.engine.dispose()
+    if os.path.exists(DB_FILE):
+        os.remove(DB_FILE)
+    yield DB_FILE
+    await database.engine.dispose()
+
+
+async def test_fresh_database_matches_the_models(empty_file):
+    upgrade()
+    assert schema_differences() == []
+
+
+async def test_downgrade_undoes_every_revision(empty_file):
+    config = upgrade()
+    command.downgrade(config, "base")
+    with sqlite3.connect(DB_FILE) as conn:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert tables == {"alembic_version"}
+
+
+async def test_first_release_database_is_upgraded(empty_file, monkeypatch):
+    with sqlite3.connect(DB_FILE) as conn:
+        conn.executescript(FIRST_RELEASE)
+        conn.executemany(
+            "INSERT INTO comments (content, post_id, author_id) VALUES (?, ?, ?)",
+            [("written before migrations", 1, 7), ("same here", 1, 8), ("elsewhere", 2, 7)],
+        )
+    upgrade()
+    assert schema_differences() == []
+
+    monkeypatch.setattr(routes, "user_replica", IdReplica())
+    monkeypatch.setattr(routes, "post_replica", IdReplica())
+    routes.user_replica.apply({"type": CREATED, "id": 7})
+    routes.post_replica.apply({"type": CREATED, "id": 1})
+    app = FastAPI()
+    app.include_router(routes.router, prefix="/api/v1")
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        # Counters start from the stored comments, then follow new ones
+        await client.post("/api/v1/comments", json={"content": "new", "post_id": 1, "author_id": 7})
+        counts = await client.post("/api/v1/comments:counts", json={"post_ids": [1, 2], "author_ids": [7, 8]})
+        assert counts.json() == {"posts": {"1": 3, "2": 1}, "authors": {"7": 3, "8": 1}}
+
+        first = await client.get("/api/v1/comments/post/1", params={"limit": 2})
+        assert [comment["id"] for comment in first.json()] == [1, 2]
+        second = await client.get("/api/v1/comments/post/1", params={"limit": 2, "cursor": first.headers[NEXT_CURSOR_HEADER]})
+        assert [comment["id"] for comment in second.json()] == [4]
+        found = await client.get("/api/v1/comments/search", params={"q": "migrations"})
+        assert found.json()["total"] == 1
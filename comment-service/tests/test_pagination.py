@@ -0,0 +1,31 @@
+"""Keyset pagination of a post's comments on (post_id, created_at, id)"""
+import pytest
+
+from app import routes
+from app.events import CREATED, IdReplica
+from app.pagination import NEXT_CURSOR_HEADER
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def known_ids(monkeypatch):
+    monkeypatch.setattr(routes, "user_replica", IdReplica())
+    monkeypatch.setattr(routes, "post_replica", IdReplica())
+    routes.user_replica.apply({"type": CREATED, "id": 1})
+    for post_id in (1, 2):
+        routes.post_replica.apply({"type": CREATED, "id": post_id})
+
+
+async def test_pages_follow_the_cursor(client):
+    for i in range(6):
+        await client.post("/api/v1/comments", json={"content": f"c{i}", "post_id": 1 + i % 2, "author_id": 1})
+    pages, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = await client.get("/api/v1/comments/post/1", params=params)
+        pages.append([comment["id"] for comment in response.json()])
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            break
+    assert pages == [[1, 3], [5]]
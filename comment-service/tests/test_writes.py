@@ -0,0 +1,38 @@
+"""Writes take one round trip each, plus the counter upsert"""
+import pytest
+
+from app import routes
+from app.events import CREATED, IdReplica
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def known_ids(monkeypatch):
+    monkeypatch.setattr(routes, "user_replica", IdReplica())
+    monkeypatch.setattr(routes, "post_replica", IdReplica())
+    routes.user_replica.apply({"type": CREATED, "id": 1})
+    routes.post_replica.apply({"type": CREATED, "id": 1})
+
+
+async def test_create_is_insert_and_counter_upsert(client, statements):
+    response = await client.post("/api/v1/comments", json={"content": "hi", "post_id": 1, "author_id": 1})
+    assert response.status_code == 200
+    assert response.json()["id"] == 1 and response.json()["created_at"]
+    assert len(statements) == 2
+    assert "RETURNING" in statements[0]
+
+
+async def test_delete_is_delete_and_counter_upsert(client, statements):
+    await client.post("/api/v1/comments", json={"content": "hi", "post_id": 1, "author_id": 1})
+    statements.clear()
+    assert (await client.delete("/api/v1/comments/1")).status_code == 200
+    assert len(statements) == 2
+    assert (await client.delete("/api/v1/comments/1")).status_code == 404
+
+
+async def test_bulk_insert_is_insert_and_counter_upsert(client, statements):
+    items = [{"content": f"c{i}", "post_id": 1, "author_id": 1} for i in range(50)]
+    response = await client.post("/api/v1/comments/bulk", json=items)
+    assert response.json()["created"] == 50
+    assert len(statements) == 2
@@ -0,0 +1,217 @@
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Optional, Set
+
+import httpx
+
+from .metrics import upstream_timer
+from .serialization import MSGPACK_MEDIA_TYPE, decode_body, msgpack
+from .tracing import end_span, inject, start_span
+
+# Upstreams answer in MessagePack when they can, JSON otherwise
+MSGPACK_ACCEPT = f"{MSGPACK_MEDIA_TYPE}, application/json;q=0.9"
+
+
+class UpstreamUnavailable(Exception):
+    """Raised when an upstream service cannot answer (error, timeout or open circuit)"""
+
+
+def read_body(response: httpx.Response) -> Any:
+    """An upstream response's body as Python objects, JSON or MessagePack alike"""
+    return decode_body(response.content, response.headers.get("content-type", ""))
+
+
+class CircuitBreaker:
+    """Stops calling an upstream after repeated failures.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    calls fail fast for ``reset_timeout`` seconds. The first call after that
+    is let through as a trial: success closes the circuit, failure opens it
+    again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "half-open":
+            # Let a single trial call through and hold the rest back
+            self.opened_at = time.monotonic()
+            return True
+        return state == "closed"
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class ServiceClient:
+    """Async keep-alive HTTP client for one upstream service.
+
+    One instance is shared by every request so connections are pooled and
+    reused. Each dependency has its own timeout and circuit breaker, so a
+    slow user-service does not hold up calls to post-service. With
+    ``use_msgpack`` (and msgpack installed) requests ask for MessagePack,
+    which is smaller than JSON but, next to orjson, no faster to encode
+    or decode; read the bodies with ``read_body`` either way.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        timeout: float = 3.0,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        breaker: Optional[CircuitBreaker] = None,
+        use_msgpack: bool = False,
+    ):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.timeout = httpx.Timeout(timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        )
+        self.breaker = breaker or CircuitBreaker()
+        self.headers = {"accept": MSGPACK_ACCEPT} if use_msgpack and msgpack is not None else None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._ok_seconds, self._error_seconds = upstream_timer(name)
+
+    @classmethod
+    def from_env(cls, name: str, base_url: str, prefix: str) -> "ServiceClient":
+        """Build a client configured from ``<prefix>_TIMEOUT`` and friends"""
+        return cls(
+            name,
+            base_url,
+            timeout=float(os.getenv(f"{prefix}_TIMEOUT", "3")),
+            max_connections=int(os.getenv(f"{prefix}_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(os.getenv(f"{prefix}_MAX_KEEPALIVE", "20")),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.getenv(f"{prefix}_FAILURE_THRESHOLD", "5")),
+                reset_timeout=float(os.getenv(f"{prefix}_RESET_TIMEOUT", "30")),
+            ),
+            use_msgpack=os.getenv(f"{prefix}_MSGPACK", "false").lower() in ("1", "true", "yes"),
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url, timeout=self.timeout, limits=self.limits, headers=self.headers
+            )
+        return self._client
+
+    async def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        if not self.breaker.allow():
+            raise UpstreamUnavailable(f"{self.name} circuit is open")
+        # The callee continues this request's trace, under this call's span
+        span = start_span(f"{method} {self.name}", "client", **{"http.target": path})
+        kwargs["headers"] = inject(kwargs.get("headers"), span)
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, **kwargs)
+        except httpx.HTTPError as exc:
+            self._error_seconds.observe(time.perf_counter() - start)
+            end_span(span, repr(exc))
+            self.breaker.record_failure()
+            raise UpstreamUnavailable(f"{self.name}: {exc!r}") from exc
+        end_span(span, **{"http.status_code": response.status_code})
+        if response.status_code >= 500:
+            self._error_seconds.observe(time.perf_counter() - start)
+            self.breaker.record_failure()
+            raise UpstreamUnavailable(f"{self.name} returned {response.status_code}")
+        self._ok_seconds.observe(time.perf_counter() - start)
+        self.breaker.record_success()
+        return response
+
+    async def get(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", path, **kwargs)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class ExistenceBatcher:
+    """Coalesces concurrent existence checks into one batch request.
+
+    Ids asked for within ``window`` seconds of each other (or until
+    ``max_batch`` ids are queued) are sent together as
+    ``POST path {"ids": [...]}``, so N concurrent writes cost one upstream
+    round trip instead of N.
+    """
+
+    def __init__(self, client: ServiceClient, path: str, window: float = 0.002, max_batch: int = 500):
+        self.client = client
+        self.path = path
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: Dict[int, List[asyncio.Future]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    @classmethod
+    def from_env(cls, client: ServiceClient, path: str) -> "ExistenceBatcher":
+        return cls(
+            client,
+            path,
+            window=float(os.getenv("EXISTS_BATCH_WINDOW_MS", "2")) / 1000,
+            max_batch=int(os.getenv("EXISTS_BATCH_MAX", "500")),
+        )
+
+    async def exists(self, record_id: int) -> bool:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.setdefault(record_id, []).append(future)
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: Dict[int, List[asyncio.Future]]):
+        try:
+            response = await self.client.request("POST", self.path, json={"ids": list(batch)})
+            if response.status_code != 200:
+                raise UpstreamUnavailable(f"{self.client.name} returned {response.status_code}")
+            existing = set(read_body(response)["existing"])
+        except Exception as exc:
+            for futures in batch.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(exc)
+            return
+        for record_id, futures in batch.items():
+            for future in futures:
+                if not future.done():
+                    future.set_result(record_id in existing)
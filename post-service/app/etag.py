@@ -0,0 +1,54 @@
+import hashlib
+import os
+from typing import Optional
+
+from fastapi import HTTPException, Request, Response
+
+ETAG_HEADER = "ETag"
+
+# How long clients and CDNs may reuse a response without asking. After
+# that they revalidate with If-None-Match, which costs a bodiless 304
+# while nothing has changed. The default of 0 revalidates every time.
+CACHE_MAX_AGE = int(os.getenv("CACHE_MAX_AGE", "0"))
+CACHE_CONTROL = f"public, max-age={CACHE_MAX_AGE}, must-revalidate"
+
+
+def make_etag(*parts) -> str:
+    """Weak ETag digesting ``parts``, e.g. a record id and its version.
+
+    Weak, so it still matches once a compressing proxy has re-encoded the
+    body. The same parts give the same tag in every worker and process.
+    """
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def row_version(row):
+    """Version of an ORM row: when it was last written"""
+    return getattr(row, "updated_at", None) or row.created_at
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of ``etag`` against an If-None-Match header"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def check_not_modified(request: Request, response: Response, etag: str):
+    """Tag ``response`` with ``etag`` and caching hints.
+
+    Raises 304 Not Modified, with the same headers and no body, when the
+    client already holds this version; call it before serializing. Any
+    Vary already on ``response`` goes on the 304 too; the negotiation
+    middleware adds its own to both.
+    """
+    headers = {ETAG_HEADER: etag, "Cache-Control": CACHE_CONTROL}
+    if "vary" in response.headers:
+        headers["Vary"] = response.headers["vary"]
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        raise HTTPException(status_code=304, headers=headers)
+    response.headers.update(headers)
@@ -0,0 +1,168 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+CREATED = "created"
+UPDATED = "updated"
+DELETED = "deleted"
+
+# Events are dicts: {"topic": "users", "type": "created", "id": 7}
+Handler = Callable[[dict], None]
+
+
+class LocalBus:
+    """In-process event broker: publishing calls every subscriber directly.
+
+    This is the default bus, so a service whose consumers are in the same
+    process (or that has none) publishes for the cost of a dict lookup.
+    Other brokers subclass it and override ``publish_many``, ``start`` and
+    ``close``.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Handler]] = {}
+
+    @classmethod
+    def from_env(cls) -> "LocalBus":
+        """A FileBus under ``$EVENT_BUS_DIR`` when set, otherwise a LocalBus"""
+        directory = os.getenv("EVENT_BUS_DIR")
+        if directory:
+            return FileBus(directory, poll_interval=float(os.getenv("EVENT_BUS_POLL_MS", "50")) / 1000)
+        return cls()
+
+    def subscribe(self, topic: str, handler: Handler):
+        self._handlers.setdefault(topic, []).append(handler)
+
+    def publish(self, topic: str, kind: str, record_id: int):
+        self.publish_many(topic, kind, (record_id,))
+
+    def publish_many(self, topic: str, kind: str, record_ids: Iterable[int]):
+        for record_id in record_ids:
+            self._dispatch({"topic": topic, "type": kind, "id": record_id})
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def _dispatch(self, event: dict):
+        for handler in self._handlers.get(event["topic"], ()):
+            try:
+                handler(event)
+            except Exception:
+                logger.exception("Event handler failed for %s", event)
+
+
+class FileBus(LocalBus):
+    """Event broker over one append-only JSON-lines file per topic.
+
+    Publishers in any process on the host append their events with a
+    single locked write, so lines never interleave. Subscribers tail the
+    files of their topics from the beginning, every ``poll_interval``
+    seconds, so a newly started consumer replays the topic's history and
+    its replica starts out complete. Meant for tests and single-host
+    deployments.
+    """
+
+    def __init__(self, directory: str, poll_interval: float = 0.05):
+        super().__init__()
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self._write_lock = threading.Lock()
+        self._offsets: Dict[str, int] = {}
+        self._partial: Dict[str, bytes] = {}
+        self._task: Optional[asyncio.Task] = None
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, topic: str) -> str:
+        return os.path.join(self.directory, f"{topic}.log")
+
+    def publish_many(self, topic: str, kind: str, record_ids: Iterable[int]):
+        lines = "".join(
+            json.dumps({"topic": topic, "type": kind, "id": record_id}, separators=(",", ":")) + "\n"
+            for record_id in record_ids
+        )
+        if not lines:
+            return
+        with self._write_lock:
+            fd = os.open(self.path(topic), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                os.write(fd, lines.encode())
+            finally:
+                os.close(fd)
+
+    async def start(self):
+        """Catch up on every subscribed topic, then keep tailing in the background"""
+        self.poll()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def poll(self) -> int:
+        """Dispatch every complete event appended since the last poll"""
+        dispatched = 0
+        for topic in self._handlers:
+            try:
+                with open(self.path(topic), "rb") as f:
+                    f.seek(self._offsets.get(topic, 0))
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+            self._offsets[topic] = self._offsets.get(topic, 0) + len(data)
+            data = self._partial.pop(topic, b"") + data
+            lines = data.split(b"\n")
+            # A line without its newline yet is still being written
+            if lines[-1]:
+                self._partial[topic] = lines[-1]
+            for line in lines[:-1]:
+                if line:
+                    self._dispatch(json.loads(line))
+                    dispatched += 1
+        return dispatched
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Polling events in %s failed", self.directory)
+
+
+class IdReplica:
+    """Local copy of the live ids of one topic, kept by its events.
+
+    Consumers answer existence checks from it instead of calling the
+    owning service. It can lag the owner by the bus delay, so a miss is
+    only a hint (the id may have just been created) while a hit is as good
+    as a cached upstream answer.
+    """
+
+    def __init__(self, on_deleted: Optional[Callable[[int], None]] = None):
+        self.on_deleted = on_deleted
+        self._ids: Set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, record_id: int) -> bool:
+        return record_id in self._ids
+
+    def apply(self, event: dict):
+        if event["type"] == DELETED:
+            self._ids.discard(event["id"])
+            if self.on_deleted is not None:
+                self.on_deleted(event["id"])
+        else:
+            self._ids.add(event["id"])
@@ -1,14 +1,45 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import BackgroundTasks, Body, FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional
 from datetime import datetime
-import requests
+import asyncio
 import os
 import uvicorn
+from .admission import AdmissionController, AdmissionMiddleware
+from .bulk import BULK_MAX_ITEMS, item_created, item_error, summarize, validate_items
+from .cache import ExistenceCache
+from .clients import ExistenceBatcher, ServiceClient, UpstreamUnavailable, read_body
+from .etag import ETAG_HEADER, check_not_modified, make_etag
+from .events import CREATED, DELETED, UPDATED, IdReplica, LocalBus
+from .metrics import EXISTENCE_CHECK_SECONDS, METRICS_ENABLED, MetricsMiddleware, metrics_response
+from .negotiation import COMPRESSION_ENABLED, CompressionMiddleware, MessagePackMiddleware
+from .pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, decode_cursor, paginate
+from .persistence import Persistence
+from .shared import SharedState
+from .search import DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT, InvertedIndex
+from .serialization import ListEncoder
+from .columns import INT, TEXT, TIMESTAMP
+from .store import IndexedStore
+from .streaming import EXPORT_BATCH_SIZE, NDJSON_MEDIA_TYPE, ndjson_stream
+from .tracing import Tracer, TracingMiddleware, traced
 
 app = FastAPI(title="Post Service", version="1.0.0")
 
+# Concurrency and rate limits in front of every route, reads ahead of
+# writes, writes shed under overload. Added first so it runs innermost:
+# its 429s and 503s still carry CORS headers and show up in metrics.
+admission = AdmissionController.from_env()
+if admission is not None:
+    app.add_middleware(AdmissionMiddleware, controller=admission)
+
+# MessagePack for clients whose Accept asks for it (other services), then
+# gzip/br/zstd by Accept-Encoding for bodies of COMPRESSION_MIN_BYTES and up
+app.add_middleware(MessagePackMiddleware)
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+
 # CORS configuration
 app.add_middleware(
     CORSMiddleware,
@@ -16,14 +47,71 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, ETAG_HEADER],
 )
 
+# W3C traceparent in and out, sampled spans kept for /api/v1/traces
+tracer = Tracer.from_env("post-service")
+app.add_middleware(TracingMiddleware, tracer=tracer)
+
+# Per-route latency, requests in flight and SQL per request, on /metrics
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # Configuration - Use environment variables
 USER_SERVICE_URL = os.getenv("USER_SERVICE_URL", "https://user-service-demoblog-archita.azurewebsites.net")
+COMMENT_SERVICE_URL = os.getenv("COMMENT_SERVICE_URL", "https://comment-service-demoblog-archita.azurewebsites.net")
+
+# Pooled keep-alive client shared by all requests
+user_service = ServiceClient.from_env("user-service", USER_SERVICE_URL, "USER_SERVICE")
+comment_service = ServiceClient.from_env("comment-service", COMMENT_SERVICE_URL, "COMMENT_SERVICE")
+user_exists_cache = ExistenceCache.from_env()
+user_exists_batcher = ExistenceBatcher.from_env(user_service, "/api/v1/users:exists")
+
+# Change events: posts are published, users are replicated locally from
+# user-service's events so author checks rarely leave the process
+bus = LocalBus.from_env()
+user_replica = IdReplica(on_deleted=user_exists_cache.invalidate)
+bus.subscribe("users", user_replica.apply)
+
+# Services that cache post existence (e.g. comment-service), told on delete
+CACHE_INVALIDATION_URLS = [u for u in os.getenv("CACHE_INVALIDATION_URLS", "").split(",") if u]
+invalidation_clients = [
+    ServiceClient.from_env(url, url, "CACHE_INVALIDATION") for url in CACHE_INVALIDATION_URLS
+]
 
 # In-memory storage
-posts_db = []
-post_id_counter = 1
+# With STORE_SOCKET set, every worker shares one store and search index
+# in an owner process. Records are kept column by column in this layout
+# (see columns.py).
+POST_COLUMNS = {"title": TEXT, "content": TEXT, "author_id": INT, "created_at": TIMESTAMP}
+shared_state = SharedState.from_env()
+if shared_state is not None:
+    posts_db = shared_state.store("posts", indexed=("author_id",), columns=POST_COLUMNS)
+    posts_index = shared_state.index("posts", "posts", ("title", "content"))
+else:
+    posts_db = IndexedStore(indexed=("author_id",), columns=POST_COLUMNS)
+    # Full-text index over title and content, kept in step with posts_db
+    posts_index = InvertedIndex()
+
+def post_text(post: dict) -> str:
+    return f"{post['title']} {post['content']}"
+
+# Optional snapshot + write-ahead log under $PERSIST_DIR, off by default
+# (a shared store is persisted by its owner process instead)
+posts_persistence = None if shared_state else Persistence.from_env("posts")
+
+@app.on_event("startup")
+def restore_posts():
+    if posts_persistence is not None:
+        posts_persistence.attach(posts_db)
+        for post in posts_db:
+            posts_index.add(post["id"], post_text(post))
+
+@app.on_event("shutdown")
+def persist_posts():
+    if posts_persistence is not None:
+        posts_persistence.close()
 
 # Models
 class PostCreate(BaseModel):
@@ -42,12 +130,94 @@ class Post(BaseModel):
     author_id: int
     created_at: str
 
-def verify_user_exists(user_id: int):
-    try:
-        response = requests.get(f"{USER_SERVICE_URL}/api/v1/users/{user_id}", timeout=10)
-        return response.status_code == 200
-    except:
-        return False
+class ExistsRequest(BaseModel):
+    ids: List[int] = Field(max_length=10000)
+
+class ExistsResponse(BaseModel):
+    existing: List[int]
+    missing: List[int]
+
+class PostPage(BaseModel):
+    post: Post
+    comments: List[Dict[str, Any]]
+    authors: List[Dict[str, Any]]
+    # Upstreams that could not be reached; their part of the page is empty
+    unavailable: List[str] = []
+
+class PostHit(Post):
+    score: float
+
+class PostSearchResponse(BaseModel):
+    total: int
+    results: List[PostHit]
+
+class BulkItemResult(BaseModel):
+    index: int
+    status: int
+    item: Optional[Post] = None
+    error: Optional[str] = None
+
+class BulkResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[BulkItemResult]
+
+# Compiled once; list endpoints encode the stored records through it
+post_list = ListEncoder(Post)
+
+user_check_seconds = EXISTENCE_CHECK_SECONDS.labels("user")
+
+async def verify_user_exists(user_id: int):
+    with user_check_seconds.time(), traced("verify_user_exists"):
+        if user_id in user_replica:
+            return True
+        try:
+            return await user_exists_cache.get_or_load(
+                user_id, lambda: user_exists_batcher.exists(user_id)
+            )
+        except UpstreamUnavailable:
+            # For demo purposes, skip verification if user service is not available
+            return True
+
+async def notify_post_deleted(post_id: int):
+    for client in invalidation_clients:
+        try:
+            await client.request("DELETE", f"/api/v1/cache/posts/{post_id}")
+        except UpstreamUnavailable:
+            # Best effort, the subscriber's negative TTL covers a lost call
+            pass
+
+async def fetch_comments(post_id: int, cursor: Optional[str], limit: int):
+    """One page of a post's comments from comment-service, plus its next cursor"""
+    params = {"limit": limit}
+    if cursor:
+        params["cursor"] = cursor
+    response = await comment_service.get(f"/api/v1/comments/post/{post_id}", params=params)
+    if response.status_code != 200:
+        raise UpstreamUnavailable(f"comment-service returned {response.status_code}")
+    return read_body(response), response.headers.get(NEXT_CURSOR_HEADER)
+
+async def fetch_users(user_ids: List[int]):
+    """Every listed user in a single user-service batch call"""
+    if not user_ids:
+        return []
+    response = await user_service.request("POST", "/api/v1/users:batchGet", json={"ids": user_ids})
+    if response.status_code != 200:
+        raise UpstreamUnavailable(f"user-service returned {response.status_code}")
+    return read_body(response)["users"]
+
+@app.on_event("startup")
+async def start_events():
+    await bus.start()
+
+@app.on_event("shutdown")
+async def close_clients():
+    await bus.close()
+    tracer.close()
+    await user_service.aclose()
+    await comment_service.aclose()
+    for client in invalidation_clients:
+        await client.aclose()
 
 @app.get("/")
 def root():
@@ -57,56 +227,156 @@ def root():
 def health_check():
     return {"service": "post-service", "status": "healthy", "timestamp": datetime.now().isoformat()}
 
+@app.get("/metrics")
+def get_metrics():
+    return metrics_response()
+
+# Recently sampled spans, newest first; a trace id comes from the
+# traceresponse header of a sampled response
+@app.get("/api/v1/traces")
+def get_traces(trace_id: Optional[str] = None, limit: int = Query(100, ge=1, le=10000)):
+    return tracer.buffer.spans(trace_id, limit)
+
+@app.get("/api/v1/cache/stats")
+async def get_cache_stats():
+    return {"users": user_exists_cache.stats()}
+
+# Called by user-service when a user is deleted
+@app.delete("/api/v1/cache/users/{user_id}")
+async def invalidate_user(user_id: int):
+    return {"invalidated": user_exists_cache.invalidate(user_id)}
+
 @app.post("/api/v1/posts", response_model=Post)
-def create_post(post: PostCreate):
-    global post_id_counter
-    
-    # For demo purposes, skip verification if user service is not available
-    try:
-        if not verify_user_exists(post.author_id):
-            raise HTTPException(status_code=400, detail="Author not found")
-    except:
-        pass
+async def create_post(post: PostCreate):
+    if not await verify_user_exists(post.author_id):
+        raise HTTPException(status_code=400, detail="Author not found")
     
     new_post = {
-        "id": post_id_counter,
         "title": post.title,
         "content": post.content,
         "author_id": post.author_id,
         "created_at": datetime.now().isoformat()
     }
     
-    posts_db.append(new_post)
-    post_id_counter += 1
-    
+    new_post = posts_db.insert(new_post)
+    posts_index.add(new_post["id"], post_text(new_post))
+    bus.publish("posts", CREATED, new_post["id"])
     return new_post
 
+@app.post("/api/v1/posts/bulk", response_model=BulkResponse)
+async def create_posts_bulk(items: List[Dict[str, Any]] = Body(..., max_length=BULK_MAX_ITEMS)):
+    valid, results = validate_items(PostCreate, items)
+    
+    # Each distinct author is checked once, all concurrently
+    author_ids = list({post.author_id for _, post in valid})
+    found = dict(zip(author_ids, await asyncio.gather(*map(verify_user_exists, author_ids))))
+    
+    accepted = []
+    for index, post in valid:
+        if found[post.author_id]:
+            accepted.append((index, post))
+        else:
+            results.append(item_error(index, 400, "Author not found"))
+    
+    created_at = datetime.now().isoformat()
+    stored = posts_db.insert_many(
+        {
+            "title": post.title,
+            "content": post.content,
+            "author_id": post.author_id,
+            "created_at": created_at
+        }
+        for _, post in accepted
+    )
+    for (index, _), new_post in zip(accepted, stored):
+        posts_index.add(new_post["id"], post_text(new_post))
+        results.append(item_created(index, new_post))
+    bus.publish_many("posts", CREATED, [new_post["id"] for new_post in stored])
+    return summarize(results)
+
+# Batch existence check used by comment-service's verify helper
+@app.post("/api/v1/posts:exists", response_model=ExistsResponse)
+def posts_exist(request: ExistsRequest):
+    found = posts_db.get_many(request.ids)
+    existing = [i for i in request.ids if i in found]
+    missing = [i for i in request.ids if i not in found]
+    return {"existing": existing, "missing": missing}
+
 @app.get("/api/v1/posts", response_model=List[Post])
-def get_posts():
-    return posts_db
+def get_posts(request: Request, response: Response, cursor: Optional[str] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)):
+    after_id = decode_cursor(cursor)[1] if cursor else 0
+    # Any write to posts_db changes the collection version, and with it the tag
+    check_not_modified(request, response, make_etag("posts", posts_db.collection_version(), after_id, limit))
+    return post_list.response(paginate(response, posts_db.page(after_id, limit + 1), limit), response)
+
+# Full collection as NDJSON, streamed page by page (declared before /{post_id})
+@app.get("/api/v1/posts/export")
+def export_posts():
+    return StreamingResponse(ndjson_stream(posts_db.scan(EXPORT_BATCH_SIZE)), media_type=NDJSON_MEDIA_TYPE)
+
+# BM25-ranked full-text search, paged by offset (declared before /{post_id})
+@app.get("/api/v1/posts/search", response_model=PostSearchResponse)
+def search_posts(q: str = Query(..., min_length=1, max_length=256), offset: int = Query(0, ge=0), limit: int = Query(DEFAULT_SEARCH_LIMIT, ge=1, le=MAX_SEARCH_LIMIT)):
+    total, hits = posts_index.search(q, offset, limit)
+    results = []
+    for post_id, score in hits:
+        post = posts_db.get(post_id)
+        if post is not None:
+            results.append({**post, "score": score})
+    return {"total": total, "results": results}
 
 @app.get("/api/v1/posts/{post_id}", response_model=Post)
-def get_post(post_id: int):
-    for post in posts_db:
-        if post["id"] == post_id:
-            return post
-    raise HTTPException(status_code=404, detail="Post not found")
+def get_post(post_id: int, request: Request, response: Response):
+    found = posts_db.get_versioned(post_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Post not found")
+    post, version = found
+    check_not_modified(request, response, make_etag("post", post_id, version))
+    return post
+
+# Everything a post page needs in one round trip: the post, a page of its
+# comments and each distinct author once, instead of one get_user per comment
+@app.get("/api/v1/posts/{post_id}/page", response_model=PostPage)
+async def get_post_page(post_id: int, response: Response, cursor: Optional[str] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)):
+    post = posts_db.get(post_id)
+    if post is None:
+        raise HTTPException(status_code=404, detail="Post not found")
+    
+    unavailable = []
+    try:
+        comments, next_cursor = await fetch_comments(post_id, cursor, limit)
+    except UpstreamUnavailable:
+        comments, next_cursor = [], None
+        unavailable.append("comment-service")
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    
+    author_ids = list(dict.fromkeys([post["author_id"], *(c["author_id"] for c in comments)]))
+    try:
+        authors = await fetch_users(author_ids)
+    except UpstreamUnavailable:
+        authors = []
+        unavailable.append("user-service")
+    
+    return {"post": post, "comments": comments, "authors": authors, "unavailable": unavailable}
 
 @app.put("/api/v1/posts/{post_id}", response_model=Post)
 def update_post(post_id: int, post_update: PostUpdate):
-    for post in posts_db:
-        if post["id"] == post_id:
-            if post_update.title is not None:
-                post["title"] = post_update.title
-            if post_update.content is not None:
-                post["content"] = post_update.content
-            return post
-    raise HTTPException(status_code=404, detail="Post not found")
+    changes = post_update.model_dump(exclude_none=True)
+    post = posts_db.update(post_id, changes)
+    if post is None:
+        raise HTTPException(status_code=404, detail="Post not found")
+    if "title" in changes or "content" in changes:
+        posts_index.add(post_id, post_text(post))
+    bus.publish("posts", UPDATED, post_id)
+    return post
 
 @app.delete("/api/v1/posts/{post_id}")
-def delete_post(post_id: int):
-    global posts_db
-    posts_db = [p for p in posts_db if p["id"] != post_id]
+def delete_post(post_id: int, background_tasks: BackgroundTasks):
+    if posts_db.delete(post_id) is not None:
+        posts_index.remove(post_id)
+        bus.publish("posts", DELETED, post_id)
+        background_tasks.add_task(notify_post_deleted, post_id)
     return {"message": "Post deleted successfully"}
 
 # For Azure deployment
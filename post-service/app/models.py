@@ -1,7 +1,20 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
-from sqlalchemy.sql import func
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index, DDL, event, literal_column
+from sqlalchemy.dialects import postgresql  # noqa: F401 - registers func.to_tsvector and friends
+from sqlalchemy.sql import column, func, table
+from datetime import datetime, timezone
 from .database import Base
 
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+# Full-text search. PostgreSQL keeps an expression GIN index over the
+# tsvector; queries must repeat the exact expression (literals, not bind
+# parameters) for the planner to use it.
+SEARCH_CONFIG = literal_column("'english'::regconfig")
+
+def _search_vector(title, content):
+    return func.to_tsvector(SEARCH_CONFIG, title.op("||")(literal_column("' '")).op("||")(content))
+
 class Post(Base):
     __tablename__ = "posts"
     
@@ -9,5 +22,38 @@ class Post(Base):
     title = Column(String, nullable=False)
     content = Column(Text, nullable=False)
     author_id = Column(Integer, nullable=False)  # Foreign key to user service
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
\ No newline at end of file
+    # Stamped by the app, like updated_at: SQLite's CURRENT_TIMESTAMP has
+    # no fraction of a second, and keyset cursors compare against values
+    # bound with microseconds. The server default covers other writers.
+    created_at = Column(DateTime(timezone=True), default=utcnow, server_default=func.now())
+    # Stamped by the app, with microsecond resolution on every backend, as
+    # it versions the row for ETags
+    updated_at = Column(DateTime(timezone=True), onupdate=utcnow)
+    
+    # Back keyset pagination on (created_at, id), overall and per author
+    __table_args__ = (
+        Index("ix_posts_created_at_id", "created_at", "id"),
+        Index("ix_posts_author_id_created_at_id", "author_id", "created_at", "id"),
+        Index("ix_posts_search", _search_vector(title, content), postgresql_using="gin").ddl_if(dialect="postgresql"),
+    )
+
+def search_vector():
+    return _search_vector(Post.__table__.c.title, Post.__table__.c.content)
+
+# SQLite gets an FTS5 table over the same columns, kept in step by triggers
+posts_fts = table("posts_fts", column("rowid"))
+
+for statement in (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(title, content, content='posts', content_rowid='id')",
+    """CREATE TRIGGER IF NOT EXISTS posts_fts_insert AFTER INSERT ON posts BEGIN
+        INSERT INTO posts_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS posts_fts_delete AFTER DELETE ON posts BEGIN
+        INSERT INTO posts_fts(posts_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS posts_fts_update AFTER UPDATE OF title, content ON posts BEGIN
+        INSERT INTO posts_fts(posts_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO posts_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+):
+    event.listen(Post.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
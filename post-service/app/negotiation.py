@@ -0,0 +1,317 @@
+import os
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from .metrics import REGISTRY
+from .serialization import MSGPACK_MEDIA_TYPE, json_to_msgpack, msgpack, prefer_msgpack
+
+try:
+    import brotli
+except ImportError:  # optional, br is not offered without it
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional, zstd is not offered without it
+    zstandard = None
+
+COMPRESSED_BYTES = REGISTRY.counter(
+    "response_compressed_bytes", "Response body bytes before and after compression", ("encoding", "stage")
+)
+
+# Bodies worth compressing; images and the like are compressed already
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", MSGPACK_MEDIA_TYPE, "text/")
+MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack", "application/vnd.msgpack")
+
+
+def quality_values(header: str) -> Dict[str, float]:
+    """``{"gzip": 1.0, "br": 0.5}`` from an Accept or Accept-Encoding value"""
+    values = {}
+    for item in header.split(","):
+        token, *params = item.split(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        values[token] = q
+    return values
+
+
+def _header(scope, name: bytes) -> str:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return ""
+
+
+def _add_vary(headers: List[Tuple[bytes, bytes]], name: bytes):
+    for i, (key, value) in enumerate(headers):
+        if key == b"vary":
+            if name.lower() not in (token.strip().lower() for token in value.split(b",")):
+                headers[i] = (key, value + b", " + name)
+            return
+    headers.append((b"vary", name))
+
+
+class _Gzip:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _Brotli:
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _Zstd:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+# Everything this process can produce, best ratio for the CPU first
+CODECS = {}
+if zstandard is not None:
+    CODECS["zstd"] = _Zstd
+if brotli is not None:
+    CODECS["br"] = _Brotli
+CODECS["gzip"] = _Gzip
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+# Smaller bodies go out as they are: the framing would cost more than it saves
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+COMPRESSION_ENCODINGS = tuple(filter(None, os.getenv("COMPRESSION_ENCODINGS", "zstd,br,gzip").split(",")))
+# Fast settings: every response is compressed afresh, not once up front
+COMPRESSION_LEVELS = {
+    name: int(os.getenv(f"COMPRESSION_{name.upper()}_LEVEL", level))
+    for name, level in (("zstd", 3), ("br", 4), ("gzip", 6))
+}
+
+
+class CompressionMiddleware:
+    """Compresses response bodies with the best encoding the client accepts.
+
+    The encoding is negotiated from Accept-Encoding: the highest q-value
+    wins, and ties go to the order of ``encodings`` (zstd, br, gzip by
+    default; br and zstd only when their packages are installed). Only
+    compressible types are touched, and only bodies of at least
+    ``minimum_size`` bytes. A body sent in one piece is compressed in one
+    go. A streamed one (the NDJSON exports) is compressed as it goes,
+    each chunk flushed as soon as it is compressed, so the client still
+    gets rows as they are read and the server never holds the whole
+    body. ETags are weak, so they stay valid across encodings and
+    If-None-Match works the same; a 304 gets ``Vary: Accept-Encoding``
+    like the response it stands for.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES,
+                 encodings: Tuple[str, ...] = COMPRESSION_ENCODINGS, levels: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encodings = tuple(name for name in encodings if name in CODECS)
+        self.levels = {**COMPRESSION_LEVELS, **(levels or {})}
+
+    def choose(self, accept_encoding: str) -> Optional[str]:
+        """The encoding to use for this Accept-Encoding, None for identity"""
+        if not accept_encoding:
+            return None
+        accepted = quality_values(accept_encoding)
+        wildcard = accepted.get("*", 0.0)
+        best, best_q = None, 0.0
+        for name in self.encodings:
+            q = accepted.get(name, wildcard)
+            if q > best_q:
+                best, best_q = name, q
+        return best
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        encoding = self.choose(_header(scope, b"accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compressor = None
+
+        async def send_compressed(message):
+            nonlocal start, compressor
+            if message["type"] == "http.response.start":
+                if self._compressible(message):
+                    # Held back until the first body chunk shows the size
+                    start = message
+                    return
+                if message["status"] == 304:
+                    # A 304 carries the Vary its 200 would have
+                    message["headers"] = list(message.get("headers", ()))
+                    _add_vary(message["headers"], b"Accept-Encoding")
+                await send(message)
+                return
+            if message["type"] != "http.response.body" or (start is None and compressor is None):
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is not None:
+                headers = start["headers"] = list(start["headers"])
+                _add_vary(headers, b"Accept-Encoding")
+                # Known up front, unless it is streamed without a length
+                length = len(body) if not more_body else next(
+                    (int(v) for k, v in headers if k == b"content-length"), None
+                )
+                if length is not None and length < self.minimum_size:
+                    await send(start)
+                    start = None
+                    await send(message)
+                    return
+                headers[:] = [(k, v) for k, v in headers if k != b"content-length"]
+                headers.append((b"content-encoding", encoding.encode()))
+                compressor = CODECS[encoding](self.levels[encoding])
+                if not more_body:
+                    # All of it at once: compressed in one go, with its length
+                    compressed = compressor.compress(body) + compressor.finish()
+                    headers.append((b"content-length", str(len(compressed)).encode()))
+                    self._count(encoding, len(body), len(compressed))
+                    await send(start)
+                    start = compressor = None
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                await send(start)
+                start = None
+
+            if more_body:
+                compressed = compressor.compress(body) + compressor.flush() if body else b""
+            else:
+                compressed = compressor.compress(body) + compressor.finish()
+                compressor = None
+            self._count(encoding, len(body), len(compressed))
+            await send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+    @staticmethod
+    def _compressible(message) -> bool:
+        if message["status"] < 200 or message["status"] in (204, 304):
+            return False
+        content_type = b""
+        for key, value in message.get("headers", ()):
+            if key == b"content-encoding":
+                return False
+            if key == b"content-type":
+                content_type = value
+        content_type = content_type.decode("latin-1")
+        return any(content_type.startswith(media_type) for media_type in COMPRESSIBLE_TYPES)
+
+    @staticmethod
+    def _count(encoding: str, raw: int, compressed: int):
+        COMPRESSED_BYTES.labels(encoding, "in").inc(raw)
+        COMPRESSED_BYTES.labels(encoding, "out").inc(compressed)
+
+
+def accepts_msgpack(accept: str) -> bool:
+    """True when ``accept`` rates MessagePack above JSON"""
+    if not accept:
+        return False
+    accepted = quality_values(accept)
+    msgpack_q = max(accepted.get(media_type, 0.0) for media_type in MSGPACK_MEDIA_TYPES)
+    json_q = accepted.get("application/json", accepted.get("application/*", accepted.get("*/*", 0.0)))
+    return msgpack_q > json_q
+
+
+class MessagePackMiddleware:
+    """Answers in MessagePack instead of JSON when Accept asks for it.
+
+    For service-to-service calls that ask for it: MessagePack bodies are
+    a little smaller than JSON ones. List endpoints encode straight to MessagePack (see
+    ListEncoder); any other JSON body is re-encoded on the way out.
+    Browsers, and anything else that does not rate MessagePack above
+    JSON, get JSON as before. JSON responses carry ``Vary: Accept``
+    either way, so a shared cache keeps the two apart, and so do the
+    304s that revalidate them.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or msgpack is None:
+            await self.app(scope, receive, send)
+            return
+        wanted = accepts_msgpack(_header(scope, b"accept"))
+        start = None
+
+        async def send_msgpack(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                headers = message["headers"] = list(message.get("headers", ()))
+                content_type = next((v for k, v in headers if k == b"content-type"), b"")
+                # A 304 revalidates JSON, so it gets the same Vary as the 200
+                if message["status"] == 304 or content_type.startswith((b"application/json", MSGPACK_MEDIA_TYPE.encode())):
+                    _add_vary(headers, b"Accept")
+                    if wanted and content_type.startswith(b"application/json"):
+                        start = message
+                        return
+                await send(message)
+                return
+            if start is None or message["type"] != "http.response.body":
+                await send(message)
+                return
+            body = message.get("body", b"")
+            if message.get("more_body", False) or not body:
+                # Streamed (or empty) JSON goes out as it is
+                await send(start)
+                start = None
+                await send(message)
+                return
+            body = json_to_msgpack(body)
+            start["headers"] = [(k, v) for k, v in start["headers"] if k not in (b"content-type", b"content-length")]
+            start["headers"] += [(b"content-type", MSGPACK_MEDIA_TYPE.encode()),
+                                 (b"content-length", str(len(body)).encode())]
+            await send(start)
+            start = None
+            await send({"type": "http.response.body", "body": body})
+
+        if not wanted:
+            await self.app(scope, receive, send_msgpack)
+            return
+        token = prefer_msgpack.set(True)
+        try:
+            await self.app(scope, receive, send_msgpack)
+        finally:
+            prefer_msgpack.reset(token)
@@ -0,0 +1,44 @@
+import base64
+import json
+import os
+from datetime import datetime
+from typing import List, Tuple, Union
+
+from fastapi import HTTPException, Response
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "1000"))
+
+# List endpoints return a JSON array; the cursor for the next page, if
+# there is one, travels in this header
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(created_at: Union[datetime, str], record_id: int) -> str:
+    """Opaque cursor pointing just past the (created_at, id) of a record"""
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat()
+    raw = json.dumps([created_at, record_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, record_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(record_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def paginate(response: Response, rows: List, limit: int) -> List:
+    """Trim a ``limit + 1`` probe result and set the next-page cursor header"""
+    if len(rows) <= limit:
+        return rows
+    rows = rows[:limit]
+    last = rows[-1]
+    if isinstance(last, dict):
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last["created_at"], last["id"])
+    else:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last.created_at, last.id)
+    return rows
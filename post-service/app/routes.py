@@ -1,70 +1,299 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-import requests
+from fastapi import APIRouter, BackgroundTasks, Body, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, delete, func, insert, literal, literal_column, or_, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Dict, List, Optional
+import asyncio
 import os
 from . import models, schemas
-from .database import get_db
+from .bulk import BULK_MAX_ITEMS, insert_returning, item_created, item_error, summarize, validate_items
+from .cache import CachedResponse, ExistenceCache, ResponseCache
+from .clients import ExistenceBatcher, ServiceClient, UpstreamUnavailable, read_body
+from .database import SessionLocal, get_db
+from .etag import check_not_modified, make_etag, row_version
+from .events import CREATED, DELETED, UPDATED, IdReplica, LocalBus
+from .metrics import EXISTENCE_CHECK_SECONDS
+from .pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, decode_cursor, paginate
+from .search import DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT, tokenize
+from .serialization import ListEncoder
+from .streaming import EXPORT_BATCH_SIZE, NDJSON_MEDIA_TYPE, ndjson_astream
+from .tracing import traced
 
 router = APIRouter()
+# Compiled once; list endpoints encode rows through it
+post_list = ListEncoder(schemas.Post)
+
 USER_SERVICE_URL = os.getenv("USER_SERVICE_URL", "http://localhost:8001")
+COMMENT_SERVICE_URL = os.getenv("COMMENT_SERVICE_URL", "http://localhost:8003")
+user_service = ServiceClient.from_env("user-service", USER_SERVICE_URL, "USER_SERVICE")
+comment_service = ServiceClient.from_env("comment-service", COMMENT_SERVICE_URL, "COMMENT_SERVICE")
+user_exists_cache = ExistenceCache.from_env()
+user_exists_batcher = ExistenceBatcher.from_env(user_service, "/api/v1/users:exists")
+CACHE_INVALIDATION_URLS = [u for u in os.getenv("CACHE_INVALIDATION_URLS", "").split(",") if u]
+invalidation_clients = [
+    ServiceClient.from_env(url, url, "CACHE_INVALIDATION") for url in CACHE_INVALIDATION_URLS
+]
+bus = LocalBus.from_env()
+user_replica = IdReplica(on_deleted=user_exists_cache.invalidate)
+bus.subscribe("users", user_replica.apply)
+# GET /posts/{id} bodies. Writes invalidate them here and in the shared
+# tier; other workers hear of it through the bus (EVENT_BUS_DIR)
+post_cache = ResponseCache.from_env("posts")
 
-def verify_user_exists(user_id: int):
-    """Verify user exists in user service"""
-    try:
-        response = requests.get(f"{USER_SERVICE_URL}/api/v1/users/{user_id}")
-        return response.status_code == 200
-    except requests.exceptions.RequestException:
-        return False
+def _invalidate_post(event: dict):
+    if event["type"] != CREATED:
+        post_cache.invalidate(event["id"])
+
+bus.subscribe("posts", _invalidate_post)
+
+user_check_seconds = EXISTENCE_CHECK_SECONDS.labels("user")
+
+async def verify_user_exists(user_id: int):
+    """Verify user exists, locally when user-service's events already said so"""
+    with user_check_seconds.time(), traced("verify_user_exists"):
+        if user_id in user_replica:
+            return True
+        try:
+            return await user_exists_cache.get_or_load(
+                user_id, lambda: user_exists_batcher.exists(user_id)
+            )
+        except UpstreamUnavailable:
+            return False
+
+async def notify_post_deleted(post_id: int):
+    """Tell services caching post existence that a post is gone"""
+    for client in invalidation_clients:
+        try:
+            await client.request("DELETE", f"/api/v1/cache/posts/{post_id}")
+        except UpstreamUnavailable:
+            pass
+
+async def fetch_comments(post_id: int, cursor: Optional[str], limit: int):
+    """One page of a post's comments from comment-service, plus its next cursor"""
+    params = {"limit": limit}
+    if cursor:
+        params["cursor"] = cursor
+    response = await comment_service.get(f"/api/v1/comments/post/{post_id}", params=params)
+    if response.status_code != 200:
+        raise UpstreamUnavailable(f"comment-service returned {response.status_code}")
+    return read_body(response), response.headers.get(NEXT_CURSOR_HEADER)
+
+async def fetch_users(user_ids: List[int]):
+    """Every listed user in a single user-service batch call"""
+    if not user_ids:
+        return []
+    response = await user_service.request("POST", "/api/v1/users:batchGet", json={"ids": user_ids})
+    if response.status_code != 200:
+        raise UpstreamUnavailable(f"user-service returned {response.status_code}")
+    return read_body(response)["users"]
+
+@router.on_event("startup")
+async def start_events():
+    await bus.start()
+
+@router.on_event("shutdown")
+async def close_clients():
+    await bus.close()
+    await user_service.aclose()
+    await comment_service.aclose()
+    for client in invalidation_clients:
+        await client.aclose()
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    return {"users": user_exists_cache.stats(), "post_responses": post_cache.stats()}
+
+@router.delete("/cache/users/{user_id}")
+async def invalidate_user(user_id: int):
+    return {"invalidated": user_exists_cache.invalidate(user_id)}
 
 @router.post("/posts", response_model=schemas.Post)
-def create_post(post: schemas.PostCreate, db: Session = Depends(get_db)):
+async def create_post(post: schemas.PostCreate, db: AsyncSession = Depends(get_db)):
     # Verify user exists
-    if not verify_user_exists(post.author_id):
+    if not await verify_user_exists(post.author_id):
         raise HTTPException(status_code=400, detail="Author not found")
     
-    db_post = models.Post(**post.model_dump())
-    db.add(db_post)
-    db.commit()
-    db.refresh(db_post)
+    # Server defaults come back through RETURNING, no refresh needed
+    db_post = await db.scalar(insert(models.Post).values(**post.model_dump()).returning(models.Post))
+    await db.commit()
+    bus.publish("posts", CREATED, db_post.id)
     return db_post
 
+@router.post("/posts/bulk", response_model=schemas.BulkResponse)
+async def create_posts_bulk(items: List[Dict[str, Any]] = Body(..., max_length=BULK_MAX_ITEMS), db: AsyncSession = Depends(get_db)):
+    valid, results = validate_items(schemas.PostCreate, items)
+    
+    author_ids = list({post.author_id for _, post in valid})
+    found = dict(zip(author_ids, await asyncio.gather(*map(verify_user_exists, author_ids))))
+    
+    accepted = []
+    for index, post in valid:
+        if found[post.author_id]:
+            accepted.append((index, post))
+        else:
+            results.append(item_error(index, 400, "Author not found"))
+    
+    if accepted:
+        # Single multi-row INSERT ... RETURNING in one transaction
+        created = await insert_returning(db, models.Post, [post.model_dump() for _, post in accepted])
+        results.extend(item_created(index, post) for (index, _), post in zip(accepted, created))
+        await db.commit()
+        bus.publish_many("posts", CREATED, [post.id for post in created])
+    return summarize(results)
+
+@router.post("/posts:exists", response_model=schemas.ExistsResponse)
+async def posts_exist(request: schemas.ExistsRequest, db: AsyncSession = Depends(get_db)):
+    # One IN query for the whole batch
+    found = set(await db.scalars(select(models.Post.id).where(models.Post.id.in_(request.ids))))
+    return {
+        "existing": [i for i in request.ids if i in found],
+        "missing": [i for i in request.ids if i not in found],
+    }
+
+def _page_etag(posts) -> str:
+    # Rows fetched, including the next-page probe, but nothing serialized yet
+    return make_etag("posts", [(post.id, row_version(post)) for post in posts])
+
+def _page_posts(stmt, cursor: Optional[str], limit: int):
+    # Keyset pagination: seek past the cursor on a (..., created_at, id) index
+    if cursor:
+        stmt = stmt.where(tuple_(models.Post.created_at, models.Post.id) > decode_cursor(cursor))
+    return stmt.order_by(models.Post.created_at, models.Post.id).limit(limit + 1)
+
 @router.get("/posts", response_model=List[schemas.Post])
-def get_posts(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    posts = db.query(models.Post).offset(skip).limit(limit).all()
-    return posts
+async def get_posts(request: Request, response: Response, cursor: Optional[str] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), db: AsyncSession = Depends(get_db)):
+    posts = (await db.scalars(_page_posts(select(models.Post), cursor, limit))).all()
+    check_not_modified(request, response, _page_etag(posts))
+    return post_list.response(paginate(response, posts, limit), response)
+
+async def _stream_posts():
+    # Own session so it lives as long as the response body, not the handler
+    async with SessionLocal() as db:
+        stmt = select(models.Post).order_by(models.Post.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+        async for post in await db.stream_scalars(stmt):
+            yield post
+
+@router.get("/posts/export")
+async def export_posts():
+    """Full collection as NDJSON from a server-side cursor"""
+    encode = lambda post: schemas.Post.model_validate(post).model_dump_json()
+    return StreamingResponse(ndjson_astream(_stream_posts(), encode), media_type=NDJSON_MEDIA_TYPE)
+
+def _search_posts(dialect: str, terms: List[str]):
+    """Posts containing every term with a relevance score, best first"""
+    if dialect == "postgresql":
+        vector = models.search_vector()
+        query = func.plainto_tsquery(models.SEARCH_CONFIG, " ".join(terms))
+        # Normalisation 1 divides by log(document length), as BM25 does
+        score = func.ts_rank_cd(vector, query, 1)
+        stmt = select(models.Post, score.label("score")).where(vector.op("@@")(query))
+        return stmt.order_by(score.desc(), models.Post.id)
+    if dialect == "sqlite":
+        # FTS5 ranks with BM25 natively; lower bm25() is better
+        rank = func.bm25(literal_column("posts_fts"))
+        match = " ".join(f'"{term}"' for term in terms)
+        stmt = select(models.Post, (-rank).label("score"))
+        stmt = stmt.join(models.posts_fts, models.posts_fts.c.rowid == models.Post.id)
+        return stmt.where(literal_column("posts_fts").op("MATCH")(match)).order_by(rank, models.Post.id)
+    # No full-text index on this backend: unranked substring scan
+    return select(models.Post, literal(0.0).label("score")).where(and_(*(
+        or_(func.lower(models.Post.title).contains(term, autoescape=True),
+            func.lower(models.Post.content).contains(term, autoescape=True))
+        for term in terms
+    ))).order_by(models.Post.id)
+
+@router.get("/posts/search", response_model=schemas.PostSearchResponse)
+async def search_posts(q: str = Query(..., min_length=1, max_length=256), offset: int = Query(0, ge=0), limit: int = Query(DEFAULT_SEARCH_LIMIT, ge=1, le=MAX_SEARCH_LIMIT), db: AsyncSession = Depends(get_db)):
+    terms = list(dict.fromkeys(tokenize(q)))
+    if not terms:
+        return {"total": 0, "results": []}
+    stmt = _search_posts(db.bind.dialect.name, terms)
+    total = await db.scalar(select(func.count()).select_from(stmt.order_by(None).subquery()))
+    rows = (await db.execute(stmt.offset(offset).limit(limit))).all()
+    results = [{**schemas.Post.model_validate(post).model_dump(), "score": score} for post, score in rows]
+    return {"total": total, "results": results}
+
+async def _load_post(db: AsyncSession, post_id: int) -> Optional[CachedResponse]:
+    post = await db.get(models.Post, post_id)
+    if post is None:
+        return None
+    body = schemas.Post.model_validate(post).model_dump_json().encode()
+    return CachedResponse(body, make_etag("post", post_id, row_version(post)))
 
 @router.get("/posts/{post_id}", response_model=schemas.Post)
-def get_post(post_id: int, db: Session = Depends(get_db)):
-    post = db.query(models.Post).filter(models.Post.id == post_id).first()
-    if not post:
+async def get_post(post_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    cached = await post_cache.get_or_load(post_id, lambda: _load_post(db, post_id))
+    if cached is None:
         raise HTTPException(status_code=404, detail="Post not found")
-    return post
+    check_not_modified(request, response, cached.etag)
+    return cached.response(response)
 
 @router.get("/posts/author/{author_id}", response_model=List[schemas.Post])
-def get_posts_by_author(author_id: int, db: Session = Depends(get_db)):
-    posts = db.query(models.Post).filter(models.Post.author_id == author_id).all()
-    return posts
+async def get_posts_by_author(author_id: int, request: Request, response: Response, cursor: Optional[str] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), db: AsyncSession = Depends(get_db)):
+    stmt = select(models.Post).where(models.Post.author_id == author_id)
+    posts = (await db.scalars(_page_posts(stmt, cursor, limit))).all()
+    check_not_modified(request, response, _page_etag(posts))
+    return post_list.response(paginate(response, posts, limit), response)
+
+@router.get("/posts/{post_id}/page", response_model=schemas.PostPage)
+async def get_post_page(post_id: int, response: Response, cursor: Optional[str] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), db: AsyncSession = Depends(get_db)):
+    """The post, a page of its comments and each distinct author, in one response"""
+    # Read the post from the DB while comment-service is fetching comments
+    comments_task = asyncio.ensure_future(fetch_comments(post_id, cursor, limit))
+    try:
+        post = await db.get(models.Post, post_id)
+        if post is None:
+            raise HTTPException(status_code=404, detail="Post not found")
+        
+        unavailable = []
+        try:
+            comments, next_cursor = await comments_task
+        except UpstreamUnavailable:
+            comments, next_cursor = [], None
+            unavailable.append("comment-service")
+    finally:
+        if not comments_task.done():
+            # No post, or the read failed: nobody will want the comments
+            comments_task.cancel()
+            await asyncio.gather(comments_task, return_exceptions=True)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    
+    author_ids = list(dict.fromkeys([post.author_id, *(c["author_id"] for c in comments)]))
+    try:
+        authors = await fetch_users(author_ids)
+    except UpstreamUnavailable:
+        authors = []
+        unavailable.append("user-service")
+    
+    return {"post": post, "comments": comments, "authors": authors, "unavailable": unavailable}
 
 @router.put("/posts/{post_id}", response_model=schemas.Post)
-def update_post(post_id: int, post_update: schemas.PostUpdate, db: Session = Depends(get_db)):
-    post = db.query(models.Post).filter(models.Post.id == post_id).first()
+async def update_post(post_id: int, post_update: schemas.PostUpdate, db: AsyncSession = Depends(get_db)):
+    changes = post_update.model_dump(exclude_unset=True)
+    if not changes:
+        post = await db.get(models.Post, post_id)
+        if not post:
+            raise HTTPException(status_code=404, detail="Post not found")
+        return post
+    
+    # One UPDATE ... RETURNING, no pre-SELECT or refresh
+    stmt = update(models.Post).where(models.Post.id == post_id).values(**changes).returning(models.Post)
+    post = await db.scalar(stmt)
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
-    
-    for field, value in post_update.model_dump(exclude_unset=True).items():
-        setattr(post, field, value)
-    
-    db.commit()
-    db.refresh(post)
+    await db.commit()
+    post_cache.invalidate(post_id)
+    bus.publish("posts", UPDATED, post_id)
     return post
 
 @router.delete("/posts/{post_id}")
-def delete_post(post_id: int, db: Session = Depends(get_db)):
-    post = db.query(models.Post).filter(models.Post.id == post_id).first()
-    if not post:
+async def delete_post(post_id: int, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)):
+    deleted = await db.scalar(delete(models.Post).where(models.Post.id == post_id).returning(models.Post.id))
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Post not found")
-    
-    db.delete(post)
-    db.commit()
+    await db.commit()
+    post_cache.invalidate(post_id)
+    bus.publish("posts", DELETED, post_id)
+    background_tasks.add_task(notify_post_deleted, post_id)
     return {"message": "Post deleted successfully"}
\ No newline at end of file
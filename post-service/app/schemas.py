@@ -1,6 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
 class PostBase(BaseModel):
     title: str
@@ -20,4 +20,35 @@ class Post(PostBase):
     updated_at: Optional[datetime] = None
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class PostHit(Post):
+    score: float
+
+class PostSearchResponse(BaseModel):
+    total: int
+    results: List[PostHit]
+
+class ExistsRequest(BaseModel):
+    ids: List[int] = Field(max_length=10000)
+
+class ExistsResponse(BaseModel):
+    existing: List[int]
+    missing: List[int]
+
+class BulkItemResult(BaseModel):
+    index: int
+    status: int
+    item: Optional[Post] = None
+    error: Optional[str] = None
+
+class BulkResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[BulkItemResult]
+
+class PostPage(BaseModel):
+    post: Post
+    comments: List[Dict[str, Any]]
+    authors: List[Dict[str, Any]]
+    unavailable: List[str] = []
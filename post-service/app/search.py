@@ -0,0 +1,102 @@
+import heapq
+import math
+import os
+import re
+from collections import Counter
+from threading import RLock
+from typing import Dict, List, Tuple
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = int(os.getenv("MAX_SEARCH_LIMIT", "100"))
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens, the same for documents and queries"""
+    return _TOKEN.findall(text.lower())
+
+
+class InvertedIndex:
+    """In-process full-text index with BM25 ranking.
+
+    Each term maps to the ids of the documents containing it and the term
+    frequency in each, so a query only touches the postings of its own
+    terms. Documents are added, replaced and removed one at a time as the
+    records they mirror change, touching only that document's postings. A
+    query matches documents containing every query term, ranked by Okapi
+    BM25 (``k1``, ``b``).
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._lengths: Dict[int, int] = {}
+        self._terms: Dict[int, Tuple[str, ...]] = {}
+        self._total_length = 0
+        self._lock = RLock()
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def __contains__(self, doc_id: int) -> bool:
+        return doc_id in self._lengths
+
+    def add(self, doc_id: int, text: str):
+        """Index ``text`` under ``doc_id``, replacing what was there before"""
+        terms = tokenize(text)
+        frequencies = Counter(terms)
+        with self._lock:
+            self.remove(doc_id)
+            for term, frequency in frequencies.items():
+                self._postings.setdefault(term, {})[doc_id] = frequency
+            self._terms[doc_id] = tuple(frequencies)
+            self._lengths[doc_id] = len(terms)
+            self._total_length += len(terms)
+
+    def remove(self, doc_id: int):
+        with self._lock:
+            terms = self._terms.pop(doc_id, None)
+            if terms is None:
+                return
+            self._total_length -= self._lengths.pop(doc_id)
+            for term in terms:
+                postings = self._postings[term]
+                del postings[doc_id]
+                if not postings:
+                    del self._postings[term]
+
+    def search(self, query: str, offset: int = 0, limit: int = DEFAULT_SEARCH_LIMIT) -> Tuple[int, List[Tuple[int, float]]]:
+        """Return the number of matches and one page of ``(doc_id, score)``.
+
+        Results are ordered by descending score, then ascending id.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return 0, []
+        with self._lock:
+            postings = [self._postings.get(term) for term in terms]
+            if not all(postings):
+                return 0, []
+
+            # Intersect starting from the rarest term so the candidate set is small
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            for other in postings[1:]:
+                candidates.intersection_update(other)
+                if not candidates:
+                    return 0, []
+
+            documents = len(self._lengths)
+            average_length = self._total_length / documents
+            scores = dict.fromkeys(candidates, 0.0)
+            for frequencies in postings:
+                idf = math.log(1 + (documents - len(frequencies) + 0.5) / (len(frequencies) + 0.5))
+                for doc_id in candidates:
+                    tf = frequencies[doc_id]
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / average_length)
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        top = heapq.nsmallest(offset + limit, scores.items(), key=lambda item: (-item[1], item[0]))
+        return len(candidates), top[offset:]
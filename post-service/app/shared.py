@@ -0,0 +1,201 @@
+"""Shared in-memory state for running one service under several workers.
+
+With ``STORE_SOCKET`` set, stores and search indexes live in a single
+owner process and every uvicorn worker reaches them over that Unix socket,
+so all workers see one dataset and ids are allocated in one place. The
+first worker to start spawns the owner; the rest connect to it. The owner
+outlives worker restarts and, with ``PERSIST_DIR`` set, persists its
+stores itself.
+
+    STORE_SOCKET=/tmp/post-service.sock uvicorn app.main:app --workers 4
+"""
+import fcntl
+import importlib
+import logging
+import os
+import secrets
+import signal
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.managers import BaseManager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .persistence import Persistence
+from .store import IndexedStore
+
+logger = logging.getLogger(__name__)
+
+STORE_METHODS = (
+    "__len__", "__contains__", "all", "page", "get", "get_versioned", "collection_version",
+    "get_many", "get_by", "find", "count", "insert", "insert_many", "update", "delete",
+)
+INDEX_METHODS = ("__len__", "__contains__", "add", "remove", "search")
+CONNECT_TIMEOUT = float(os.getenv("STORE_CONNECT_TIMEOUT", "10"))
+
+# Owner-side registry: one object per name, created on first request
+_objects: Dict[Tuple[str, str], object] = {}
+_persistences: List[Persistence] = []
+_registry_lock = threading.Lock()
+
+
+def _get_store(name: str, unique: Tuple[str, ...], indexed: Tuple[str, ...],
+               columns: Optional[Dict[str, str]] = None) -> IndexedStore:
+    with _registry_lock:
+        store = _objects.get(("store", name))
+        if store is None:
+            store = _objects["store", name] = IndexedStore(unique, indexed, columns=columns)
+            persistence = Persistence.from_env(name)
+            if persistence is not None:
+                persistence.attach(store)
+                _persistences.append(persistence)
+        return store
+
+
+def _get_index(name: str, store_name: str, fields: Tuple[str, ...]):
+    """Search index over ``fields`` of a store, built from its records on creation"""
+    with _registry_lock:
+        index = _objects.get(("index", name))
+        if index is None:
+            # search.py only exists in the services that offer search
+            search = importlib.import_module(".search", __package__)
+            index = _objects["index", name] = search.InvertedIndex()
+            store = _objects.get(("store", store_name))
+            for record in store or ():
+                index.add(record["id"], " ".join(record[field] for field in fields))
+        return index
+
+
+class StoreManager(BaseManager):
+    pass
+
+
+StoreManager.register("store", callable=_get_store, exposed=STORE_METHODS)
+StoreManager.register("index", callable=_get_index, exposed=INDEX_METHODS)
+
+
+class _Remote:
+    """Forwards method calls to an object in the owner process"""
+
+    def __init__(self, proxy):
+        self._proxy = proxy
+
+    def __getattr__(self, method: str):
+        def call(*args, **kwargs):
+            return self._proxy._callmethod(method, args, kwargs)
+        return call
+
+    def __len__(self) -> int:
+        return self._proxy._callmethod("__len__")
+
+    def __contains__(self, key) -> bool:
+        return self._proxy._callmethod("__contains__", (key,))
+
+
+class SharedStore(_Remote):
+    """IndexedStore interface onto the owner's store.
+
+    Iteration pages through the remote store rather than holding a live
+    iterator across the socket.
+    """
+
+    def __iter__(self) -> Iterator[dict]:
+        return self.scan()
+
+    def insert_many(self, records: Iterable[dict]) -> List[dict]:
+        # Generators cannot be pickled, so send the records as a list
+        return self._proxy._callmethod("insert_many", (list(records),))
+
+    def scan(self, batch_size: int = 1000, field: Optional[str] = None, value=None) -> Iterator[dict]:
+        after_id = 0
+        while True:
+            records = self.page(after_id, batch_size, field, value)
+            yield from records
+            if len(records) < batch_size:
+                return
+            after_id = records[-1]["id"]
+
+
+class SharedState:
+    """Connection to the owner process, started on first use"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.manager = self._connect_or_spawn()
+
+    @classmethod
+    def from_env(cls) -> Optional["SharedState"]:
+        path = os.getenv("STORE_SOCKET")
+        return cls(path) if path else None
+
+    def store(self, name: str, unique: Iterable[str] = (), indexed: Iterable[str] = (),
+              columns: Optional[Dict[str, str]] = None) -> SharedStore:
+        return SharedStore(self.manager.store(name, tuple(unique), tuple(indexed), columns))
+
+    def index(self, name: str, store_name: str, fields: Iterable[str]) -> _Remote:
+        return _Remote(self.manager.index(name, store_name, tuple(fields)))
+
+    def _connect(self) -> StoreManager:
+        with open(f"{self.path}.key", "rb") as f:
+            authkey = f.read()
+        manager = StoreManager(address=self.path, authkey=authkey)
+        manager.connect()
+        return manager
+
+    def _connect_or_spawn(self) -> StoreManager:
+        try:
+            return self._connect()
+        except (FileNotFoundError, ConnectionRefusedError):
+            pass
+        # One worker spawns the owner while the others wait on the lock
+        with open(f"{self.path}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                return self._connect()
+            except (FileNotFoundError, ConnectionRefusedError):
+                pass
+            for stale in (self.path, f"{self.path}.key"):
+                if os.path.exists(stale):
+                    os.remove(stale)
+            fd = os.open(f"{self.path}.key", os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(secrets.token_bytes(32))
+            service_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            subprocess.Popen(
+                [sys.executable, "-m", f"{__package__}.shared", self.path],
+                cwd=service_root,
+                start_new_session=True,
+            )
+            deadline = time.monotonic() + CONNECT_TIMEOUT
+            while True:
+                try:
+                    return self._connect()
+                except (FileNotFoundError, ConnectionRefusedError):
+                    if time.monotonic() > deadline:
+                        raise
+                    time.sleep(0.05)
+
+
+def serve(path: str):
+    """Run the owner process until SIGTERM or SIGINT"""
+    os.umask(0o077)
+    with open(f"{path}.key", "rb") as f:
+        authkey = f.read()
+    server = StoreManager(address=path, authkey=authkey).get_server()
+    with open(f"{path}.pid", "w") as f:
+        f.write(str(os.getpid()))
+    stop = lambda *_: server.stop_event.set()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    logger.info("Store owner listening on %s", path)
+    try:
+        server.serve_forever()
+    finally:
+        for persistence in _persistences:
+            persistence.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    serve(sys.argv[1])
@@ -0,0 +1,48 @@
+import json
+import os
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Iterable, Iterator
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Records per chunk written to the socket, and per server-side cursor fetch
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+
+def ndjson_stream(
+    items: Iterable[Any],
+    encode: Callable[[Any], str] = json.dumps,
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> Iterator[bytes]:
+    """Encode ``items`` as newline-delimited JSON, ``batch_size`` lines per chunk.
+
+    Only one chunk is held in memory at a time, so memory stays flat and
+    the first bytes go out as soon as the first batch is read.
+    """
+    lines = []
+    for item in items:
+        lines.append(encode(item))
+        if len(lines) >= batch_size:
+            lines.append("")
+            yield "\n".join(lines).encode()
+            lines = []
+    if lines:
+        lines.append("")
+        yield "\n".join(lines).encode()
+
+
+async def ndjson_astream(
+    items: AsyncIterable[Any],
+    encode: Callable[[Any], str] = json.dumps,
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> AsyncIterator[bytes]:
+    """Async counterpart of ndjson_stream, for rows from an async DB cursor"""
+    lines = []
+    async for item in items:
+        lines.append(encode(item))
+        if len(lines) >= batch_size:
+            lines.append("")
+            yield "\n".join(lines).encode()
+            lines = []
+    if lines:
+        lines.append("")
+        yield "\n".join(lines).encode()
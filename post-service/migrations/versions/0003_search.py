@@ -0,0 +1,50 @@
+"""Full-text search: a GIN index on PostgreSQL, an FTS5 table on SQLite
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+SQLITE_FTS = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(title, content, content='posts', content_rowid='id')",
+    """CREATE TRIGGER IF NOT EXISTS posts_fts_insert AFTER INSERT ON posts BEGIN
+        INSERT INTO posts_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS posts_fts_delete AFTER DELETE ON posts BEGIN
+        INSERT INTO posts_fts(posts_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS posts_fts_update AFTER UPDATE OF title, content ON posts BEGIN
+        INSERT INTO posts_fts(posts_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO posts_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    # Index the rows written before the triggers existed
+    "INSERT INTO posts_fts(posts_fts) VALUES ('rebuild')",
+)
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == "postgresql":
+        op.execute(
+            "CREATE INDEX IF NOT EXISTS ix_posts_search ON posts "
+            "USING gin (to_tsvector('english'::regconfig, title || ' ' || content))"
+        )
+    elif dialect == "sqlite":
+        for statement in SQLITE_FTS:
+            op.execute(statement)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_posts_search")
+    elif dialect == "sqlite":
+        for trigger in ("posts_fts_insert", "posts_fts_delete", "posts_fts_update"):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS posts_fts")
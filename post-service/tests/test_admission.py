@@ -0,0 +1,173 @@
+"""Rate limits, concurrency slots, priority and shedding"""
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+from app.admission import READ, WRITE, AdmissionController, AdmissionMiddleware, Rejection, TokenBucket
+
+pytestmark = pytest.mark.anyio
+
+
+def scope(method: str = "GET", path: str = "/items") -> dict:
+    return {"type": "http", "method": method, "path": path, "root_path": "", "query_string": b"",
+            "headers": [], "client": ("10.0.0.1", 1234)}
+
+
+def test_token_bucket_refills_at_its_rate():
+    bucket = TokenBucket(rate=2, burst=2)
+    now = bucket.updated
+    assert bucket.take(now) == 0 and bucket.take(now) == 0
+    assert bucket.take(now) == pytest.approx(0.5)
+    assert bucket.take(now + 0.5) == 0
+
+
+def test_client_rate_is_per_client():
+    controller = AdmissionController(client_rate=1, client_burst=1)
+    controller.check_rate(scope())
+    with pytest.raises(Rejection) as refused:
+        controller.check_rate(scope())
+    assert (refused.value.status, refused.value.reason) == (429, "client_rate")
+    other = {**scope(), "client": ("10.0.0.2", 1)}
+    controller.check_rate(other)
+
+
+def test_lookups_posted_to_a_colon_path_are_reads():
+    assert AdmissionController.priority(scope("POST", "/api/v1/users:exists")) == READ
+    assert AdmissionController.priority(scope("POST", "/api/v1/posts")) == WRITE
+
+
+async def test_freed_slot_goes_to_the_oldest_read_first():
+    controller = AdmissionController(concurrency=1)
+    await controller.acquire(WRITE)
+    order = []
+
+    async def wait(priority):
+        await controller.acquire(priority)
+        order.append(priority)
+        controller.release()
+
+    waiters = [asyncio.ensure_future(wait(WRITE)), asyncio.ensure_future(wait(READ))]
+    await asyncio.sleep(0)
+    controller.release()
+    await asyncio.gather(*waiters)
+    assert order == [READ, WRITE]
+    assert controller._active == 0
+
+
+async def test_waiting_past_the_limit_is_refused():
+    controller = AdmissionController(concurrency=1, read_max_wait=0.01)
+    await controller.acquire(READ)
+    with pytest.raises(Rejection) as refused:
+        await controller.acquire(READ)
+    assert (refused.value.status, refused.value.reason) == (503, "queue_timeout")
+
+
+async def test_standing_queue_sheds_writes():
+    controller = AdmissionController(concurrency=1, target_delay=0.001, interval=0.0, write_max_wait=1.0)
+    await controller.acquire(READ)
+    # A whole interval in which no request got a slot within target
+    controller._observe(0.01)
+    assert controller.shedding
+    with pytest.raises(Rejection) as refused:
+        await controller.acquire(WRITE)
+    assert refused.value.reason == "shed"
+
+
+def make_app(controller: AdmissionController, release: asyncio.Event, chunks: int = 3):
+    app = FastAPI()
+
+    @app.get("/slow")
+    async def slow():
+        await release.wait()
+        return {"ok": True}
+
+    @app.get("/export")
+    async def export():
+        async def rows():
+            for i in range(chunks):
+                yield f"{i}\n"
+                await release.wait()
+        return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    app.add_middleware(AdmissionMiddleware, controller=controller)
+    return app
+
+
+async def test_refusals_carry_retry_after_and_exempt_paths_pass():
+    controller = AdmissionController(concurrency=1, read_max_wait=0.01)
+    release = asyncio.Event()
+    transport = httpx.ASGITransport(app=make_app(controller, release))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        first = asyncio.ensure_future(client.get("/slow"))
+        await asyncio.sleep(0.01)
+        refused = await client.get("/slow")
+        assert refused.status_code == 503
+        assert refused.json()["reason"] == "queue_timeout"
+        assert refused.headers["retry-after"] == "1"
+        assert (await client.get("/health")).status_code == 200
+        release.set()
+        assert (await first).status_code == 200
+
+
+async def test_route_limit_refuses_past_the_limit():
+    controller = AdmissionController(route_limits={"GET /slow": 1})
+    release = asyncio.Event()
+    app = make_app(controller, release)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        first = asyncio.ensure_future(client.get("/slow"))
+        await asyncio.sleep(0.01)
+        assert (await client.get("/slow")).json()["reason"] == "route_limit"
+        release.set()
+        assert (await first).status_code == 200
+
+
+async def test_streamed_body_gives_back_its_slot():
+    controller = AdmissionController(concurrency=1, streams=1)
+    release = asyncio.Event()
+    app = make_app(controller, release)
+
+    async def receive():
+        await asyncio.sleep(3600)
+
+    received = []
+
+    async def send(message):
+        received.append(message)
+
+    export = asyncio.ensure_future(app(scope("GET", "/export"), receive, send))
+    await asyncio.sleep(0.01)
+    # Streaming: the slot is free for others, the stream slot is taken
+    assert controller._active == 0 and controller._streaming == 1
+    await controller.acquire(READ)
+    controller.release()
+    release.set()
+    await export
+    assert controller._streaming == 0
+    assert b"".join(m.get("body", b"") for m in received if m["type"] == "http.response.body") == b"0\n1\n2\n"
+
+
+async def test_stream_keeps_its_slot_when_stream_slots_are_full():
+    controller = AdmissionController(concurrency=2, streams=0)
+    release = asyncio.Event()
+    app = make_app(controller, release)
+
+    async def receive():
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        pass
+
+    export = asyncio.ensure_future(app(scope("GET", "/export"), receive, send))
+    await asyncio.sleep(0.01)
+    assert controller._active == 1
+    release.set()
+    await export
+    assert controller._active == 0
@@ -0,0 +1,46 @@
+"""ExistenceBatcher coalesces concurrent checks"""
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.clients import ExistenceBatcher, ServiceClient, UpstreamUnavailable
+
+pytestmark = pytest.mark.anyio
+
+
+def users_service(existing, batches: list) -> ServiceClient:
+    def handler(request):
+        ids = json.loads(request.content)["ids"]
+        batches.append(ids)
+        return httpx.Response(200, json={"existing": [i for i in ids if i in existing],
+                                         "missing": [i for i in ids if i not in existing]})
+
+    client = ServiceClient("user-service", "http://users")
+    client._client = httpx.AsyncClient(base_url=client.base_url, transport=httpx.MockTransport(handler))
+    return client
+
+
+async def test_concurrent_checks_share_one_request():
+    batches = []
+    batcher = ExistenceBatcher(users_service({1, 2}, batches), "/api/v1/users:exists", window=0.005)
+    results = await asyncio.gather(*(batcher.exists(i) for i in (1, 2, 3, 1)))
+    assert results == [True, True, False, True]
+    assert batches == [[1, 2, 3]]
+
+
+async def test_full_batch_is_sent_at_once():
+    batches = []
+    batcher = ExistenceBatcher(users_service(set(range(10)), batches), "/x", window=60, max_batch=3)
+    assert await asyncio.wait_for(asyncio.gather(*(batcher.exists(i) for i in range(3))), 1) == [True] * 3
+    assert batches == [[0, 1, 2]]
+
+
+async def test_failed_batch_fails_every_caller():
+    client = ServiceClient("user-service", "http://users")
+    client._client = httpx.AsyncClient(base_url=client.base_url,
+                                       transport=httpx.MockTransport(lambda request: httpx.Response(404)))
+    batcher = ExistenceBatcher(client, "/api/v1/users:exists", window=0.001)
+    results = await asyncio.gather(batcher.exists(1), batcher.exists(2), return_exceptions=True)
+    assert all(isinstance(result, UpstreamUnavailable) for result in results)
@@ -0,0 +1,35 @@
+"""Bulk create: per-item validation and results"""
+import pytest
+from pydantic import BaseModel
+
+from app import routes
+from app.bulk import item_created, item_error, summarize, validate_items
+from app.events import CREATED, IdReplica
+
+pytestmark = pytest.mark.anyio
+
+
+class Item(BaseModel):
+    name: str
+    size: int
+
+
+def test_invalid_items_get_their_own_422():
+    valid, errors = validate_items(Item, [{"name": "a", "size": 1}, {"name": "b"}, {"name": "c", "size": "x"}])
+    assert [(index, item.name) for index, item in valid] == [(0, "a")]
+    assert [(error["index"], error["status"]) for error in errors] == [(1, 422), (2, 422)]
+    assert "size" in errors[0]["error"]
+
+
+def test_summary_is_in_input_order():
+    summary = summarize([item_error(2, 400, "no"), item_created(0, {"id": 1}), item_error(1, 422, "bad")])
+    assert summary["created"] == 1 and summary["failed"] == 2
+    assert [result["index"] for result in summary["results"]] == [0, 1, 2]
+
+
+async def test_bulk_request_size_is_bounded(client, monkeypatch):
+    monkeypatch.setattr(routes, "user_replica", IdReplica())
+    routes.user_replica.apply({"type": CREATED, "id": 1})
+    items = [{"title": "t", "content": "c", "author_id": 1}] * (routes.BULK_MAX_ITEMS + 1)
+    assert (await client.post("/api/v1/posts/bulk", json=items)).status_code == 422
+    assert (await client.post("/api/v1/posts/bulk", json=[])).json() == {"created": 0, "failed": 0, "results": []}
@@ -0,0 +1,243 @@
+"""ExistenceCache and ResponseCache: single flight, invalidation, bounds
+and defaults
+"""
+import asyncio
+import os
+
+import pytest
+
+from app import routes
+from app.cache import CachedResponse, DirectoryTier, ExistenceCache, ResponseCache
+from app.events import CREATED, IdReplica
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_existence_is_loaded_once_and_cached():
+    cache = ExistenceCache()
+    calls = 0
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return True
+
+    assert await asyncio.gather(*(cache.get_or_load(1, load) for _ in range(5))) == [True] * 5
+    assert await cache.get_or_load(1, load)
+    assert calls == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_misses_expire_sooner_than_hits(monkeypatch):
+    cache = ExistenceCache(ttl=60, negative_ttl=5)
+    clock = [1000.0]
+    monkeypatch.setattr("app.cache.time.monotonic", lambda: clock[0])
+    cache.set("live", True)
+    cache.set("gone", False)
+    clock[0] += 10
+    assert cache.get("live") is True
+    assert cache.get("gone") is None
+
+
+async def test_existence_deleted_during_a_load_is_not_cached():
+    cache = ExistenceCache()
+    started, release = asyncio.Event(), asyncio.Event()
+
+    async def load():
+        started.set()
+        await release.wait()
+        return True
+
+    reader = asyncio.ensure_future(cache.get_or_load(1, load))
+    await started.wait()
+    # The delete event arrives while the upstream answer is on its way
+    cache.invalidate(1)
+    release.set()
+    assert await reader is True
+    assert cache.get(1) is None
+
+
+async def test_cancelling_the_first_caller_does_not_fail_the_others():
+    cache = ExistenceCache()
+    started, release = asyncio.Event(), asyncio.Event()
+    loads = 0
+
+    async def load():
+        nonlocal loads
+        loads += 1
+        started.set()
+        await release.wait()
+        return True
+
+    first = asyncio.ensure_future(cache.get_or_load(1, load))
+    await started.wait()
+    second = asyncio.ensure_future(cache.get_or_load(1, load))
+    await asyncio.sleep(0)
+    first.cancel()
+    release.set()
+    assert await second is True
+    assert first.cancelled()
+    assert loads == 1 and cache.get(1) is True
+
+
+def body(text: str) -> CachedResponse:
+    return CachedResponse(text.encode(), f'W/"{text}"')
+
+
+async def test_concurrent_misses_share_one_load():
+    cache = ResponseCache()
+    loads = 0
+
+    async def load():
+        nonlocal loads
+        loads += 1
+        await asyncio.sleep(0.01)
+        return body("v1")
+
+    results = await asyncio.gather(*(cache.get_or_load(1, load) for _ in range(10)))
+    assert loads == 1
+    assert set(results) == {body("v1")}
+    assert cache.get(1) == body("v1")
+
+
+async def test_load_overlapping_an_invalidation_is_not_cached():
+    cache = ResponseCache()
+    started, release = asyncio.Event(), asyncio.Event()
+
+    async def load():
+        started.set()
+        await release.wait()
+        return body("before-write")
+
+    reader = asyncio.ensure_future(cache.get_or_load(1, load))
+    await started.wait()
+    cache.invalidate(1)
+    release.set()
+    assert await reader == body("before-write")
+    assert cache.get(1) is None
+
+
+async def test_a_cancelled_reader_leaves_the_load_to_the_others():
+    cache = ResponseCache()
+    started, release = asyncio.Event(), asyncio.Event()
+
+    async def load():
+        started.set()
+        await release.wait()
+        return body("v1")
+
+    first = asyncio.ensure_future(cache.get_or_load(1, load))
+    await started.wait()
+    second = asyncio.ensure_future(cache.get_or_load(1, load))
+    await asyncio.sleep(0)
+    first.cancel()
+    release.set()
+    assert await second == body("v1")
+    assert cache.get(1) == body("v1")
+
+
+async def test_missing_records_and_failures_are_not_cached():
+    cache = ResponseCache()
+
+    async def missing():
+        return None
+
+    async def failing():
+        raise RuntimeError("db down")
+
+    assert await cache.get_or_load(1, missing) is None
+    with pytest.raises(RuntimeError):
+        await cache.get_or_load(2, failing)
+    assert len(cache) == 0
+
+
+def test_lru_is_bounded_by_bytes():
+    cache = ResponseCache(max_bytes=10)
+    cache.set(1, body("aaaa"))
+    cache.set(2, body("bbbb"))
+    cache.set(3, body("cccc"))
+    assert cache.get(1) is None
+    assert cache.stats()["bytes"] == 8
+
+
+def test_lru_is_off_by_default_without_a_file_bus(monkeypatch):
+    monkeypatch.delenv("EVENT_BUS_DIR", raising=False)
+    monkeypatch.delenv("READ_CACHE_SIZE", raising=False)
+    assert ResponseCache.from_env("posts").maxsize == 0
+    monkeypatch.setenv("EVENT_BUS_DIR", "/tmp/bus")
+    assert ResponseCache.from_env("posts").maxsize == 10000
+    monkeypatch.delenv("EVENT_BUS_DIR")
+    monkeypatch.setenv("READ_CACHE_SIZE", "50")
+    assert ResponseCache.from_env("posts").maxsize == 50
+
+
+async def test_workers_sharing_a_directory_see_each_others_writes(tmp_path, monkeypatch):
+    monkeypatch.delenv("EVENT_BUS_DIR", raising=False)
+    monkeypatch.delenv("READ_CACHE_SIZE", raising=False)
+    monkeypatch.setenv("READ_CACHE_DIR", str(tmp_path))
+    worker_a, worker_b = ResponseCache.from_env("posts"), ResponseCache.from_env("posts")
+    version = "v1"
+
+    async def load():
+        return body(version)
+
+    assert await worker_a.get_or_load(1, load) == body("v1")
+    assert await worker_b.get_or_load(1, load) == body("v1")
+    assert worker_b.shared_hits == 1
+    version = "v2"
+    worker_a.invalidate(1)
+    assert await worker_b.get_or_load(1, load) == body("v2")
+
+
+async def test_load_overlapping_another_workers_write_is_not_shared(tmp_path):
+    worker_a = ResponseCache(maxsize=0, shared=DirectoryTier(str(tmp_path), "posts"))
+    worker_b = ResponseCache(maxsize=0, shared=DirectoryTier(str(tmp_path), "posts"))
+    started, release = asyncio.Event(), asyncio.Event()
+
+    async def slow_load():
+        started.set()
+        await release.wait()
+        return body("before-write")
+
+    async def load():
+        return body("after-write")
+
+    reader = asyncio.ensure_future(worker_a.get_or_load(1, slow_load))
+    await started.wait()
+    # Worker B commits a write and invalidates while A is still loading
+    worker_b.invalidate(1)
+    release.set()
+    assert await reader == body("before-write")
+    assert worker_a.shared.get(1) is None
+    assert await worker_b.get_or_load(1, load) == body("after-write")
+    assert await worker_a.get_or_load(1, slow_load) == body("after-write")
+
+
+def test_invalidation_between_check_and_write_removes_the_entry(tmp_path, monkeypatch):
+    tier = DirectoryTier(str(tmp_path), "posts")
+    generation = tier.generation(1)
+    replace = os.replace
+
+    def invalidate_then_replace(source, target):
+        # The invalidation deletes before the entry is written
+        if not target.endswith(".gen"):
+            tier.invalidate(1)
+        replace(source, target)
+
+    monkeypatch.setattr(os, "replace", invalidate_then_replace)
+    assert not tier.set(1, body("v1"), generation)
+    monkeypatch.setattr(os, "replace", replace)
+    assert tier.get(1) is None
+    assert tier.set(1, body("v2"), tier.generation(1)) and tier.get(1) == body("v2")
+
+
+async def test_get_post_sees_its_own_update(client, monkeypatch):
+    monkeypatch.setattr(routes, "user_replica", IdReplica())
+    monkeypatch.setattr(routes, "post_cache", ResponseCache())
+    routes.user_replica.apply({"type": CREATED, "id": 1})
+    await client.post("/api/v1/posts", json={"title": "t", "content": "c", "author_id": 1})
+    assert (await client.get("/api/v1/posts/1")).json()["title"] == "t"
+    await client.put("/api/v1/posts/1", json={"title": "edited"})
+    assert (await client.get("/api/v1/posts/1")).json()["title"] == "edited"
+    assert routes.post_cache.stats()["misses"] == 2
@@ -0,0 +1,101 @@
+"""ServiceClient and its circuit breaker"""
+import httpx
+import pytest
+
+from app.clients import CircuitBreaker, ServiceClient, UpstreamUnavailable, read_body
+from app.tracing import TRACEPARENT_HEADER, Tracer, _current_span
+
+pytestmark = pytest.mark.anyio
+
+
+def upstream(handler, **kwargs) -> ServiceClient:
+    """A client whose calls are answered by ``handler`` instead of the network"""
+    client = ServiceClient("upstream", "http://upstream", **kwargs)
+    client._client = httpx.AsyncClient(base_url=client.base_url, transport=httpx.MockTransport(handler),
+                                       headers=client.headers)
+    return client
+
+
+def test_breaker_opens_after_consecutive_failures(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr("app.clients.time.monotonic", lambda: clock[0])
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    clock[0] += 10
+    # One trial call, the rest still held back
+    assert breaker.allow() and not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+async def test_server_errors_open_the_circuit():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(503)
+
+    client = upstream(handler, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+    for _ in range(2):
+        with pytest.raises(UpstreamUnavailable):
+            await client.get("/api/v1/users/1")
+    with pytest.raises(UpstreamUnavailable, match="circuit is open"):
+        await client.get("/api/v1/users/1")
+    assert len(calls) == 2
+    await client.aclose()
+
+
+async def test_client_errors_are_answers_not_failures():
+    client = upstream(lambda request: httpx.Response(404), breaker=CircuitBreaker(failure_threshold=1))
+    for _ in range(3):
+        assert (await client.get("/api/v1/users/1")).status_code == 404
+    assert client.breaker.state == "closed"
+    await client.aclose()
+
+
+async def test_transport_errors_become_upstream_unavailable():
+    def handler(request):
+        raise httpx.ConnectError("refused", request=request)
+
+    client = upstream(handler)
+    with pytest.raises(UpstreamUnavailable):
+        await client.get("/health")
+    assert client.breaker.failures == 1
+    await client.aclose()
+
+
+async def test_sampled_requests_pass_their_trace_on():
+    seen = {}
+
+    def handler(request):
+        seen.update(request.headers)
+        return httpx.Response(200, json={"ok": True})
+
+    client = upstream(handler)
+    span = Tracer("test", sample_rate=1.0).start_request(None, "GET")
+    token = _current_span.set(span)
+    try:
+        response = await client.get("/ping")
+    finally:
+        _current_span.reset(token)
+    assert read_body(response) == {"ok": True}
+    assert seen[TRACEPARENT_HEADER].startswith(f"00-{span.trace_id:032x}-")
+    await client.aclose()
+
+
+async def test_msgpack_is_asked_for_and_decoded():
+    msgpack = pytest.importorskip("msgpack")
+
+    def handler(request):
+        assert request.headers["accept"].startswith("application/msgpack")
+        return httpx.Response(200, content=msgpack.packb({"ids": [1, 2]}),
+                              headers={"content-type": "application/msgpack"})
+
+    client = upstream(handler, use_msgpack=True)
+    assert read_body(await client.get("/ids")) == {"ids": [1, 2]}
+    await client.aclose()
@@ -0,0 +1,103 @@
+"""RecordTable and IdArray: compact records, same output"""
+import tracemalloc
+
+import pytest
+
+from app.columns import INT, SHARED_TEXT, TEXT, TIMESTAMP, IdArray, RecordTable
+
+LAYOUT = {"content": TEXT, "post_id": INT, "status": SHARED_TEXT, "created_at": TIMESTAMP}
+
+
+def comment(record_id: int, **overrides) -> dict:
+    record = {"id": record_id, "content": f"c{record_id}", "post_id": 7, "status": "visible",
+              "created_at": "2024-05-01T12:00:00.123456"}
+    return {**record, **overrides}
+
+
+@pytest.mark.parametrize("created_at", [
+    "2024-05-01T12:00:00.123456", "2024-05-01T12:00:00", "1969-12-31T23:59:59.999999",
+    "2024-02-29T00:00:00.000001", None,
+])
+def test_records_read_back_equal_with_the_same_key_order(created_at):
+    table = RecordTable(LAYOUT)
+    stored = comment(1, created_at=created_at, content=None)
+    table[1] = stored
+    assert list(table[1].items()) == list(stored.items())
+    assert not table._loose
+
+
+@pytest.mark.parametrize("record", [
+    comment(1, created_at="2024-05-01 12:00:00"),    # would print back with a T
+    comment(1, created_at="2024-05-01T12:00:00+00:00"),
+    comment(1, post_id=2 ** 63),
+    comment(1, post_id=True),
+    comment(1, extra="field"),
+    {"content": "c", "id": 1, "post_id": 7, "status": "visible", "created_at": None},
+])
+def test_records_that_do_not_fit_are_kept_as_they_are(record):
+    table = RecordTable(LAYOUT)
+    table[1] = record
+    assert table[1] == record and list(table[1]) == list(record)
+    assert table.value(1, "post_id") == record["post_id"]
+    # Rewritten to fit, it moves into the columns
+    table[1] = comment(1)
+    assert table[1] == comment(1) and not table._loose
+
+
+def test_dict_interface_and_field_reads():
+    table = RecordTable(LAYOUT)
+    for record_id in (1, 2, 5):
+        table[record_id] = comment(record_id)
+    assert len(table) == 3 and list(table) == [1, 2, 5] and 3 not in table
+    assert table.rows([5, 3, 1]) == [comment(5), comment(1)]
+    assert table.value(2, "content") == "c2" and table.value(2, "id") == 2
+    assert table.value(4, "content", "missing") == "missing" and table.get(9) is None
+    with pytest.raises(KeyError):
+        table[4]
+    assert table.pop(2) == comment(2) and table.pop(2, "gone") == "gone"
+    assert list(table.values()) == [comment(1), comment(5)]
+
+
+def test_shared_text_is_one_object_per_value():
+    table = RecordTable(LAYOUT)
+    table[1] = comment(1, status="".join(["vis", "ible"]))
+    table[2] = comment(2, status="".join(["visi", "ble"]))
+    assert table[1]["status"] is table[2]["status"]
+
+
+def test_frozen_copy_ignores_later_writes():
+    table = RecordTable(LAYOUT)
+    table[1] = comment(1)
+    frozen = table.frozen()
+    table[1] = comment(1, content="edited")
+    table[2] = comment(2)
+    table.pop(1)
+    assert list(frozen.values()) == [comment(1)]
+
+
+def test_id_array_maps_ids_to_ints():
+    positions = IdArray()
+    positions[3] = 30
+    assert positions.get(3) == 30 and positions.get(2) is None and positions.get(100, -1) == -1
+    assert positions.pop(3) == 30 and positions.get(3) is None and positions.pop(50) is None
+
+
+def test_table_is_a_fraction_of_the_dicts():
+    def allocated(build) -> int:
+        tracemalloc.start()
+        kept = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del kept
+        return size
+
+    def dicts():
+        return {i: comment(i, content="x", created_at=f"2024-05-01T12:00:{i % 60:02d}.{i:06d}") for i in range(1, 10001)}
+
+    def table():
+        records = RecordTable(LAYOUT)
+        for i in range(1, 10001):
+            records[i] = comment(i, content="x", created_at=f"2024-05-01T12:00:{i % 60:02d}.{i:06d}")
+        return records
+
+    assert allocated(table) * 3 < allocated(dicts)
@@ -0,0 +1,36 @@
+"""Async engine and pool settings"""
+import asyncio
+
+import pytest
+from sqlalchemy import text
+
+from app import database
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("postgresql://u:p@db/posts", "postgresql+asyncpg://u:p@db/posts"),
+    ("postgres://u:p@db/posts", "postgresql+asyncpg://u:p@db/posts"),
+    ("postgresql+psycopg2://u:p@db/posts", "postgresql+asyncpg://u:p@db/posts"),
+    ("sqlite:///posts.db", "sqlite+aiosqlite:///posts.db"),
+    ("postgresql+asyncpg://u:p@db/posts", "postgresql+asyncpg://u:p@db/posts"),
+])
+def test_urls_get_an_asyncio_driver(url, expected):
+    assert database.async_url(url) == expected
+
+
+def test_pool_is_tuned_for_servers_only():
+    assert database.engine_options("sqlite:///posts.db") == {}
+    options = database.engine_options("postgresql://u:p@db/posts")
+    assert options["pool_size"] == database.DB_POOL_SIZE
+    assert options["max_overflow"] == database.DB_MAX_OVERFLOW
+    assert options["pool_pre_ping"] is database.DB_POOL_PRE_PING
+
+
+async def test_sessions_run_concurrently_on_the_event_loop(tables):
+    async def query(value: int) -> int:
+        async with database.SessionLocal() as db:
+            return await db.scalar(text("SELECT :value"), {"value": value})
+
+    assert await asyncio.gather(*(query(i) for i in range(5))) == list(range(5))
@@ -0,0 +1,72 @@
+"""ETags and 304 Not Modified"""
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app import routes
+from app.etag import etag_matches, make_etag
+from app.events import CREATED, IdReplica
+from app.negotiation import CompressionMiddleware, MessagePackMiddleware
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def negotiating_client(tables, monkeypatch):
+    """The SQL routes behind the negotiation middleware, as main.py stacks it"""
+    monkeypatch.setattr(routes, "user_replica", IdReplica())
+    routes.user_replica.apply({"type": CREATED, "id": 1})
+    app = FastAPI()
+    app.include_router(routes.router, prefix="/api/v1")
+    app.add_middleware(MessagePackMiddleware)
+    app.add_middleware(CompressionMiddleware, minimum_size=0)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+
+def test_weak_comparison():
+    etag = make_etag("post", 1, "v1")
+    assert etag.startswith('W/"') and etag == make_etag("post", 1, "v1")
+    assert etag_matches(etag.removeprefix("W/"), etag)
+    assert etag_matches(f'"other", {etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches(make_etag("post", 1, "v2"), etag)
+    assert not etag_matches(None, etag)
+
+
+async def test_unchanged_post_is_not_sent_again(negotiating_client):
+    client = negotiating_client
+    await client.post("/api/v1/posts", json={"title": "t", "content": "c", "author_id": 1})
+    first = await client.get("/api/v1/posts/1")
+    etag = first.headers["etag"]
+
+    again = await client.get("/api/v1/posts/1", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.content == b""
+    assert again.headers["etag"] == etag
+
+    await client.put("/api/v1/posts/1", json={"title": "edited"})
+    changed = await client.get("/api/v1/posts/1", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+
+
+async def test_304_carries_the_caching_headers_of_the_200(negotiating_client):
+    client = negotiating_client
+    await client.post("/api/v1/posts", json={"title": "t", "content": "c", "author_id": 1})
+    headers = {"Accept-Encoding": "gzip", "Accept": "application/json"}
+    first = await client.get("/api/v1/posts/1", headers=headers)
+    assert first.headers["content-encoding"] == "gzip"
+    again = await client.get("/api/v1/posts/1", headers={**headers, "If-None-Match": first.headers["etag"]})
+    assert again.status_code == 304
+    for name in ("vary", "cache-control", "etag"):
+        assert again.headers[name] == first.headers[name]
+    assert {token.strip() for token in again.headers["vary"].split(",")} == {"Accept", "Accept-Encoding"}
+
+
+async def test_list_pages_revalidate_too(negotiating_client):
+    client = negotiating_client
+    await client.post("/api/v1/posts", json={"title": "t", "content": "c", "author_id": 1})
+    first = await client.get("/api/v1/posts")
+    again = await client.get("/api/v1/posts", headers={"If-None-Match": first.headers["etag"]})
+    assert again.status_code == 304
+    await client.post("/api/v1/posts", json={"title": "t2", "content": "c", "author_id": 1})
+    assert (await client.get("/api/v1/posts", headers={"If-None-Match": first.headers["etag"]})).status_code == 200
@@ -0,0 +1,98 @@
+"""Event buses and id replicas"""
+import anyio
+import pytest
+
+from app import routes
+from app.events import CREATED, DELETED, UPDATED, FileBus, IdReplica, LocalBus
+
+
+def test_local_bus_calls_subscribers_of_the_topic():
+    bus = LocalBus()
+    seen = []
+    bus.subscribe("users", seen.append)
+    bus.subscribe("users", lambda event: 1 / 0)  # a failing handler does not stop the others
+    bus.publish("posts", CREATED, 1)
+    bus.publish_many("users", CREATED, [1, 2])
+    assert seen == [{"topic": "users", "type": CREATED, "id": 1}, {"topic": "users", "type": CREATED, "id": 2}]
+
+
+def test_replica_follows_creates_and_deletes():
+    deleted = []
+    replica = IdReplica(on_deleted=deleted.append)
+    for kind, record_id in ((CREATED, 1), (CREATED, 2), (UPDATED, 3), (DELETED, 1)):
+        replica.apply({"topic": "users", "type": kind, "id": record_id})
+    assert 1 not in replica and 2 in replica and len(replica) == 2
+    assert deleted == [1]
+
+
+def test_file_bus_replays_history_to_a_new_consumer(tmp_path):
+    producer = FileBus(str(tmp_path))
+    producer.publish_many("users", CREATED, [1, 2, 3])
+    producer.publish("users", DELETED, 2)
+    producer.publish_many("users", CREATED, [])
+
+    replica = IdReplica()
+    consumer = FileBus(str(tmp_path))
+    consumer.subscribe("users", replica.apply)
+    consumer.subscribe("posts", replica.apply)  # no file yet
+    assert consumer.poll() == 4
+    assert sorted(replica._ids) == [1, 3]
+    producer.publish("users", CREATED, 4)
+    assert consumer.poll() == 1 and 4 in replica
+    assert consumer.poll() == 0
+
+
+def test_file_bus_waits_for_the_rest_of_a_line(tmp_path):
+    bus = FileBus(str(tmp_path))
+    seen = []
+    bus.subscribe("users", seen.append)
+    with open(bus.path("users"), "ab") as f:
+        f.write(b'{"topic":"users","type":"created",')
+    assert bus.poll() == 0
+    with open(bus.path("users"), "ab") as f:
+        f.write(b'"id":5}\n')
+    assert bus.poll() == 1 and seen == [{"topic": "users", "type": "created", "id": 5}]
+
+
+@pytest.mark.anyio
+async def test_started_bus_tails_in_the_background(tmp_path):
+    bus = FileBus(str(tmp_path), poll_interval=0.01)
+    replica = IdReplica()
+    bus.subscribe("users", replica.apply)
+    bus.publish("users", CREATED, 1)
+    await bus.start()
+    assert 1 in replica
+    bus.publish("users", CREATED, 2)
+    with anyio.fail_after(2):
+        while 2 not in replica:
+            await anyio.sleep(0.01)
+    await bus.close()
+
+
+def test_from_env_picks_the_bus(monkeypatch, tmp_path):
+    monkeypatch.delenv("EVENT_BUS_DIR", raising=False)
+    assert type(LocalBus.from_env()) is LocalBus
+    monkeypatch.setenv("EVENT_BUS_DIR", str(tmp_path))
+    monkeypatch.setenv("EVENT_BUS_POLL_MS", "20")
+    bus = LocalBus.from_env()
+    assert isinstance(bus, FileBus) and bus.poll_interval == 0.02
+
+
+@pytest.mark.anyio
+async def test_writes_check_the_replica_and_publish(client, monkeypatch):
+    async def upstream(*args):
+        raise AssertionError("user-service was called")
+
+    monkeypatch.setattr(routes, "user_replica", IdReplica())
+    monkeypatch.setattr(routes.user_exists_cache, "get_or_load", upstream)
+    monkeypatch.setattr(routes, "bus", LocalBus())
+    published = []
+    routes.bus.subscribe("posts", published.append)
+    routes.user_replica.apply({"topic": "users", "type": CREATED, "id": 1})
+
+    created = (await client.post("/api/v1/posts", json={"title": "a", "content": "b", "author_id": 1})).json()
+    await client.put(f"/api/v1/posts/{created['id']}", json={"title": "c"})
+    await client.delete(f"/api/v1/posts/{created['id']}")
+    assert [(event["type"], event["id"]) for event in published] == [
+        (CREATED, created["id"]), (UPDATED, created["id"]), (DELETED, created["id"]),
+    ]
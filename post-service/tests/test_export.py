@@ -0,0 +1,40 @@
+"""Streaming NDJSON export"""
+import json
+
+import pytest
+
+from app import routes
+from app.events import CREATED, IdReplica
+from app.streaming import NDJSON_MEDIA_TYPE, ndjson_astream, ndjson_stream
+
+pytestmark = pytest.mark.anyio
+
+
+def test_chunks_hold_whole_lines():
+    chunks = list(ndjson_stream(({"id": i} for i in range(5)), batch_size=2))
+    assert chunks == [b'{"id": 0}\n{"id": 1}\n', b'{"id": 2}\n{"id": 3}\n', b'{"id": 4}\n']
+    assert list(ndjson_stream([])) == []
+
+
+async def test_async_stream_matches_the_sync_one():
+    async def rows():
+        for i in range(5):
+            yield {"id": i}
+
+    chunks = [chunk async for chunk in ndjson_astream(rows(), batch_size=2)]
+    assert chunks == list(ndjson_stream(({"id": i} for i in range(5)), batch_size=2))
+
+
+async def test_export_streams_every_post_in_id_order(client, monkeypatch):
+    monkeypatch.setattr(routes, "user_replica", IdReplica())
+    routes.user_replica.apply({"type": CREATED, "id": 1})
+    monkeypatch.setattr(routes, "EXPORT_BATCH_SIZE", 2)
+    items = [{"title": f"t{i}", "content": "c", "author_id": 1} for i in range(5)]
+    await client.post("/api/v1/posts/bulk", json=items)
+
+    async with client.stream("GET", "/api/v1/posts/export") as response:
+        assert response.headers["content-type"] == NDJSON_MEDIA_TYPE
+        body = b"".join([chunk async for chunk in response.aiter_bytes()])
+    posts = [json.loads(line) for line in body.splitlines()]
+    assert [post["id"] for post in posts] == [1, 2, 3, 4, 5]
+    assert posts[0]["title"] == "t0" and posts[0]["created_at"]
@@ -0,0 +1,61 @@
+"""Load-suite helpers in benchmarks/load_suite.py"""
+import os
+import random
+import sys
+from argparse import Namespace
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "benchmarks"))
+
+import load_suite  # noqa: E402
+import stub_upstreams  # noqa: E402
+
+
+def args(**overrides) -> Namespace:
+    defaults = dict(seed=1, users=3, posts=5, comments=50, zipf=1.2, burst=2, duration=0.2, concurrency=2)
+    return Namespace(**{**defaults, **overrides})
+
+
+def test_mix_defaults_and_rejects_unknown_scenarios():
+    assert load_suite.parse_mix(None) == load_suite.DEFAULT_MIX
+    assert load_suite.parse_mix("post_page=3,get_user=1") == {"post_page": 3, "get_user": 1}
+    with pytest.raises(SystemExit):
+        load_suite.parse_mix("nope=1")
+
+
+def test_zipf_favours_low_ranks():
+    draw = load_suite.Zipf(100, 1.2, random.Random(0))
+    ranks = [draw() for _ in range(5000)]
+    assert all(0 <= rank < 100 for rank in ranks)
+    assert ranks.count(0) > ranks.count(10) > ranks.count(99)
+
+
+def test_seed_rows_are_reproducible():
+    first, second = load_suite.Dataset(args()), load_suite.Dataset(args())
+    for data in (first, second):
+        data.user_ids, data.post_ids = [1, 2, 3], [1, 2, 3, 4, 5]
+    assert first.posts() == second.posts() and first.comments() == second.comments()
+    assert len(first.comments()) == 50
+    assert {row["author_id"] for row in first.posts()} <= {1, 2, 3}
+
+
+def test_summary_and_regressions():
+    samples = [("get_post", i / 1000, i != 99) for i in range(1, 101)]
+    row = load_suite.summarize(samples, elapsed=2.0)["get_post"]
+    assert row == {"requests": 100, "errors": 1, "rps": 50.0, "p50_ms": 51.0, "p95_ms": 96.0, "p99_ms": 100.0}
+
+    baseline = {"endpoints": {"get_post": {"rps": 100.0, "p95_ms": 50.0, "alloc_peak_kib": 10}}}
+    report = {"endpoints": {"get_post": {"rps": 95.0, "p95_ms": 80.0, "alloc_peak_kib": 10}, "new": {"rps": 1}}}
+    assert load_suite.compare(report, baseline, tolerance=0.15) == ["get_post: p95_ms 50.0 -> 80.0"]
+
+
+@pytest.mark.anyio
+async def test_drive_reports_every_scenario_run():
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=stub_upstreams.app), base_url="http://stub") as client:
+        data = load_suite.Dataset(args())
+        await load_suite.seed(lambda service: client, data, services=())
+        report = await load_suite.drive(lambda service: client, data, args(), {"list_comments": 1})
+    assert list(report) == ["list_comments"]
+    assert report["list_comments"]["requests"] > 0 and report["list_comments"]["errors"] == 0
@@ -0,0 +1,61 @@
+"""Request and SQL metrics"""
+import httpx
+import pytest
+from fastapi import FastAPI
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+
+from app import database, metrics, routes
+from app.events import CREATED, IdReplica
+from app.metrics import MetricsMiddleware, Registry
+
+pytestmark = pytest.mark.anyio
+
+
+def test_exposition_format():
+    registry = Registry()
+    registry.counter("jobs", "Jobs run", ("queue",)).labels("mail").inc(2)
+    registry.histogram("job_seconds", "Job latency", buckets=(0.1, 1.0)).labels().observe(0.5)
+    lines = registry.exposition().splitlines()
+    assert "# TYPE jobs counter" in lines
+    assert 'jobs_total{queue="mail"} 2' in lines
+    assert 'job_seconds_bucket{le="0.1"} 0' in lines
+    assert 'job_seconds_bucket{le="+Inf"} 1' in lines
+    assert "job_seconds_count 1" in lines
+
+
+def test_failed_statements_do_not_leave_their_start_behind():
+    engine = create_engine("sqlite://")
+    metrics.instrument_engine(engine)
+    before = metrics.DB_QUERIES.value
+    with engine.connect() as conn:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                conn.execute(text("SELECT * FROM missing"))
+        assert conn.connection.info.get("query_start") == []
+        conn.execute(text("SELECT 1"))
+        assert conn.connection.info["query_start"] == []
+    assert metrics.DB_QUERIES.value == before + 1
+    engine.dispose()
+
+
+async def test_requests_are_labelled_by_route_with_their_queries(tables, monkeypatch):
+    monkeypatch.setattr(routes, "user_replica", IdReplica())
+    routes.user_replica.apply({"type": CREATED, "id": 1})
+    metrics.instrument_engine(database.engine)
+    try:
+        app = FastAPI()
+        app.include_router(routes.router, prefix="/api/v1")
+        app.add_middleware(MetricsMiddleware)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            await client.post("/api/v1/posts", json={"title": "t", "content": "c", "author_id": 1})
+            await client.get("/api/v1/posts/does-not-exist")
+    finally:
+        for name, listener in (("before_cursor_execute", metrics._before_cursor_execute),
+                               ("after_cursor_execute", metrics._after_cursor_execute),
+                               ("handle_error", metrics._handle_error)):
+            event.remove(database.engine.sync_engine, name, listener)
+    exposition = metrics.REGISTRY.exposition()
+    assert 'http_requests_total{method="POST",route="/api/v1/posts",status="200"} 1' in exposition
+    assert 'http_request_db_queries_count{route="/api/v1/posts"} 1' in exposition
+    assert 'route="/api/v1/posts/{post_id}",status="422"' in exposition
@@ -0,0 +1,101 @@
+"""Alembic revisions bring any database up to the models"""
+import os
+import sqlite3
+
+import httpx
+import pytest
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from fastapi import FastAPI
+from sqlalchemy import create_engine
+
+from app import database, models, routes
+from app.events import CREATED, IdReplica
+from app.pagination import NEXT_CURSOR_HEADER
+
+from .conftest import DB_FILE
+
+pytestmark = pytest.mark.anyio
+
+ALEMBIC_INI = os.path.join(os.path.dirname(__file__), "..", "alembic.ini")
+
+# posts as the first release's create_all made it, before migrations
+FIRST_RELEASE = """
+CREATE TABLE posts (
+    id INTEGER NOT NULL PRIMARY KEY,
+    title VARCHAR NOT NULL,
+    content TEXT NOT NULL,
+    author_id INTEGER NOT NULL,
+    created_at DATETIME DEFAULT (CURRENT_TIMESTAMP),
+    updated_at DATETIME
+);
+CREATE INDEX ix_posts_id ON posts (id);
+"""
+
+
+def upgrade(revision: str = "head"):
+    config = Config(ALEMBIC_INI)
+    config.set_main_option("script_location", os.path.join(os.path.dirname(ALEMBIC_INI), "migrations"))
+    config.attributes["configure_logging"] = False
+    command.upgrade(config, revision)
+    return config
+
+
+def schema_differences() -> list:
+    engine = create_engine(f"sqlite:///{DB_FILE}")
+    with engine.connect() as conn:
+        context = MigrationContext.configure(conn, opts={
+            "include_object": lambda obj, name, type_, *args: not (type_ == "table" and name.startswith("posts_fts")),
+        })
+        differences = compare_metadata(context, models.Base.metadata)
+    engine.dispose()
+    return differences
+
+
+@pytest.fixture
+async def empty_file():
+    await database.engine.dispose()
+    if os.path.exists(DB_FILE):
+        os.remove(DB_FILE)
+    yield DB_FILE
+    await database.engine.dispose()
+
+
+async def test_fresh_database_matches_the_models(empty_file):
+    upgrade()
+    assert schema_differences() == []
+
+
+async def test_downgrade_undoes_every_revision(empty_file):
+    config = upgrade()
+    command.downgrade(config, "base")
+    with sqlite3.connect(DB_FILE) as conn:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert tables == {"alembic_version"}
+
+
+async def test_first_release_database_is_upgraded(empty_file, monkeypatch):
+    with sqlite3.connect(DB_FILE) as conn:
+        conn.executescript(FIRST_RELEASE)
+        conn.executemany(
+            "INSERT INTO posts (title, content, author_id) VALUES (?, ?, 1)",
+            [(f"old post {i}", "written before migrations") for i in range(3)],
+        )
+    upgrade()
+    assert schema_differences() == []
+
+    monkeypatch.setattr(routes, "user_replica", IdReplica())
+    routes.user_replica.apply({"type": CREATED, "id": 1})
+    app = FastAPI()
+    app.include_router(routes.router, prefix="/api/v1")
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        await client.post("/api/v1/posts", json={"title": "new post", "content": "c", "author_id": 1})
+        first = await client.get("/api/v1/posts", params={"limit": 2})
+        assert [post["id"] for post in first.json()] == [1, 2]
+        second = await client.get("/api/v1/posts", params={"limit": 2, "cursor": first.headers[NEXT_CURSOR_HEADER]})
+        assert [post["id"] for post in second.json()] == [3, 4]
+        # Rows from before the FTS table are indexed too
+        found = await client.get("/api/v1/posts/search", params={"q": "migrations"})
+        assert found.json()["total"] == 3
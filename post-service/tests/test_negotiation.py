@@ -0,0 +1,128 @@
+"""Compression and MessagePack negotiation"""
+import zlib
+
+import anyio
+import httpx
+import msgpack
+import pytest
+from fastapi import FastAPI
+from starlette.responses import JSONResponse, Response, StreamingResponse
+
+from app import routes
+from app.events import CREATED, IdReplica
+from app.negotiation import (
+    CODECS, CompressionMiddleware, MessagePackMiddleware, accepts_msgpack, quality_values,
+)
+from app.serialization import MSGPACK_MEDIA_TYPE
+
+pytestmark = pytest.mark.anyio
+
+BODY = b'{"rows": [' + b", ".join(b'{"id": %d, "content": "same words again"}' % i for i in range(200)) + b"]}"
+
+
+def build(minimum_size: int = 100) -> httpx.AsyncClient:
+    app = FastAPI()
+
+    @app.get("/json")
+    def json_body():
+        return Response(BODY, media_type="application/json")
+
+    @app.get("/small")
+    def small():
+        return JSONResponse({"ok": True})
+
+    @app.get("/png")
+    def png():
+        return Response(BODY, media_type="image/png")
+
+    app.add_middleware(MessagePackMiddleware)
+    app.add_middleware(CompressionMiddleware, minimum_size=minimum_size)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+def test_quality_values():
+    assert quality_values("gzip;q=0.5, BR , zstd;q=x,") == {"gzip": 0.5, "br": 1.0, "zstd": 0.0}
+
+
+def test_choice_follows_q_values_then_preference():
+    middleware = CompressionMiddleware(None, encodings=("zstd", "br", "gzip"))
+    assert middleware.choose("") is None
+    assert middleware.choose("identity") is None
+    assert middleware.choose("gzip, br") == ("br" if "br" in CODECS else "gzip")
+    assert middleware.choose("gzip;q=1, br;q=0.5, zstd;q=0.1") == "gzip"
+    assert middleware.choose("*;q=0.2, gzip;q=0") in {"zstd", "br"} & set(CODECS)
+    assert middleware.choose("*, zstd;q=0, br;q=0") == "gzip"
+    assert CompressionMiddleware(None, encodings=("gzip",)).choose("br, zstd") is None
+
+
+async def test_large_json_is_compressed_and_small_is_not():
+    async with build() as client:
+        response = await client.get("/json", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip" and response.headers["vary"] == "Accept, Accept-Encoding"
+        assert int(response.headers["content-length"]) < len(BODY)
+        assert response.content == BODY
+
+        small = await client.get("/small", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in small.headers and small.json() == {"ok": True}
+        assert "Accept-Encoding" in small.headers["vary"]
+
+        image = await client.get("/png", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in image.headers and image.content == BODY
+
+        plain = await client.get("/json", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in plain.headers and plain.content == BODY
+
+
+async def test_streams_are_compressed_chunk_by_chunk():
+    chunks = [b'{"id": %d}\n' % i * 50 for i in range(5)]
+    app = CompressionMiddleware(StreamingResponse(iter(chunks), media_type="application/x-ndjson"), minimum_size=0)
+    sent = []
+
+    async def receive():
+        # The client stays connected
+        await anyio.sleep_forever()
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": [(b"accept-encoding", b"gzip")]}
+    await app(scope, receive, send)
+    headers = dict(sent[0]["headers"])
+    assert headers[b"content-encoding"] == b"gzip" and b"content-length" not in headers
+    # Every chunk is flushed, so it decodes on arrival, before the rest is sent
+    decompressor = zlib.decompressobj(31)
+    bodies = [message["body"] for message in sent[1:]]
+    assert [decompressor.decompress(body) for body in bodies[:len(chunks)]] == chunks
+    assert decompressor.decompress(b"".join(bodies[len(chunks):])) == b"" and decompressor.eof
+    assert sent[-1].get("more_body", False) is False
+
+
+def test_msgpack_only_when_rated_above_json():
+    assert accepts_msgpack(MSGPACK_MEDIA_TYPE)
+    assert accepts_msgpack("application/json;q=0.5, application/x-msgpack")
+    assert not accepts_msgpack("")
+    assert not accepts_msgpack("*/*")
+    assert not accepts_msgpack(f"application/json, {MSGPACK_MEDIA_TYPE}")
+
+
+async def test_json_bodies_are_re_encoded_as_msgpack():
+    async with build(minimum_size=10 ** 6) as client:
+        response = await client.get("/json", headers={"Accept": MSGPACK_MEDIA_TYPE})
+        assert response.headers["content-type"] == MSGPACK_MEDIA_TYPE and "Accept" in response.headers["vary"]
+        assert msgpack.unpackb(response.content)["rows"][199] == {"id": 199, "content": "same words again"}
+        assert int(response.headers["content-length"]) == len(response.content)
+        assert (await client.get("/json")).content == BODY
+
+
+async def test_list_endpoint_answers_in_msgpack(tables, monkeypatch):
+    monkeypatch.setattr(routes, "user_replica", IdReplica())
+    routes.user_replica.apply({"type": CREATED, "id": 1})
+    app = FastAPI()
+    app.include_router(routes.router, prefix="/api/v1")
+    app.add_middleware(MessagePackMiddleware)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        await client.post("/api/v1/posts", json={"title": "t", "content": "c", "author_id": 1})
+        as_json = (await client.get("/api/v1/posts")).json()
+        packed = await client.get("/api/v1/posts", headers={"Accept": MSGPACK_MEDIA_TYPE})
+    assert packed.headers["content-type"] == MSGPACK_MEDIA_TYPE
+    assert msgpack.unpackb(packed.content) == as_json
@@ -0,0 +1,58 @@
+"""Keyset pagination on (created_at, id)"""
+import pytest
+
+from app import routes
+from app.events import CREATED, IdReplica
+from app.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def author(monkeypatch):
+    monkeypatch.setattr(routes, "user_replica", IdReplica())
+    routes.user_replica.apply({"type": CREATED, "id": 1})
+
+
+async def read_all(client, path: str, limit: int):
+    pages, cursor = [], None
+    while True:
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        response = await client.get(path, params=params)
+        assert response.status_code == 200
+        pages.append([post["id"] for post in response.json()])
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            return pages
+
+
+async def test_pages_follow_the_cursor(client):
+    # Created within the same second, as a burst of writes would be
+    for i in range(5):
+        await client.post("/api/v1/posts", json={"title": f"t{i}", "content": "c", "author_id": 1})
+    assert await read_all(client, "/api/v1/posts", 2) == [[1, 2], [3, 4], [5]]
+
+
+async def test_bulk_created_rows_page_in_order(client):
+    items = [{"title": f"t{i}", "content": "c", "author_id": 1 + i % 2} for i in range(7)]
+    routes.user_replica.apply({"type": CREATED, "id": 2})
+    await client.post("/api/v1/posts/bulk", json=items)
+    assert await read_all(client, "/api/v1/posts", 3) == [[1, 2, 3], [4, 5, 6], [7]]
+    assert await read_all(client, "/api/v1/posts/author/2", 2) == [[2, 4], [6]]
+
+
+async def test_last_page_has_no_cursor(client):
+    await client.post("/api/v1/posts", json={"title": "t", "content": "c", "author_id": 1})
+    response = await client.get("/api/v1/posts", params={"limit": 1})
+    assert NEXT_CURSOR_HEADER not in response.headers
+
+
+async def test_bad_cursor_is_400(client):
+    response = await client.get("/api/v1/posts", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+def test_cursor_round_trips():
+    cursor = encode_cursor("2024-05-01T10:00:00.123456", 42)
+    created_at, record_id = decode_cursor(cursor)
+    assert (created_at.isoformat(), record_id) == ("2024-05-01T10:00:00.123456", 42)
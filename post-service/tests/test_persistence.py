@@ -0,0 +1,166 @@
+"""Snapshot plus write-ahead log: replay, torn tails, compaction"""
+import os
+import threading
+import time
+
+import pytest
+
+from app.persistence import (
+    FRAME, Persistence, WriteAheadLog, _segment_path, _segments, read_segment, read_snapshot,
+)
+from app.columns import INT, TEXT, RecordTable
+from app.store import IndexedStore
+
+
+def new_store() -> IndexedStore:
+    return IndexedStore(unique=("name",), indexed=("author_id",))
+
+
+def reopen(directory: str) -> IndexedStore:
+    store = new_store()
+    persistence = Persistence(directory, snapshot_interval=3600)
+    persistence.attach(store)
+    persistence.close(snapshot=False)
+    return store
+
+
+@pytest.fixture
+def persisted(tmp_path):
+    store = new_store()
+    persistence = Persistence(str(tmp_path), snapshot_interval=3600)
+    persistence.attach(store)
+    yield store, persistence
+    if not persistence._closed.is_set():
+        persistence.close(snapshot=False)
+
+
+def test_log_is_replayed_after_a_crash(tmp_path, persisted):
+    store, persistence = persisted
+    store.insert({"name": "a", "author_id": 1})
+    store.insert_many([{"name": "b", "author_id": 2}, {"name": "c", "author_id": 2}])
+    store.update(1, {"name": "a2"})
+    store.delete(3)
+    # No snapshot on the way down, as if the process died
+    persistence.close(snapshot=False)
+    assert not os.path.exists(persistence.snapshot_path)
+
+    restored = reopen(str(tmp_path))
+    assert restored.all() == store.all()
+    assert restored.get_by("name", "a2")["id"] == 1 and restored.get(3) is None
+    # Ids carry on after the highest one ever handed out
+    assert restored.insert({"name": "d", "author_id": 1})["id"] == 4
+
+
+def test_snapshot_drops_the_segments_it_covers(tmp_path, persisted):
+    store, persistence = persisted
+    for i in range(5):
+        store.insert({"name": f"n{i}", "author_id": i})
+    persistence.snapshot()
+    segment, next_id, records = read_snapshot(persistence.snapshot_path)
+    assert _segments(str(tmp_path)) == [segment]
+    assert next_id == 6 and [r["id"] for r in records] == [1, 2, 3, 4, 5]
+
+    store.delete(2)
+    persistence.close(snapshot=False)
+    restored = reopen(str(tmp_path))
+    assert [r["id"] for r in restored.all()] == [1, 3, 4, 5]
+
+
+def test_torn_tail_is_ignored_and_never_appended_to(tmp_path, persisted):
+    store, persistence = persisted
+    store.insert({"name": "a", "author_id": 1})
+    store.insert({"name": "b", "author_id": 1})
+    persistence.close(snapshot=False)
+    path = _segment_path(str(tmp_path), _segments(str(tmp_path))[-1])
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 3)
+
+    restored = new_store()
+    again = Persistence(str(tmp_path), snapshot_interval=3600)
+    again.attach(restored)
+    assert [r["name"] for r in restored.all()] == ["a"]
+    restored.insert({"name": "c", "author_id": 1})
+    again.close(snapshot=False)
+    # The new entry went to a fresh segment, not after the torn bytes
+    assert path != again.log._file.name
+    assert [r["name"] for r in reopen(str(tmp_path)).all()] == ["a", "c"]
+
+
+def test_corrupt_frame_stops_the_segment(tmp_path):
+    log = WriteAheadLog(str(tmp_path), 1)
+    log.append(("delete", 1))
+    log.append(("delete", 2))
+    log.close()
+    path = _segment_path(str(tmp_path), 1)
+    with open(path, "r+b") as f:
+        data = bytearray(f.read())
+        length, _ = FRAME.unpack_from(data, 0)
+        # Flip a byte in the second entry's payload: its CRC no longer matches
+        data[FRAME.size + length + FRAME.size] ^= 0xFF
+        f.seek(0)
+        f.write(data)
+    assert list(read_segment(path)) == [("delete", 1)]
+
+
+def test_writes_are_on_disk_when_they_return(tmp_path, persisted):
+    store, persistence = persisted
+    store.insert({"name": "a", "author_id": 1})
+    store.update(1, {"name": "b"})
+    # Nothing closed or flushed: a crash now would lose nothing acknowledged
+    path = _segment_path(str(tmp_path), persistence.log.segment)
+    assert [entry[0] for entry in read_segment(path)] == ["insert", "update"]
+    assert persistence.log.durable == persistence.log.appended == 2
+
+
+def test_concurrent_writers_share_fsyncs(tmp_path, persisted, monkeypatch):
+    store, persistence = persisted
+    fsync = os.fsync
+
+    def slow_fsync(fd):
+        time.sleep(0.005)
+        fsync(fd)
+
+    monkeypatch.setattr(os, "fsync", slow_fsync)
+    threads = [
+        threading.Thread(target=lambda n=n: [store.insert({"name": f"{n}-{i}", "author_id": n}) for i in range(10)])
+        for n in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    log = persistence.log
+    assert log.durable == log.appended == 80
+    # One fsync per write would be 80
+    assert log.fsyncs < 60
+    assert len(list(read_segment(_segment_path(str(tmp_path), log.segment)))) == 80
+
+
+def test_column_stores_are_snapshotted_as_columns(tmp_path):
+    layout = {"name": TEXT, "author_id": INT}
+    store = IndexedStore(unique=("name",), indexed=("author_id",), columns=layout)
+    persistence = Persistence(str(tmp_path), snapshot_interval=3600)
+    persistence.attach(store)
+    for i in range(5):
+        store.insert({"name": f"n{i}", "author_id": i % 2})
+    store.delete(3)
+    persistence.close()
+    _, next_id, records = read_snapshot(persistence.snapshot_path)
+    assert isinstance(records, RecordTable) and next_id == 6
+
+    restored = IndexedStore(unique=("name",), indexed=("author_id",), columns=layout)
+    again = Persistence(str(tmp_path), snapshot_interval=3600)
+    again.attach(restored)
+    assert restored.all() == store.all()
+    assert [r["id"] for r in restored.find("author_id", 0)] == [1, 5]
+    again.close(snapshot=False)
+
+
+def test_from_env_needs_persist_dir(monkeypatch, tmp_path):
+    monkeypatch.delenv("PERSIST_DIR", raising=False)
+    assert Persistence.from_env("posts") is None
+    monkeypatch.setenv("PERSIST_DIR", str(tmp_path))
+    monkeypatch.setenv("PERSIST_SNAPSHOT_EVERY", "500")
+    persistence = Persistence.from_env("posts")
+    assert persistence.directory == os.path.join(str(tmp_path), "posts")
+    assert persistence.snapshot_every == 500
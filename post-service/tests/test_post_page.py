@@ -0,0 +1,82 @@
+"""GET /posts/{id}/page: the post, its comments and their authors"""
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import routes
+from app.clients import UpstreamUnavailable
+from app.events import CREATED, IdReplica
+from app.pagination import NEXT_CURSOR_HEADER
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def comments(monkeypatch):
+    """Stands in for comment-service; records whether its call was cancelled"""
+    state = {"started": 0, "cancelled": 0, "page": None}
+
+    async def fetch_comments(post_id, cursor, limit):
+        state["started"] += 1
+        if state["page"] is not None:
+            return state["page"]
+        try:
+            await asyncio.sleep(3600)
+        except asyncio.CancelledError:
+            state["cancelled"] += 1
+            raise
+
+    monkeypatch.setattr(routes, "fetch_comments", fetch_comments)
+    return state
+
+
+@pytest.fixture
+def users(monkeypatch):
+    async def fetch_users(user_ids):
+        return [{"id": user_id} for user_id in user_ids]
+
+    monkeypatch.setattr(routes, "fetch_users", fetch_users)
+
+
+async def test_page_joins_post_comments_and_authors(client, comments, users, monkeypatch):
+    monkeypatch.setattr(routes, "user_replica", IdReplica())
+    routes.user_replica.apply({"type": CREATED, "id": 1})
+    await client.post("/api/v1/posts", json={"title": "t", "content": "c", "author_id": 1})
+    comments["page"] = ([{"id": 9, "author_id": 2}, {"id": 10, "author_id": 1}], "next-page")
+
+    response = await client.get("/api/v1/posts/1/page")
+    assert response.status_code == 200
+    assert response.headers[NEXT_CURSOR_HEADER] == "next-page"
+    page = response.json()
+    assert page["post"]["id"] == 1
+    assert [author["id"] for author in page["authors"]] == [1, 2]
+    assert page["unavailable"] == []
+
+
+async def test_comment_service_down_degrades_the_page(client, users, monkeypatch):
+    async def fetch_comments(post_id, cursor, limit):
+        raise UpstreamUnavailable("down")
+
+    monkeypatch.setattr(routes, "fetch_comments", fetch_comments)
+    monkeypatch.setattr(routes, "user_replica", IdReplica())
+    routes.user_replica.apply({"type": CREATED, "id": 1})
+    await client.post("/api/v1/posts", json={"title": "t", "content": "c", "author_id": 1})
+    page = (await client.get("/api/v1/posts/1/page")).json()
+    assert page["comments"] == [] and page["unavailable"] == ["comment-service"]
+
+
+async def test_missing_post_cancels_the_comments_call(client, comments):
+    assert (await client.get("/api/v1/posts/404/page")).status_code == 404
+    assert comments == {"started": 1, "cancelled": 1, "page": None}
+
+
+async def test_failed_post_read_cancels_the_comments_call(client, comments, monkeypatch):
+    async def get(*args, **kwargs):
+        await asyncio.sleep(0)
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(AsyncSession, "get", get)
+    with pytest.raises(RuntimeError):
+        await client.get("/api/v1/posts/1/page")
+    assert comments == {"started": 1, "cancelled": 1, "page": None}
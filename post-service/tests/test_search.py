@@ -0,0 +1,64 @@
+"""Full-text search: InvertedIndex and GET /posts/search"""
+import pytest
+
+from app import routes
+from app.events import CREATED, IdReplica
+from app.search import InvertedIndex, tokenize
+
+pytestmark = pytest.mark.anyio
+
+
+def test_tokens_are_lower_cased_words():
+    assert tokenize("Hello, World! it's 2024") == ["hello", "world", "it", "s", "2024"]
+
+
+def test_every_term_must_match():
+    index = InvertedIndex()
+    index.add(1, "fast async python")
+    index.add(2, "python web framework")
+    index.add(3, "fast cars")
+    assert index.search("python")[0] == 2
+    assert [doc for doc, _ in index.search("fast python")[1]] == [1]
+    assert index.search("missing") == (0, [])
+    assert index.search("  ,, ") == (0, [])
+
+
+def test_bm25_prefers_frequent_terms_in_short_documents():
+    index = InvertedIndex()
+    index.add(1, "cache")
+    index.add(2, "cache cache invalidation")
+    index.add(3, "cache " + "filler " * 50)
+    ranked = [doc for doc, _ in index.search("cache")[1]]
+    assert ranked[-1] == 3
+    total, page = index.search("cache", offset=1, limit=1)
+    assert total == 3 and [doc for doc, _ in page] == [ranked[1]]
+
+
+def test_replaced_and_removed_documents_leave_no_postings():
+    index = InvertedIndex()
+    index.add(1, "old words")
+    index.add(1, "new words")
+    assert index.search("old") == (0, [])
+    assert index.search("new")[0] == 1
+    index.remove(1)
+    index.remove(1)
+    assert len(index) == 0 and index.search("words") == (0, [])
+
+
+async def test_sql_search_ranks_and_pages(client, monkeypatch):
+    monkeypatch.setattr(routes, "user_replica", IdReplica())
+    routes.user_replica.apply({"type": CREATED, "id": 1})
+    posts = [("Keyset pagination", "pages by cursor"), ("Caching", "cache pages and pages"),
+             ("Unrelated", "nothing to see")]
+    for title, content in posts:
+        await client.post("/api/v1/posts", json={"title": title, "content": content, "author_id": 1})
+
+    found = (await client.get("/api/v1/posts/search", params={"q": "PAGES"})).json()
+    assert found["total"] == 2
+    assert [hit["id"] for hit in found["results"]] == [2, 1]
+    assert found["results"][0]["score"] >= found["results"][1]["score"]
+    second = (await client.get("/api/v1/posts/search", params={"q": "pages", "offset": 1, "limit": 1})).json()
+    assert [hit["id"] for hit in second["results"]] == [1]
+    await client.put("/api/v1/posts/2", json={"content": "no longer"})
+    assert (await client.get("/api/v1/posts/search", params={"q": "pages"})).json()["total"] == 1
+    assert (await client.get("/api/v1/posts/search", params={"q": "!!"})).json() == {"total": 0, "results": []}
@@ -0,0 +1,71 @@
+"""ListEncoder: list responses encoded without validation"""
+import json
+from datetime import datetime
+from types import SimpleNamespace
+
+import msgpack
+import pytest
+from fastapi import Response
+
+from app import routes, schemas, serialization
+from app.events import CREATED as USER_CREATED, IdReplica
+from app.serialization import MSGPACK_MEDIA_TYPE, ListEncoder, decode_body, json_to_msgpack, prefer_msgpack
+
+CREATED = datetime(2024, 5, 1, 12, 0, 0, 123456)
+
+
+def row(post_id: int) -> SimpleNamespace:
+    # ORM rows carry more attributes than the response has fields
+    return SimpleNamespace(id=post_id, title=f"t{post_id}", content="c", author_id=1,
+                           created_at=CREATED, updated_at=None, _sa_instance_state=object())
+
+
+def test_rows_encode_like_the_validated_model():
+    encoder = ListEncoder(schemas.Post)
+    rows = [row(1), row(2)]
+    expected = [schemas.Post.model_validate(r).model_dump(mode="json") for r in rows]
+    assert json.loads(encoder.encode(rows)) == expected
+    assert msgpack.unpackb(encoder.encode_msgpack(rows)) == expected
+    assert encoder.encode([]) == b"[]"
+
+
+def test_dicts_are_dumped_as_they_are():
+    encoder = ListEncoder(schemas.Post)
+    items = [{"id": 1, "title": "t", "content": "c", "author_id": 1,
+              "created_at": "2024-05-01T12:00:00.123456", "updated_at": None}]
+    assert json.loads(encoder.encode(items)) == items
+    assert decode_body(encoder.encode_msgpack(items), MSGPACK_MEDIA_TYPE) == items
+    assert decode_body(encoder.encode(items), "application/json") == items
+    assert msgpack.unpackb(json_to_msgpack(encoder.encode(items))) == items
+
+
+def test_response_keeps_headers_and_honours_msgpack_preference():
+    encoder = ListEncoder(schemas.Post)
+    headers = Response()
+    headers.headers["ETag"] = 'W/"7"'
+    encoded = encoder.response([row(1)], headers)
+    assert encoded.media_type == "application/json" and encoded.headers["etag"] == 'W/"7"'
+
+    token = prefer_msgpack.set(True)
+    try:
+        encoded = encoder.response([row(1)], headers)
+    finally:
+        prefer_msgpack.reset(token)
+    assert encoded.media_type == MSGPACK_MEDIA_TYPE and encoded.headers["etag"] == 'W/"7"'
+    assert msgpack.unpackb(encoded.body)[0]["created_at"] == CREATED.isoformat()
+
+
+def test_slow_path_returns_items_for_fastapi(monkeypatch):
+    monkeypatch.setattr(serialization, "FAST_SERIALIZATION", False)
+    rows = [row(1)]
+    assert ListEncoder(schemas.Post).response(rows, Response()) is rows
+
+
+@pytest.mark.anyio
+async def test_list_endpoint_matches_the_validated_response(client, monkeypatch):
+    monkeypatch.setattr(routes, "user_replica", IdReplica())
+    routes.user_replica.apply({"type": USER_CREATED, "id": 1})
+    await client.post("/api/v1/posts", json={"title": "a", "content": "b", "author_id": 1})
+    fast = (await client.get("/api/v1/posts")).json()
+    monkeypatch.setattr(serialization, "FAST_SERIALIZATION", False)
+    assert (await client.get("/api/v1/posts")).json() == fast
@@ -0,0 +1,61 @@
+"""One owner process shared by several workers"""
+import os
+import shutil
+import signal
+import tempfile
+import time
+
+import pytest
+
+from app.shared import SharedState
+
+
+@pytest.fixture
+def socket_path():
+    # Unix socket paths are limited to about 100 bytes, shorter than tmp_path can be
+    directory = tempfile.mkdtemp(prefix="store-")
+    path = os.path.join(directory, "s.sock")
+    yield path
+    pid_file = f"{path}.pid"
+    if os.path.exists(pid_file):
+        with open(pid_file) as f:
+            pid = int(f.read())
+        os.kill(pid, signal.SIGTERM)
+        # The owner is this process's child: reap it once it has stopped
+        deadline = time.monotonic() + 5
+        while os.waitpid(pid, os.WNOHANG) == (0, 0) and time.monotonic() < deadline:
+            time.sleep(0.05)
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def test_workers_share_one_store_and_index(socket_path):
+    first = SharedState(socket_path)
+    # The second worker connects to the owner the first one spawned
+    second = SharedState(socket_path)
+    with open(f"{socket_path}.pid") as f:
+        owner = int(f.read())
+    assert owner != os.getpid()
+
+    posts = first.store("posts", indexed=("author_id",))
+    created = posts.insert({"title": "Hello", "content": "shared world", "author_id": 1})
+    other = second.store("posts", indexed=("author_id",))
+    assert other.get(created["id"]) == created and len(other) == 1 and created["id"] in other
+
+    # Ids come from one place whichever worker inserts
+    ids = [other.insert({"title": f"t{i}", "content": "", "author_id": 2})["id"] for i in range(3)]
+    assert ids == [2, 3, 4]
+    assert [r["id"] for r in other.insert_many(iter([{"title": "x", "content": "", "author_id": 2}]))] == [5]
+    assert [r["id"] for r in posts.scan(batch_size=2, field="author_id", value=2)] == [2, 3, 4, 5]
+    assert [r["id"] for r in posts] == [1, 2, 3, 4, 5]
+
+    # An index created later is built from the records already stored
+    index = second.index("posts", "posts", ("title", "content"))
+    total, hits = index.search("shared")
+    assert total == 1 and hits[0][0] == 1
+    first.index("posts", "posts", ("title", "content")).remove(1)
+    assert index.search("shared") == (0, [])
+
+
+def test_from_env_needs_store_socket(monkeypatch):
+    monkeypatch.delenv("STORE_SOCKET", raising=False)
+    assert SharedState.from_env() is None
@@ -0,0 +1,55 @@
+"""Modules copied between the services stay identical to these.
+
+The helpers below are tested here only, so a copy edited in one service
+and not the others would go untested; edit the post-service copy and
+copy it across.
+"""
+import os
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(__file__), "..", "..")
+
+SHARED = {
+    "admission.py": ("user-service", "comment-service"),
+    "bulk.py": ("user-service", "comment-service"),
+    "cache.py": ("user-service", "comment-service"),
+    "clients.py": ("comment-service",),
+    "columns.py": ("user-service", "comment-service"),
+    "etag.py": ("user-service", "comment-service"),
+    "events.py": ("user-service", "comment-service"),
+    "metrics.py": ("user-service", "comment-service"),
+    "negotiation.py": ("user-service", "comment-service"),
+    "pagination.py": ("user-service", "comment-service"),
+    "persistence.py": ("user-service", "comment-service"),
+    "search.py": ("comment-service",),
+    "serialization.py": ("user-service", "comment-service"),
+    "shared.py": ("user-service", "comment-service"),
+    "store.py": ("user-service", "comment-service"),
+    "streaming.py": ("comment-service",),
+    "tracing.py": ("user-service", "comment-service"),
+}
+
+
+def read(service: str, module: str) -> bytes:
+    with open(os.path.join(ROOT, service, "app", module), "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("module,services", sorted(SHARED.items()))
+def test_copies_match_the_post_service(module, services):
+    original = read("post-service", module)
+    drifted = [service for service in services if read(service, module) != original]
+    assert not drifted, f"app/{module} differs from post-service in {', '.join(drifted)}"
+
+
+def test_every_copy_is_listed():
+    # A module copied into another service is checked from then on
+    for service in ("user-service", "comment-service"):
+        for module in os.listdir(os.path.join(ROOT, service, "app")):
+            if module in SHARED or module == "__init__.py" or not module.endswith(".py"):
+                continue
+            if not os.path.exists(os.path.join(ROOT, "post-service", "app", module)):
+                continue
+            if read(service, module) == read("post-service", module):
+                pytest.fail(f"{service}/app/{module} is a copy of post-service's but not in SHARED")
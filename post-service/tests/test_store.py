@@ -0,0 +1,152 @@
+"""IndexedStore: lookups, pages, indexes and versions"""
+import pytest
+
+from app.columns import INT, TEXT, TIMESTAMP, RecordTable
+from app.store import DuplicateKeyError, IdList, IndexedStore
+
+LAYOUT = {"name": TEXT, "author_id": INT, "created_at": TIMESTAMP}
+
+
+@pytest.fixture(params=["dicts", "columns"])
+def store(request) -> IndexedStore:
+    columns = LAYOUT if request.param == "columns" else None
+    return IndexedStore(unique=("name",), indexed=("author_id",), columns=columns)
+
+
+def record(name: str, author_id: int = 1) -> dict:
+    return {"name": name, "author_id": author_id, "created_at": "2024-05-01T12:00:00.123456"}
+
+
+def test_insert_assigns_increasing_ids(store):
+    first, second = store.insert(record("a")), store.insert(record("b"))
+    assert (first["id"], second["id"]) == (1, 2)
+    assert store.get(2) == second and 2 in store and len(store) == 2
+    assert store.get_by("name", "a") == first
+
+
+def test_unique_index_refuses_duplicates(store):
+    store.insert(record("a"))
+    with pytest.raises(DuplicateKeyError) as duplicate:
+        store.insert(record("a"))
+    assert (duplicate.value.field, duplicate.value.value) == ("name", "a")
+    b = store.insert(record("b"))
+    with pytest.raises(DuplicateKeyError):
+        store.update(b["id"], {"name": "a"})
+    # Renaming frees the old value
+    store.update(b["id"], {"name": "c"})
+    assert store.get_by("name", "b") is None
+    store.insert(record("b"))
+
+
+def test_insert_many_reports_each_item(store):
+    store.insert(record("taken"))
+    results = store.insert_many([record("x"), record("taken"), record("y"), record("x")])
+    assert [r["id"] if isinstance(r, dict) else r.value for r in results] == [2, "taken", 3, "x"]
+
+
+def test_pages_seek_past_the_cursor(store):
+    for i in range(10):
+        store.insert(record(f"r{i}", author_id=i % 2))
+    store.delete(3)
+    store.delete(4)
+    assert [r["id"] for r in store.page(0, 4)] == [1, 2, 5, 6]
+    assert [r["id"] for r in store.page(6, 4)] == [7, 8, 9, 10]
+    assert [r["id"] for r in store.page(0, 10, "author_id", 0)] == [1, 5, 7, 9]
+    assert [r["id"] for r in store.scan(batch_size=3)] == [1, 2, 5, 6, 7, 8, 9, 10]
+    assert store.page(0, 10, "author_id", 7) == []
+
+
+def test_secondary_index_follows_updates_and_deletes(store):
+    for i in range(4):
+        store.insert(record(f"r{i}", author_id=1))
+    store.update(2, {"author_id": 2})
+    store.delete(3)
+    assert [r["id"] for r in store.find("author_id", 1)] == [1, 4]
+    assert [r["id"] for r in store.find("author_id", 2)] == [2]
+    assert store.count("author_id", 1) == 2
+    # Moved back: found once, in order
+    store.update(2, {"author_id": 1})
+    assert [r["id"] for r in store.find("author_id", 1)] == [1, 2, 4]
+
+
+def test_versions_change_with_every_write(store):
+    store.insert(record("a", author_id=1))
+    store.insert(record("b", author_id=2))
+    _, version = store.get_versioned(1)
+    everything, author_1, author_2 = (store.collection_version(), store.collection_version("author_id", 1),
+                                      store.collection_version("author_id", 2))
+    store.update(1, {"name": "a2"})
+    assert store.get_versioned(1)[1] > version
+    assert store.collection_version() > everything
+    assert store.collection_version("author_id", 1) > author_1
+    assert store.collection_version("author_id", 2) == author_2
+    assert store.get_versioned(99) is None
+
+
+class Journal(list):
+    """Records entries; every one must be synced before its write returns"""
+
+    def __init__(self):
+        super().__init__()
+        self.synced = 0
+
+    def append(self, entry) -> int:
+        super().append(entry)
+        return len(self)
+
+    def sync(self, sequence: int):
+        assert sequence == len(self)
+        self.synced = sequence
+
+
+def test_journal_replay_rebuilds_the_store(store):
+    journal = store.journal = Journal()
+    store.insert(record("a"))
+    store.insert_many([record("b", 2), record("c", 2)])
+    store.update(2, {"name": "b2"})
+    store.delete(1)
+    copy = IndexedStore(unique=("name",), indexed=("author_id",), columns=LAYOUT)
+    assert journal.synced == len(journal) == 4
+    for entry in journal:
+        copy.replay(entry)
+    assert copy.all() == store.all()
+    assert copy.insert(record("d"))["id"] == 4
+
+
+def test_checkpoint_copies_the_store_at_the_mark(store):
+    store.insert(record("a"))
+    marked, next_id, records = store.checkpoint(lambda: "mark")
+    store.update(1, {"name": "changed"})
+    assert (marked, next_id) == ("mark", 2)
+    # A column layout is copied out as its columns
+    assert isinstance(records, RecordTable) == isinstance(store._records, RecordTable)
+    restored = IndexedStore(unique=("name",), indexed=("author_id",))
+    restored.restore(records, next_id)
+    assert restored.get_by("name", "a") == {**record("a"), "id": 1}
+    assert restored.insert(record("b"))["id"] == 2
+
+
+def test_restoring_a_table_of_the_same_layout_takes_it_over():
+    store = IndexedStore(unique=("name",), indexed=("author_id",), columns=LAYOUT)
+    for name in "abc":
+        store.insert(record(name, author_id=ord(name) % 2))
+    store.delete(2)
+    _, next_id, table = store.checkpoint(lambda: None)
+    restored = IndexedStore(unique=("name",), indexed=("author_id",), columns=LAYOUT)
+    restored.restore(table, next_id)
+    assert restored._records is table
+    assert restored.all() == store.all()
+    assert [r["name"] for r in restored.find("author_id", 1)] == ["a", "c"]
+    assert restored.get_by("name", "b") is None and restored.insert(record("d"))["id"] == 4
+
+
+def test_id_list_sweeps_tombstones():
+    ids, alive = IdList(), set(range(1, 11))
+    for record_id in sorted(alive):
+        ids.add(record_id)
+    for record_id in range(1, 8):
+        alive.discard(record_id)
+        ids.discard(alive.__contains__)
+    assert len(ids) == 3 and len(ids.ids) < 10
+    assert list(ids.after(0, alive.__contains__)) == [8, 9, 10]
+    assert list(ids.after(8, alive.__contains__)) == [9, 10]
@@ -0,0 +1,81 @@
+"""Trace sampling, propagation and export"""
+import json
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app import tracing
+from app.tracing import FileExporter, Tracer, TracingMiddleware, traced
+
+pytestmark = pytest.mark.anyio
+
+SAMPLED = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+UNSAMPLED = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-00"
+
+
+def test_continued_traces_keep_the_trace_id():
+    tracer = Tracer("test", sample_rate=0)
+    span = tracer.start_request(SAMPLED, "GET")
+    assert span.sampled
+    assert f"{span.trace_id:032x}" == "0af7651916cd43dd8448eb211c80319c"
+    assert f"{span.parent_id:016x}" == "b7ad6b7169203331"
+    assert not tracer.start_request(UNSAMPLED, "GET").sampled
+
+
+def test_sampled_traceparents_count_against_the_budget():
+    tracer = Tracer("test", sample_rate=1.0, max_per_second=3)
+    continued = [tracer.start_request(SAMPLED, "GET").sampled for _ in range(5)]
+    assert continued == [True, True, True, False, False]
+    # New roots share the same budget
+    assert not tracer.start_request(None, "GET").sampled
+    # Over budget, the trace id still reaches the next service
+    assert tracer.start_request(SAMPLED, "GET").traceparent().endswith("-00")
+
+
+def test_roots_are_sampled_at_the_rate(monkeypatch):
+    tracer = Tracer("test", sample_rate=0.5, max_per_second=1000)
+    monkeypatch.setattr(tracing.random, "random", lambda: 0.4)
+    assert tracer.start_request(None, "GET").sampled
+    monkeypatch.setattr(tracing.random, "random", lambda: 0.6)
+    assert not tracer.start_request(None, "GET").sampled
+    assert not tracer.start_request("garbage", "GET").sampled
+
+
+def test_file_exporter_writes_off_the_caller(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    tracer = Tracer("test", sample_rate=1.0)
+    tracer.exporters.append(FileExporter(str(path), interval=3600))
+    tracer.start_request(None, "GET").end()
+    assert not path.exists()
+    tracer.close()
+    [line] = path.read_text().splitlines()
+    assert json.loads(line)["service"] == "test"
+
+
+async def test_middleware_records_child_spans_under_the_route():
+    tracer = Tracer("test", sample_rate=1.0)
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int):
+        with traced("lookup"):
+            return {"id": item_id}
+
+    wrapped = TracingMiddleware(app, tracer)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=wrapped), base_url="http://test") as client:
+        response = await client.get("/items/1", headers={"traceparent": SAMPLED})
+    assert response.headers["traceresponse"].startswith("00-0af7651916cd43dd8448eb211c80319c-")
+    spans = tracer.buffer.spans("0af7651916cd43dd8448eb211c80319c")
+    assert [span["name"] for span in spans] == ["GET /items/{item_id}", "lookup"]
+    assert spans[1]["parent_id"] == spans[0]["span_id"]
+    assert spans[0]["attributes"]["http.status_code"] == 200
+
+
+def test_file_exporter_flushes_in_the_background(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    exporter = FileExporter(str(path), interval=0.01)
+    exporter.export(Tracer("test").start_request(SAMPLED, "GET"))
+    exporter._closed.wait(0.2)
+    assert path.exists()
+    exporter.close()
@@ -0,0 +1,64 @@
+"""Writes take one round trip each: RETURNING, never a refresh"""
+import pytest
+
+from app import routes
+from app.events import CREATED, IdReplica
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def author(monkeypatch):
+    monkeypatch.setattr(routes, "user_replica", IdReplica())
+    routes.user_replica.apply({"type": CREATED, "id": 1})
+
+
+async def test_create_is_one_statement(client, statements):
+    response = await client.post("/api/v1/posts", json={"title": "t", "content": "c", "author_id": 1})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["id"] == 1 and body["created_at"]
+    assert len(statements) == 1
+    assert "RETURNING" in statements[0]
+
+
+async def test_update_is_one_statement(client, statements):
+    await client.post("/api/v1/posts", json={"title": "t", "content": "c", "author_id": 1})
+    statements.clear()
+    response = await client.put("/api/v1/posts/1", json={"title": "edited"})
+    assert response.status_code == 200
+    assert response.json()["title"] == "edited"
+    assert response.json()["updated_at"]
+    assert len(statements) == 1
+
+
+async def test_update_missing_post_is_404(client, statements):
+    response = await client.put("/api/v1/posts/9", json={"title": "edited"})
+    assert response.status_code == 404
+    assert len(statements) == 1
+
+
+async def test_delete_is_one_statement(client, statements):
+    await client.post("/api/v1/posts", json={"title": "t", "content": "c", "author_id": 1})
+    statements.clear()
+    assert (await client.delete("/api/v1/posts/1")).status_code == 200
+    assert len(statements) == 1
+    assert (await client.delete("/api/v1/posts/1")).status_code == 404
+
+
+async def test_bulk_insert_is_one_statement(client, statements):
+    items = [{"title": f"t{i}", "content": "c", "author_id": 1} for i in range(50)]
+    response = await client.post("/api/v1/posts/bulk", json=items)
+    assert response.json()["created"] == 50
+    assert len(statements) == 1
+    # Each result carries the row created from its own item
+    results = response.json()["results"]
+    assert [result["item"]["title"] for result in results] == [item["title"] for item in items]
+
+
+async def test_bulk_reports_bad_items_by_index(client):
+    items = [{"title": "ok", "content": "c", "author_id": 1}, {"title": "no content"},
+             {"title": "stranger", "content": "c", "author_id": 2}]
+    response = await client.post("/api/v1/posts/bulk", json=items)
+    assert response.json()["created"] == 1
+    assert [result["status"] for result in response.json()["results"]] == [201, 422, 400]
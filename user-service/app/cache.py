@@ -0,0 +1,348 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, NamedTuple, Optional, Set, Tuple
+
+from fastapi import Response
+
+
+def _retrieve(task: asyncio.Task):
+    """Mark a load's failure retrieved, so it is not logged when nobody is left to await it"""
+    if not task.cancelled():
+        task.exception()
+
+
+class ExistenceCache:
+    """Bounded LRU cache of upstream existence checks.
+
+    Hits (the id exists) and misses (it does not) expire after separate
+    TTLs, so a deleted record is forgotten quickly while a live one is
+    served locally for longer. Concurrent lookups of the same uncached key
+    share a single upstream call, which runs to the end even if the caller
+    that started it is cancelled. Failed loads are never cached, and
+    neither is a load that overlaps an invalidation of its key, as in
+    ResponseCache.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60.0, negative_ttl: float = 5.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._stale: Set[Hashable] = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @classmethod
+    def from_env(cls, prefix: str = "EXISTS_CACHE") -> "ExistenceCache":
+        return cls(
+            maxsize=int(os.getenv(f"{prefix}_SIZE", "10000")),
+            ttl=float(os.getenv(f"{prefix}_TTL", "60")),
+            negative_ttl=float(os.getenv(f"{prefix}_NEGATIVE_TTL", "5")),
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable):
+        """Return the cached answer for ``key``, or None if absent or expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: bool):
+        ttl = self.ttl if value else self.negative_ttl
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> bool:
+        self.invalidations += 1
+        if key in self._inflight:
+            self._stale.add(key)
+        return self._entries.pop(key, None) is not None
+
+    def clear(self):
+        self._entries.clear()
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[bool]]) -> bool:
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+
+        inflight = self._inflight.get(key)
+        if inflight is None:
+            # A task of its own, so a caller that is cancelled does not
+            # cancel the load for the others waiting on it
+            inflight = self._inflight[key] = asyncio.ensure_future(self._load(key, loader))
+            inflight.add_done_callback(_retrieve)
+        return await asyncio.shield(inflight)
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[bool]]) -> bool:
+        try:
+            value = await loader()
+            if key not in self._stale:
+                self.set(key, value)
+            return value
+        finally:
+            del self._inflight[key]
+            self._stale.discard(key)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+class CachedResponse(NamedTuple):
+    """A response body as sent, with the ETag it was sent under"""
+
+    body: bytes
+    etag: str
+
+    def response(self, headers_from: Response, media_type: str = "application/json") -> Response:
+        cached = Response(self.body, media_type=media_type)
+        cached.headers.raw.extend(headers_from.headers.raw)
+        return cached
+
+
+class DirectoryTier:
+    """Second cache tier shared by every process on the host: one file per key.
+
+    Point it at a tmpfs such as /dev/shm and a response one worker built
+    is a file read away for the others. Files are replaced atomically and
+    removed on invalidation, so a reader sees a whole entry or none;
+    entries older than ``ttl`` seconds count as absent.
+
+    Each invalidated key also has a generation file, rewritten with a new
+    token on every invalidation. A loader reads the generation before it
+    reads the record and stores its entry only if the generation is still
+    the same, checked again after the write, so a load that overlapped
+    another worker's write never leaves its old body behind.
+    """
+
+    def __init__(self, directory: str, namespace: str, ttl: float = 60.0):
+        self.directory = directory
+        self.namespace = namespace
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: Hashable) -> str:
+        return os.path.join(self.directory, f"{self.namespace}-{key}")
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        try:
+            with open(self.path(key), "rb") as f:
+                if os.fstat(f.fileno()).st_mtime + self.ttl <= time.time():
+                    return None
+                etag, _, body = f.read().partition(b"\n")
+        except FileNotFoundError:
+            return None
+        return CachedResponse(body, etag.decode())
+
+    def generation(self, key: Hashable) -> bytes:
+        """Token of the last invalidation of ``key``, empty if there was none"""
+        try:
+            with open(f"{self.path(key)}.gen", "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return b""
+
+    def set(self, key: Hashable, value: CachedResponse, generation: Optional[bytes] = None) -> bool:
+        """Store ``value``, unless ``key`` was invalidated since ``generation`` was read"""
+        if generation is not None and self.generation(key) != generation:
+            return False
+        path = self.path(key)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(value.etag.encode() + b"\n" + value.body)
+        os.replace(temporary, path)
+        # An invalidation between the check and the write bumped the
+        # generation first and may have deleted before the write landed
+        if generation is not None and self.generation(key) != generation:
+            self.delete(key)
+            return False
+        return True
+
+    def invalidate(self, key: Hashable):
+        """Bump the generation of ``key``, then delete its entry"""
+        path = f"{self.path(key)}.gen"
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(os.urandom(8).hex().encode())
+        os.replace(temporary, path)
+        self.delete(key)
+
+    def delete(self, key: Hashable):
+        try:
+            os.unlink(self.path(key))
+        except FileNotFoundError:
+            pass
+
+
+class ResponseCache:
+    """Serialized responses by record id: an LRU per process, optionally
+    backed by a DirectoryTier shared between processes.
+
+    The LRU is bounded by entries and by body bytes, and entries expire
+    after ``ttl`` seconds as a backstop; writes are expected to call
+    ``invalidate`` after they commit. Concurrent misses of one key share a
+    single load (single flight), and a load that overlaps an invalidation
+    of its key, in this process or (through the shared tier's
+    generations) in any other, is returned to its callers but not cached,
+    since it may have read the row before the write. Loads returning None
+    (no such record) are not cached.
+    """
+
+    def __init__(self, maxsize: int = 10000, max_bytes: int = 64 * 2 ** 20, ttl: float = 60.0,
+                 shared: Optional[DirectoryTier] = None):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.shared = shared
+        self._entries: "OrderedDict[Hashable, Tuple[CachedResponse, float]]" = OrderedDict()
+        self._bytes = 0
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._stale: Set[Hashable] = set()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @classmethod
+    def from_env(cls, namespace: str, prefix: str = "READ_CACHE") -> "ResponseCache":
+        """READ_CACHE_DIR adds the shared tier; READ_CACHE_SIZE sizes the LRU.
+
+        The LRU of a worker only hears of writes made by another worker
+        through a FileBus, so unless EVENT_BUS_DIR is set it is off by
+        default and only the shared tier, whose entries every worker's
+        writes remove, is used. Set READ_CACHE_SIZE to keep an LRU anyway,
+        e.g. when the service runs as a single process.
+        """
+        ttl = float(os.getenv(f"{prefix}_TTL", "60"))
+        directory = os.getenv(f"{prefix}_DIR")
+        default_size = "10000" if os.getenv("EVENT_BUS_DIR") else "0"
+        return cls(
+            maxsize=int(os.getenv(f"{prefix}_SIZE", default_size)),
+            max_bytes=int(os.getenv(f"{prefix}_MAX_MB", "64")) * 2 ** 20,
+            ttl=ttl,
+            shared=DirectoryTier(directory, namespace, ttl) if directory else None,
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: CachedResponse):
+        if self.maxsize <= 0 or len(value.body) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._bytes += len(value.body)
+        while len(self._entries) > self.maxsize or self._bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> bool:
+        """Forget ``key`` here and in the shared tier"""
+        self.invalidations += 1
+        if key in self._inflight:
+            self._stale.add(key)
+        if self.shared is not None:
+            self.shared.invalidate(key)
+        return self._drop(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def _drop(self, key: Hashable) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self._bytes -= len(entry[0].body)
+        return True
+
+    async def get_or_load(self, key: Hashable,
+                          loader: Callable[[], Awaitable[Optional[CachedResponse]]]) -> Optional[CachedResponse]:
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        if self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.shared_hits += 1
+                self.set(key, value)
+                return value
+        self.misses += 1
+
+        inflight = self._inflight.get(key)
+        if inflight is None:
+            # As in ExistenceCache, a cancelled caller leaves the load running
+            inflight = self._inflight[key] = asyncio.ensure_future(self._load(key, loader))
+            inflight.add_done_callback(_retrieve)
+        return await asyncio.shield(inflight)
+
+    async def _load(self, key: Hashable,
+                    loader: Callable[[], Awaitable[Optional[CachedResponse]]]) -> Optional[CachedResponse]:
+        # Read before the record, so a write by another worker during the load shows
+        generation = self.shared.generation(key) if self.shared is not None else None
+        try:
+            value = await loader()
+            if value is not None and key not in self._stale and (
+                self.shared is None or self.shared.set(key, value, generation)
+            ):
+                self.set(key, value)
+            return value
+        finally:
+            del self._inflight[key]
+            self._stale.discard(key)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
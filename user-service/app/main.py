@@ -1,13 +1,39 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Body, FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 import os
 import uvicorn
+from .admission import AdmissionController, AdmissionMiddleware
+from .bulk import BULK_MAX_ITEMS, item_created, item_error, summarize, validate_items
+from .etag import ETAG_HEADER, check_not_modified, make_etag
+from .events import CREATED, LocalBus
+from .metrics import METRICS_ENABLED, MetricsMiddleware, metrics_response
+from .negotiation import COMPRESSION_ENABLED, CompressionMiddleware, MessagePackMiddleware
+from .pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, decode_cursor, paginate
+from .persistence import Persistence
+from .serialization import ListEncoder
+from .shared import SharedState
+from .columns import SHARED_TEXT, TEXT, TIMESTAMP
+from .store import IndexedStore, DuplicateKeyError
+from .tracing import Tracer, TracingMiddleware
 
 app = FastAPI(title="User Service", version="1.0.0")
 
+# Concurrency and rate limits in front of every route, reads ahead of
+# writes, writes shed under overload. Added first so it runs innermost:
+# its 429s and 503s still carry CORS headers and show up in metrics.
+admission = AdmissionController.from_env()
+if admission is not None:
+    app.add_middleware(AdmissionMiddleware, controller=admission)
+
+# MessagePack for clients whose Accept asks for it (other services), then
+# gzip/br/zstd by Accept-Encoding for bodies of COMPRESSION_MIN_BYTES and up
+app.add_middleware(MessagePackMiddleware)
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -15,11 +41,46 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, ETAG_HEADER],
 )
 
+# W3C traceparent in and out, sampled spans kept for /api/v1/traces
+tracer = Tracer.from_env("user-service")
+app.add_middleware(TracingMiddleware, tracer=tracer)
+
+# Per-route latency, requests in flight and SQL per request, on /metrics
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # Use in-memory storage instead of database
-users_db = []
-user_id_counter = 1
+# With STORE_SOCKET set, every worker shares one store in an owner process.
+# Records are kept column by column in this layout (see columns.py).
+USER_COLUMNS = {"username": TEXT, "email": TEXT, "full_name": TEXT, "bio": SHARED_TEXT, "created_at": TIMESTAMP}
+shared_state = SharedState.from_env()
+if shared_state is not None:
+    users_db = shared_state.store("users", unique=("username", "email"), columns=USER_COLUMNS)
+else:
+    users_db = IndexedStore(unique=("username", "email"), columns=USER_COLUMNS)
+# Optional snapshot + write-ahead log under $PERSIST_DIR, off by default
+# (a shared store is persisted by its owner process instead)
+users_persistence = None if shared_state else Persistence.from_env("users")
+
+# Other services replicate user ids from these events instead of asking
+bus = LocalBus.from_env()
+
+@app.on_event("startup")
+def restore_users():
+    if users_persistence is not None:
+        users_persistence.attach(users_db)
+
+@app.on_event("shutdown")
+def persist_users():
+    if users_persistence is not None:
+        users_persistence.close()
+
+@app.on_event("shutdown")
+def close_tracer():
+    tracer.close()
 
 # Your existing Pydantic models here...
 class UserCreate(BaseModel):
@@ -36,6 +97,31 @@ class User(BaseModel):
     bio: str
     created_at: str
 
+class ExistsRequest(BaseModel):
+    ids: List[int] = Field(max_length=10000)
+
+class ExistsResponse(BaseModel):
+    existing: List[int]
+    missing: List[int]
+
+class BatchGetResponse(BaseModel):
+    users: List[User]
+    missing: List[int]
+
+class BulkItemResult(BaseModel):
+    index: int
+    status: int
+    item: Optional[User] = None
+    error: Optional[str] = None
+
+class BulkResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[BulkItemResult]
+
+# Compiled once; list endpoints encode the stored records through it
+user_list = ListEncoder(User)
+
 @app.get("/")
 def root():
     return {"message": "User Service is running!", "service": "user-service"}
@@ -44,18 +130,20 @@ def root():
 def health_check():
     return {"service": "user-service", "status": "healthy"}
 
+@app.get("/metrics")
+def get_metrics():
+    return metrics_response()
+
+# Recently sampled spans, newest first; a trace id comes from the
+# traceresponse header of a sampled response
+@app.get("/api/v1/traces")
+def get_traces(trace_id: Optional[str] = None, limit: int = Query(100, ge=1, le=10000)):
+    return tracer.buffer.spans(trace_id, limit)
+
 # Replace your database-dependent endpoints with in-memory versions
 @app.post("/api/v1/users", response_model=User)
 def create_user(user: UserCreate):
-    global user_id_counter
-    
-    # Check if user exists
-    for existing_user in users_db:
-        if existing_user["username"] == user.username or existing_user["email"] == user.email:
-            raise HTTPException(status_code=400, detail="Username or email already exists")
-    
     new_user = {
-        "id": user_id_counter,
         "username": user.username,
         "email": user.email,
         "full_name": user.full_name,
@@ -63,21 +151,69 @@ def create_user(user: UserCreate):
         "created_at": datetime.now().isoformat()
     }
     
-    users_db.append(new_user)
-    user_id_counter += 1
-    
+    # Unique indexes on username and email reject duplicates
+    try:
+        new_user = users_db.insert(new_user)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Username or email already exists")
+    bus.publish("users", CREATED, new_user["id"])
     return new_user
 
+# Batch existence check used by the other services' verify helpers
+@app.post("/api/v1/users:exists", response_model=ExistsResponse)
+def users_exist(request: ExistsRequest):
+    found = users_db.get_many(request.ids)
+    existing = [i for i in request.ids if i in found]
+    missing = [i for i in request.ids if i not in found]
+    return {"existing": existing, "missing": missing}
+
+# Fetch many users in one call, e.g. every comment author on a post page
+@app.post("/api/v1/users:batchGet", response_model=BatchGetResponse)
+def batch_get_users(request: ExistsRequest):
+    ids = list(dict.fromkeys(request.ids))
+    found = users_db.get_many(ids)
+    users = [found[i] for i in ids if i in found]
+    missing = [i for i in ids if i not in found]
+    return {"users": users, "missing": missing}
+
+@app.post("/api/v1/users/bulk", response_model=BulkResponse)
+def create_users_bulk(items: List[Dict[str, Any]] = Body(..., max_length=BULK_MAX_ITEMS)):
+    valid, results = validate_items(UserCreate, items)
+    created_at = datetime.now().isoformat()
+    stored = users_db.insert_many(
+        {
+            "username": user.username,
+            "email": user.email,
+            "full_name": user.full_name,
+            "bio": user.bio,
+            "created_at": created_at
+        }
+        for _, user in valid
+    )
+    
+    for (index, _), outcome in zip(valid, stored):
+        if isinstance(outcome, DuplicateKeyError):
+            results.append(item_error(index, 400, "Username or email already exists"))
+        else:
+            results.append(item_created(index, outcome))
+    bus.publish_many("users", CREATED, [user["id"] for user in stored if isinstance(user, dict)])
+    return summarize(results)
+
 @app.get("/api/v1/users", response_model=List[User])
-def get_users(skip: int = 0, limit: int = 100):
-    return users_db[skip:skip + limit]
+def get_users(request: Request, response: Response, cursor: Optional[str] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)):
+    after_id = decode_cursor(cursor)[1] if cursor else 0
+    # Any write to users_db changes the collection version, and with it the tag
+    check_not_modified(request, response, make_etag("users", users_db.collection_version(), after_id, limit))
+    return user_list.response(paginate(response, users_db.page(after_id, limit + 1), limit), response)
 
 @app.get("/api/v1/users/{user_id}", response_model=User)
-def get_user(user_id: int):
-    for user in users_db:
-        if user["id"] == user_id:
-            return user
-    raise HTTPException(status_code=404, detail="User not found")
+def get_user(user_id: int, request: Request, response: Response):
+    found = users_db.get_versioned(user_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    user, version = found
+    check_not_modified(request, response, make_etag("user", user_id, version))
+    return user
 
 # For Azure deployment
 if __name__ == "__main__":
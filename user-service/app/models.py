@@ -1,7 +1,11 @@
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, Index
 from sqlalchemy.sql import func
+from datetime import datetime, timezone
 from .database import Base
 
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
 class User(Base):
     __tablename__ = "users"
     
@@ -10,4 +14,13 @@ class User(Base):
     email = Column(String, unique=True, index=True, nullable=False)
     full_name = Column(String, nullable=False)
     bio = Column(String, default="")
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    # Stamped by the app, like updated_at: SQLite's CURRENT_TIMESTAMP has
+    # no fraction of a second, and keyset cursors compare against values
+    # bound with microseconds. The server default covers other writers.
+    created_at = Column(DateTime(timezone=True), default=utcnow, server_default=func.now())
+    # Stamped by the app, with microsecond resolution on every backend, as
+    # it versions the row for ETags
+    updated_at = Column(DateTime(timezone=True), onupdate=utcnow)
+    
+    # Backs keyset pagination on (created_at, id)
+    __table_args__ = (Index("ix_users_created_at_id", "created_at", "id"),)
\ No newline at end of file
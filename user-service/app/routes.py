@@ -1,47 +1,162 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import insert, or_, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Dict, List, Optional
 from . import models, schemas
+from .bulk import BULK_MAX_ITEMS, insert_returning, item_created, item_error, summarize, validate_items
+from .cache import CachedResponse, ResponseCache
 from .database import get_db
+from .etag import check_not_modified, make_etag, row_version
+from .events import CREATED, UPDATED, LocalBus
+from .pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, paginate
+from .serialization import ListEncoder
 
 router = APIRouter()
+# Checks and inserts of a bulk create that races with other writes
+BULK_INSERT_ATTEMPTS = 3
+# Compiled once; list endpoints encode rows through it
+user_list = ListEncoder(schemas.User)
+# Other services replicate user ids from these events instead of asking
+bus = LocalBus.from_env()
+# GET /users/{id} bodies. Writes invalidate them here and in the shared
+# tier; other workers hear of it through the bus (EVENT_BUS_DIR)
+user_cache = ResponseCache.from_env("users")
+
+def _invalidate_user(event: dict):
+    if event["type"] != CREATED:
+        user_cache.invalidate(event["id"])
+
+bus.subscribe("users", _invalidate_user)
+
+@router.on_event("startup")
+async def start_events():
+    await bus.start()
+
+@router.on_event("shutdown")
+async def close_events():
+    await bus.close()
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    return {"user_responses": user_cache.stats()}
 
 @router.post("/users", response_model=schemas.User)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    # Check if user exists
-    db_user = db.query(models.User).filter(
-        (models.User.username == user.username) | (models.User.email == user.email)
-    ).first()
-    if db_user:
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
+    # One INSERT ... RETURNING; the unique indexes reject duplicates
+    stmt = insert(models.User).values(**user.model_dump()).returning(models.User)
+    try:
+        db_user = await db.scalar(stmt)
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
         raise HTTPException(status_code=400, detail="Username or email already exists")
-    
-    db_user = models.User(**user.model_dump())
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    bus.publish("users", CREATED, db_user.id)
     return db_user
 
+@router.post("/users/bulk", response_model=schemas.BulkResponse)
+async def create_users_bulk(items: List[Dict[str, Any]] = Body(..., max_length=BULK_MAX_ITEMS), db: AsyncSession = Depends(get_db)):
+    valid, results = validate_items(schemas.UserCreate, items)
+    
+    pending = valid
+    for _ in range(BULK_INSERT_ATTEMPTS):
+        if not pending:
+            break
+        # One query finds every username/email in the batch that is already taken
+        taken = (await db.execute(select(models.User.username, models.User.email).where(
+            or_(models.User.username.in_({user.username for _, user in pending}),
+                models.User.email.in_({user.email for _, user in pending}))
+        ))).all()
+        seen_usernames = {row.username for row in taken}
+        seen_emails = {row.email for row in taken}
+        
+        accepted = []
+        for index, user in pending:
+            if user.username in seen_usernames or user.email in seen_emails:
+                results.append(item_error(index, 400, "Username or email already exists"))
+                continue
+            seen_usernames.add(user.username)
+            seen_emails.add(user.email)
+            accepted.append((index, user))
+        if not accepted:
+            break
+        
+        try:
+            # Single multi-row INSERT ... RETURNING, no per-row refresh
+            created = await insert_returning(db, models.User, [user.model_dump() for _, user in accepted])
+            await db.commit()
+        except IntegrityError:
+            # Someone took a name after the check: check again, insert the rest
+            await db.rollback()
+            pending = accepted
+            continue
+        results.extend(
+            item_created(index, schemas.User.model_validate(user))
+            for (index, _), user in zip(accepted, created)
+        )
+        bus.publish_many("users", CREATED, [user.id for user in created])
+        break
+    else:
+        # Still colliding with concurrent writes after every attempt
+        results.extend(item_error(index, 409, "Conflicts with a concurrent write, retry") for index, _ in pending)
+    return summarize(results)
+
+@router.post("/users:exists", response_model=schemas.ExistsResponse)
+async def users_exist(request: schemas.ExistsRequest, db: AsyncSession = Depends(get_db)):
+    # One IN query for the whole batch
+    found = set(await db.scalars(select(models.User.id).where(models.User.id.in_(request.ids))))
+    return {
+        "existing": [i for i in request.ids if i in found],
+        "missing": [i for i in request.ids if i not in found],
+    }
+
+@router.post("/users:batchGet", response_model=schemas.BatchGetResponse)
+async def batch_get_users(request: schemas.ExistsRequest, db: AsyncSession = Depends(get_db)):
+    ids = list(dict.fromkeys(request.ids))
+    users = (await db.scalars(select(models.User).where(models.User.id.in_(ids)))).all()
+    found = {user.id for user in users}
+    return {"users": users, "missing": [i for i in ids if i not in found]}
+
 @router.get("/users", response_model=List[schemas.User])
-def get_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    users = db.query(models.User).offset(skip).limit(limit).all()
-    return users
+async def get_users(request: Request, response: Response, cursor: Optional[str] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), db: AsyncSession = Depends(get_db)):
+    # Keyset pagination: seek past the cursor on the (created_at, id) index
+    stmt = select(models.User)
+    if cursor:
+        stmt = stmt.where(tuple_(models.User.created_at, models.User.id) > decode_cursor(cursor))
+    users = (await db.scalars(stmt.order_by(models.User.created_at, models.User.id).limit(limit + 1))).all()
+    check_not_modified(request, response, make_etag("users", [(user.id, row_version(user)) for user in users]))
+    return user_list.response(paginate(response, users, limit), response)
+
+async def _load_user(db: AsyncSession, user_id: int) -> Optional[CachedResponse]:
+    user = await db.get(models.User, user_id)
+    if user is None:
+        return None
+    body = schemas.User.model_validate(user).model_dump_json().encode()
+    return CachedResponse(body, make_etag("user", user_id, row_version(user)))
 
 @router.get("/users/{user_id}", response_model=schemas.User)
-def get_user(user_id: int, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if not user:
+async def get_user(user_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    cached = await user_cache.get_or_load(user_id, lambda: _load_user(db, user_id))
+    if cached is None:
         raise HTTPException(status_code=404, detail="User not found")
-    return user
+    check_not_modified(request, response, cached.etag)
+    return cached.response(response)
 
 @router.put("/users/{user_id}", response_model=schemas.User)
-def update_user(user_id: int, user_update: schemas.UserUpdate, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+async def update_user(user_id: int, user_update: schemas.UserUpdate, db: AsyncSession = Depends(get_db)):
+    changes = user_update.model_dump(exclude_unset=True)
+    if not changes:
+        user = await db.get(models.User, user_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        return user
+    
+    # One UPDATE ... RETURNING, no pre-SELECT or refresh
+    stmt = update(models.User).where(models.User.id == user_id).values(**changes).returning(models.User)
+    user = await db.scalar(stmt)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    
-    for field, value in user_update.model_dump(exclude_unset=True).items():
-        setattr(user, field, value)
-    
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    user_cache.invalidate(user_id)
+    bus.publish("users", UPDATED, user_id)
     return user
\ No newline at end of file
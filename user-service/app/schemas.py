@@ -1,6 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 class UserBase(BaseModel):
     username: str
@@ -18,6 +18,29 @@ class UserUpdate(BaseModel):
 class User(UserBase):
     id: int
     created_at: datetime
+    updated_at: Optional[datetime] = None
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class ExistsRequest(BaseModel):
+    ids: List[int] = Field(max_length=10000)
+
+class ExistsResponse(BaseModel):
+    existing: List[int]
+    missing: List[int]
+
+class BulkItemResult(BaseModel):
+    index: int
+    status: int
+    item: Optional[User] = None
+    error: Optional[str] = None
+
+class BulkResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[BulkItemResult]
+
+class BatchGetResponse(BaseModel):
+    users: List[User]
+    missing: List[int]
@@ -0,0 +1,340 @@
+import contextvars
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import Deque, List, Optional
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# version-traceid-parentid-flags, https://www.w3.org/TR/trace-context/
+TRACEPARENT_HEADER = "traceparent"
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+# Statements are cut to this many characters in db spans
+MAX_STATEMENT_LENGTH = 500
+
+
+class Span:
+    """One timed operation of a trace.
+
+    Requests that are not sampled still get a Span, so their trace id
+    reaches the next service, but nothing below it is recorded and it is
+    never exported.
+    """
+
+    __slots__ = ("tracer", "trace_id", "span_id", "parent_id", "sampled", "name", "kind",
+                 "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, tracer: "Tracer", trace_id: int, parent_id: Optional[int], sampled: bool,
+                 name: str, kind: str = "internal", attributes: Optional[dict] = None):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.span_id = random.getrandbits(64) or 1
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes if attributes is not None else {}
+        self.error: Optional[str] = None
+
+    def child(self, name: str, kind: str = "internal", attributes: Optional[dict] = None) -> "Span":
+        return Span(self.tracer, self.trace_id, self.span_id, self.sampled, name, kind, attributes)
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id:032x}-{self.span_id:016x}-{'01' if self.sampled else '00'}"
+
+    def end(self, error: Optional[str] = None, **attributes):
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = error
+        self.attributes.update(attributes)
+        if self.sampled:
+            self.tracer.export(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": f"{self.trace_id:032x}",
+            "span_id": f"{self.span_id:016x}",
+            "parent_id": f"{self.parent_id:016x}" if self.parent_id else None,
+            "service": self.tracer.service,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "duration_us": (self.end_ns - self.start_ns) // 1000,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+# The span of the code running now; unset outside a request
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def start_span(name: str, kind: str = "internal", **attributes) -> Optional[Span]:
+    """A child of the current span, or None when the request is not sampled.
+
+    The span is not made current; ``traced()`` does that for a block.
+    """
+    parent = _current_span.get()
+    if parent is None or not parent.sampled:
+        return None
+    return parent.child(name, kind, attributes)
+
+
+def end_span(span: Optional[Span], error: Optional[str] = None, **attributes):
+    if span is not None:
+        span.end(error, **attributes)
+
+
+class traced:
+    """``with traced("name"):`` records the block as a child of the current span"""
+
+    __slots__ = ("name", "attributes", "_span", "_token")
+
+    def __init__(self, name: str, **attributes):
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self) -> Optional[Span]:
+        self._span = start_span(self.name, **self.attributes)
+        if self._span is not None:
+            self._token = _current_span.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._span is not None:
+            _current_span.reset(self._token)
+            self._span.end(repr(exc) if exc is not None else None)
+
+
+def inject(headers: Optional[dict], span: Optional[Span] = None) -> Optional[dict]:
+    """``headers`` plus the traceparent of ``span`` (default: the current span)"""
+    span = span or _current_span.get()
+    if span is None:
+        return headers
+    return {**(headers or {}), TRACEPARENT_HEADER: span.traceparent()}
+
+
+class RingBuffer:
+    """The last ``size`` finished spans, for GET /api/v1/traces"""
+
+    def __init__(self, size: int = 10000):
+        self._spans: Deque[Span] = deque(maxlen=size)
+
+    def export(self, span: Span):
+        self._spans.append(span)
+
+    def spans(self, trace_id: Optional[str] = None, limit: int = 100) -> List[dict]:
+        found = []
+        for item in reversed(self._spans):
+            if trace_id is None or f"{item.trace_id:032x}" == trace_id:
+                found.append(item.to_dict())
+                if len(found) >= limit:
+                    break
+        return found
+
+    def close(self):
+        pass
+
+
+class FileExporter:
+    """Appends finished spans to ``path`` as JSON lines.
+
+    ``export`` only encodes the span and queues it, so the event loop
+    never waits on the disk; a background thread appends everything
+    queued every ``interval`` seconds, as the write-ahead log does.
+    """
+
+    def __init__(self, path: str, interval: float = 1.0):
+        self.path = path
+        self.interval = interval
+        self._pending: List[str] = []
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._writer = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+        self._writer.start()
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), separators=(",", ":"))
+        with self._lock:
+            self._pending.append(line)
+
+    def flush(self):
+        with self._lock:
+            lines, self._pending = self._pending, []
+        if lines:
+            with open(self.path, "a") as f:
+                f.write("\n".join(lines) + "\n")
+
+    def close(self):
+        self._closed.set()
+        self._writer.join()
+        self.flush()
+
+    def _run(self):
+        while not self._closed.wait(self.interval):
+            try:
+                self.flush()
+            except OSError:
+                logger.exception("Writing spans to %s failed", self.path)
+
+
+class Tracer:
+    """Starts the request spans of one service and exports finished spans.
+
+    Sampling is decided once per trace, at its root, and travels in the
+    traceparent flags: a request that arrives with a traceparent follows
+    its caller's decision, so a trace is recorded in every service or in
+    none. A new trace is sampled with probability ``sample_rate``. At
+    most ``max_per_second`` requests a second are recorded, new traces
+    and continued ones alike, which bounds the cost of tracing however
+    hot the endpoint and whatever flags clients send; a sampled
+    traceparent over the budget is continued unsampled. Spans go to a
+    ring buffer, and to a JSON-lines file when ``path`` is set.
+    """
+
+    def __init__(self, service: str, sample_rate: float = 0.01, max_per_second: float = 10.0,
+                 buffer_size: int = 10000, path: Optional[str] = None):
+        self.service = service
+        self.sample_rate = sample_rate
+        self.max_per_second = max_per_second
+        self.buffer = RingBuffer(buffer_size)
+        self.exporters = [self.buffer] + ([FileExporter(path)] if path else [])
+        self._window = 0
+        self._window_sampled = 0
+
+    @classmethod
+    def from_env(cls, service: str) -> "Tracer":
+        return cls(
+            service,
+            sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", "0.01")),
+            max_per_second=float(os.getenv("TRACE_MAX_PER_SECOND", "10")),
+            buffer_size=int(os.getenv("TRACE_BUFFER_SIZE", "10000")),
+            path=os.getenv("TRACE_FILE") or None,
+        )
+
+    def _sample_root(self) -> bool:
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return False
+        return self._within_budget()
+
+    def _within_budget(self) -> bool:
+        """Count one more sampled request this second, False when over budget"""
+        window = int(time.monotonic())
+        if window != self._window:
+            self._window, self._window_sampled = window, 0
+        if self._window_sampled >= self.max_per_second:
+            return False
+        self._window_sampled += 1
+        return True
+
+    def start_request(self, traceparent: Optional[str], name: str) -> Span:
+        """The server span of a request, continuing ``traceparent`` when valid"""
+        match = _TRACEPARENT.match(traceparent) if traceparent else None
+        if match is not None and match.group(1) != "0" * 32:
+            trace_id, parent_id = int(match.group(1), 16), int(match.group(2), 16)
+            sampled = bool(int(match.group(3), 16) & 1) and self._within_budget()
+        else:
+            trace_id, parent_id, sampled = random.getrandbits(128) or 1, None, self._sample_root()
+        return Span(self, trace_id, parent_id, sampled, name, "server")
+
+    def export(self, span: Span):
+        for exporter in self.exporters:
+            exporter.export(span)
+
+    def close(self):
+        for exporter in self.exporters:
+            exporter.close()
+
+
+class TracingMiddleware:
+    """Runs each HTTP request inside a server span.
+
+    The span continues the caller's traceparent, is current for the
+    handler (so upstream calls and SQL become its children) and is named
+    after the route template once routing is done. Sampled responses
+    carry a ``traceresponse`` header with the trace id, to look the trace
+    up on /api/v1/traces.
+    """
+
+    def __init__(self, app, tracer: Tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+        span = self.tracer.start_request(traceparent, scope["method"])
+        token = _current_span.set(span)
+        if not span.sampled:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                _current_span.reset(token)
+            return
+
+        status = 500
+
+        async def send_traced(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"traceresponse", span.traceparent().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        error = None
+        try:
+            await self.app(scope, receive, send_traced)
+        except Exception as exc:
+            error = repr(exc)
+            raise
+        finally:
+            _current_span.reset(token)
+            route = scope.get("route")
+            span.name = f"{scope['method']} {route.path if route is not None else scope['path']}"
+            span.end(error, **{"http.target": scope["path"], "http.status_code": status})
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("trace_spans", []).append(
+        start_span("db.query", "client", **{"db.statement": statement[:MAX_STATEMENT_LENGTH]})
+    )
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    end_span(conn.info["trace_spans"].pop())
+
+
+def _handle_error(context):
+    spans = context.connection.info.get("trace_spans") if context.connection is not None else None
+    if spans:
+        end_span(spans.pop(), repr(context.original_exception))
+
+
+def instrument_engine(engine):
+    """Record each statement ``engine`` (sync or async) runs as a db.query span"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
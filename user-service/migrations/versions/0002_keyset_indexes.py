@@ -0,0 +1,27 @@
+"""(created_at, id) index for keyset pagination
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_users_created_at_id", "users", ["created_at", "id"], if_not_exists=True)
+    if op.get_bind().dialect.name == "sqlite":
+        # CURRENT_TIMESTAMP stored whole seconds; cursors compare as text
+        # against values with microseconds, the format the app now writes
+        op.execute(
+            "UPDATE users SET created_at = strftime('%Y-%m-%d %H:%M:%f', created_at) || '000' "
+            "WHERE length(created_at) = 19"
+        )
+
+
+def downgrade():
+    op.drop_index("ix_users_created_at_id", table_name="users")
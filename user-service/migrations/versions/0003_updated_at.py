@@ -0,0 +1,23 @@
+"""users.updated_at, the row version behind ETags
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = {column["name"] for column in sa.inspect(op.get_bind()).get_columns("users")}
+    if "updated_at" not in columns:
+        op.add_column("users", sa.Column("updated_at", sa.DateTime(timezone=True)))
+
+
+def downgrade():
+    op.drop_column("users", "updated_at")
@@ -0,0 +1,59 @@
+"""Shared fixtures. Run from the service directory: python -m pytest -q
+
+The SQL routes run against a SQLite file that each test starts afresh;
+nothing upstream is called.
+"""
+import os
+import sys
+import tempfile
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "test.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_FILE}"
+os.environ.setdefault("METRICS_ENABLED", "false")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from app import database, routes  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def tables():
+    """An empty database with the current schema"""
+    await database.engine.dispose()
+    if os.path.exists(DB_FILE):
+        os.remove(DB_FILE)
+    async with database.engine.begin() as conn:
+        await conn.run_sync(database.Base.metadata.create_all)
+    yield
+    await database.engine.dispose()
+
+
+@pytest.fixture
+async def client(tables):
+    """HTTP client for the SQL routes, mounted as the benchmarks mount them"""
+    app = FastAPI()
+    app.include_router(routes.router, prefix="/api/v1")
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+
+@pytest.fixture
+def statements():
+    """SQL statements sent to the database while the test runs"""
+    sent = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        sent.append(statement)
+
+    event.listen(database.engine.sync_engine, "before_cursor_execute", record)
+    yield sent
+    event.remove(database.engine.sync_engine, "before_cursor_execute", record)
@@ -0,0 +1,31 @@
+"""Batch existence and batch get endpoints"""
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def create_users(client, count: int):
+    for i in range(count):
+        await client.post("/api/v1/users", json={"username": f"u{i}", "email": f"u{i}@example.com", "full_name": "U"})
+
+
+async def test_exists_splits_ids_in_one_query(client, statements):
+    await create_users(client, 3)
+    statements.clear()
+    response = await client.post("/api/v1/users:exists", json={"ids": [3, 9, 1, 7]})
+    assert response.json() == {"existing": [3, 1], "missing": [9, 7]}
+    assert len(statements) == 1
+
+
+async def test_batch_get_returns_each_user_once(client, statements):
+    await create_users(client, 2)
+    statements.clear()
+    body = (await client.post("/api/v1/users:batchGet", json={"ids": [2, 2, 5, 1]})).json()
+    assert sorted(user["id"] for user in body["users"]) == [1, 2]
+    assert body["missing"] == [5]
+    assert len(statements) == 1
+
+
+async def test_batch_size_is_bounded(client):
+    response = await client.post("/api/v1/users:exists", json={"ids": list(range(10001))})
+    assert response.status_code == 422
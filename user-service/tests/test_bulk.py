@@ -0,0 +1,56 @@
+"""Bulk user creation reports every item, even when racing other writes"""
+import pytest
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from app import database, models, routes
+
+pytestmark = pytest.mark.anyio
+
+
+def user(name: str) -> dict:
+    return {"username": name, "email": f"{name}@example.com", "full_name": name.title()}
+
+
+async def create_elsewhere(*names: str):
+    """Commit users from another session, as a concurrent request would"""
+    async with database.SessionLocal() as db:
+        await db.execute(insert(models.User), [user(name) for name in names])
+        await db.commit()
+
+
+async def test_taken_and_repeated_names_fail_only_their_items(client):
+    await create_elsewhere("ada")
+    body = (await client.post("/api/v1/users/bulk", json=[user("ada"), user("bob"), user("bob"), {"username": "x"}])).json()
+    assert [result["status"] for result in body["results"]] == [400, 201, 400, 422]
+    assert body["created"] == 1 and body["failed"] == 3
+
+
+async def test_name_taken_after_the_check_fails_only_its_item(client, monkeypatch):
+    real_insert = routes.insert_returning
+    calls = 0
+
+    async def racing_insert(db, model, rows):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            # Lands between the lookup of taken names and the INSERT
+            await create_elsewhere("bob")
+        return await real_insert(db, model, rows)
+
+    monkeypatch.setattr(routes, "insert_returning", racing_insert)
+    response = await client.post("/api/v1/users/bulk", json=[user("ada"), user("bob"), user("cy")])
+    assert response.status_code == 200
+    body = response.json()
+    assert [result["status"] for result in body["results"]] == [201, 400, 201]
+    assert [result["item"]["username"] for result in body["results"] if result["status"] == 201] == ["ada", "cy"]
+    assert calls == 2
+
+
+async def test_gives_up_per_item_when_the_race_never_settles(client, monkeypatch):
+    async def always_conflicting(db, model, rows):
+        raise IntegrityError("INSERT", {}, Exception("UNIQUE constraint failed"))
+
+    monkeypatch.setattr(routes, "insert_returning", always_conflicting)
+    body = (await client.post("/api/v1/users/bulk", json=[user("ada"), user("bob")])).json()
+    assert [result["status"] for result in body["results"]] == [409, 409]
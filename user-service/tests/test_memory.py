@@ -0,0 +1,54 @@
+"""The in-memory app (app.main) over IndexedStore"""
+import httpx
+import pytest
+
+from app import main
+from app.pagination import NEXT_CURSOR_HEADER
+from app.store import IndexedStore
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def memory_client(monkeypatch):
+    monkeypatch.setattr(main, "users_db", IndexedStore(unique=("username", "email"), columns=main.USER_COLUMNS))
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+        yield client
+
+
+def user(name: str) -> dict:
+    return {"username": name, "email": f"{name}@example.com", "full_name": name.title()}
+
+
+async def test_users_are_stored_and_found_by_id(memory_client):
+    created = (await memory_client.post("/api/v1/users", json=user("ada"))).json()
+    assert created["id"] == 1 and created["bio"] == ""
+    assert (await memory_client.get("/api/v1/users/1")).json() == created
+    assert (await memory_client.get("/api/v1/users/2")).status_code == 404
+
+
+async def test_username_and_email_are_unique(memory_client):
+    await memory_client.post("/api/v1/users", json=user("ada"))
+    assert (await memory_client.post("/api/v1/users", json=user("ada"))).status_code == 400
+    same_email = {**user("grace"), "email": "ada@example.com"}
+    assert (await memory_client.post("/api/v1/users", json=same_email)).status_code == 400
+    assert len(main.users_db) == 1
+
+
+async def test_list_pages_by_cursor(memory_client):
+    for i in range(5):
+        await memory_client.post("/api/v1/users", json=user(f"u{i}"))
+    first = await memory_client.get("/api/v1/users", params={"limit": 3})
+    assert [u["id"] for u in first.json()] == [1, 2, 3]
+    second = await memory_client.get("/api/v1/users", params={"limit": 3, "cursor": first.headers[NEXT_CURSOR_HEADER]})
+    assert [u["id"] for u in second.json()] == [4, 5]
+    assert NEXT_CURSOR_HEADER not in second.headers
+
+
+async def test_bulk_create_reports_each_item(memory_client):
+    await memory_client.post("/api/v1/users", json=user("ada"))
+    items = [user("grace"), user("ada"), {"username": "no-email"}, user("alan"), user("grace")]
+    body = (await memory_client.post("/api/v1/users/bulk", json=items)).json()
+    assert [result["status"] for result in body["results"]] == [201, 400, 422, 201, 400]
+    assert (body["created"], body["failed"]) == (2, 3)
+    assert [result["item"]["id"] for result in body["results"] if result["status"] == 201] == [2, 3]
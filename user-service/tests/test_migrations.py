@@ -0,0 +1,98 @@
+"""Alembic revisions bring any database up to the models"""
+import os
+import sqlite3
+
+import httpx
+import pytest
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from fastapi import FastAPI
+from sqlalchemy import create_engine
+
+from app import database, models, routes
+from app.pagination import NEXT_CURSOR_HEADER
+
+from .conftest import DB_FILE
+
+pytestmark = pytest.mark.anyio
+
+ALEMBIC_INI = os.path.join(os.path.dirname(__file__), "..", "alembic.ini")
+
+# users as the first release's create_all made it: no updated_at
+FIRST_RELEASE = """
+CREATE TABLE users (
+    id INTEGER NOT NULL PRIMARY KEY,
+    username VARCHAR NOT NULL,
+    email VARCHAR NOT NULL,
+    full_name VARCHAR NOT NULL,
+    bio VARCHAR,
+    created_at DATETIME DEFAULT (CURRENT_TIMESTAMP)
+);
+CREATE INDEX ix_users_id ON users (id);
+CREATE UNIQUE INDEX ix_users_username ON users (username);
+CREATE UNIQUE INDEX ix_users_email ON users (email);
+"""
+
+
+def upgrade(revision: str = "head"):
+    config = Config(ALEMBIC_INI)
+    config.set_main_option("script_location", os.path.join(os.path.dirname(ALEMBIC_INI), "migrations"))
+    config.attributes["configure_logging"] = False
+    command.upgrade(config, revision)
+    return config
+
+
+def schema_differences() -> list:
+    engine = create_engine(f"sqlite:///{DB_FILE}")
+    with engine.connect() as conn:
+        differences = compare_metadata(MigrationContext.configure(conn), models.Base.metadata)
+    engine.dispose()
+    return differences
+
+
+@pytest.fixture
+async def empty_file():
+    await database.engine.dispose()
+    if os.path.exists(DB_FILE):
+        os.remove(DB_FILE)
+    yield DB_FILE
+    await database.engine.dispose()
+
+
+async def test_fresh_database_matches_the_models(empty_file):
+    upgrade()
+    assert schema_differences() == []
+
+
+async def test_downgrade_undoes_every_revision(empty_file):
+    config = upgrade()
+    command.downgrade(config, "base")
+    with sqlite3.connect(DB_FILE) as conn:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert tables == {"alembic_version"}
+
+
+async def test_first_release_database_is_upgraded(empty_file):
+    with sqlite3.connect(DB_FILE) as conn:
+        conn.executescript(FIRST_RELEASE)
+        conn.executemany(
+            "INSERT INTO users (username, email, full_name, bio) VALUES (?, ?, 'Old User', '')",
+            [(f"old{i}", f"old{i}@example.com") for i in range(3)],
+        )
+    upgrade()
+    assert schema_differences() == []
+
+    app = FastAPI()
+    app.include_router(routes.router, prefix="/api/v1")
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        # Selecting updated_at no longer fails
+        assert (await client.get("/api/v1/users/1")).json()["username"] == "old0"
+        updated = await client.put("/api/v1/users/2", json={"bio": "edited"})
+        assert updated.json()["updated_at"]
+        await client.post("/api/v1/users", json={"username": "new", "email": "new@example.com", "full_name": "N"})
+        first = await client.get("/api/v1/users", params={"limit": 2})
+        assert [user["id"] for user in first.json()] == [1, 2]
+        second = await client.get("/api/v1/users", params={"limit": 2, "cursor": first.headers[NEXT_CURSOR_HEADER]})
+        assert [user["id"] for user in second.json()] == [3, 4]
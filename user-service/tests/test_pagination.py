@@ -0,0 +1,19 @@
+"""Keyset pagination on (created_at, id)"""
+import pytest
+
+from app.pagination import NEXT_CURSOR_HEADER
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_pages_follow_the_cursor(client):
+    for i in range(5):
+        await client.post("/api/v1/users", json={"username": f"u{i}", "email": f"u{i}@example.com", "full_name": "U"})
+    pages, cursor = [], None
+    while True:
+        response = await client.get("/api/v1/users", params={"limit": 2, **({"cursor": cursor} if cursor else {})})
+        pages.append([user["id"] for user in response.json()])
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            break
+    assert pages == [[1, 2], [3, 4], [5]]
@@ -0,0 +1,60 @@
+"""The SQL entry point mounts the same middleware and endpoints as main.py"""
+import importlib.machinery
+import importlib.util
+import os
+
+import httpx
+import pytest
+from sqlalchemy import event
+
+from app import database, metrics
+from app.admission import AdmissionMiddleware
+from app.metrics import MetricsMiddleware
+from app.negotiation import CompressionMiddleware, MessagePackMiddleware
+from app.tracing import TracingMiddleware
+
+pytestmark = pytest.mark.anyio
+
+ENTRY_POINT = os.path.join(os.path.dirname(__file__), "..", "app", "main.py.backup")
+
+
+def load_sql_app(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", True)
+    monkeypatch.setenv("ADMISSION_CONCURRENCY", "8")
+    loader = importlib.machinery.SourceFileLoader("app.main_sql", ENTRY_POINT)
+    spec = importlib.util.spec_from_loader(loader.name, loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def instrumented():
+    metrics.instrument_engine(database.engine)
+    yield
+    for name, listener in (("before_cursor_execute", metrics._before_cursor_execute),
+                           ("after_cursor_execute", metrics._after_cursor_execute),
+                           ("handle_error", metrics._handle_error)):
+        event.remove(database.engine.sync_engine, name, listener)
+
+
+def test_middleware_stack_matches_the_in_memory_app(monkeypatch):
+    module = load_sql_app(monkeypatch)
+    mounted = [middleware.cls for middleware in module.app.user_middleware]
+    for cls in (MetricsMiddleware, TracingMiddleware, CompressionMiddleware, MessagePackMiddleware, AdmissionMiddleware):
+        assert cls in mounted
+    # Metrics outermost, admission innermost, as in main.py
+    assert mounted[0] is MetricsMiddleware and mounted[-1] is AdmissionMiddleware
+
+
+async def test_sql_queries_are_scraped_from_metrics(tables, instrumented, monkeypatch):
+    module = load_sql_app(monkeypatch)
+    transport = httpx.ASGITransport(app=module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        created = await client.post("/api/v1/users", json={"username": "ada", "email": "a@example.com", "full_name": "A"})
+        assert created.status_code == 200
+        scraped = await client.get("/metrics")
+        traces = await client.get("/api/v1/traces")
+    assert scraped.status_code == 200 and traces.status_code == 200
+    assert 'http_requests_total{method="POST",route="/api/v1/users",status="200"}' in scraped.text
+    assert 'http_request_db_queries_count{route="/api/v1/users"}' in scraped.text
@@ -0,0 +1,37 @@
+"""Writes take one round trip each: RETURNING, never a refresh"""
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+USER = {"username": "ada", "email": "ada@example.com", "full_name": "Ada Lovelace"}
+
+
+async def test_create_is_one_statement(client, statements):
+    response = await client.post("/api/v1/users", json=USER)
+    assert response.status_code == 200
+    assert response.json()["id"] == 1 and response.json()["created_at"]
+    assert len(statements) == 1
+    assert "RETURNING" in statements[0]
+
+
+async def test_duplicate_is_rejected(client):
+    await client.post("/api/v1/users", json=USER)
+    response = await client.post("/api/v1/users", json=USER)
+    assert response.status_code == 400
+
+
+async def test_update_is_one_statement(client, statements):
+    await client.post("/api/v1/users", json=USER)
+    statements.clear()
+    response = await client.put("/api/v1/users/1", json={"bio": "analyst"})
+    assert response.status_code == 200
+    assert response.json()["bio"] == "analyst"
+    assert len(statements) == 1
+
+
+async def test_bulk_insert_is_two_statements(client, statements):
+    # One lookup of taken usernames and emails, one INSERT for the batch
+    items = [{"username": f"u{i}", "email": f"u{i}@example.com", "full_name": "U"} for i in range(50)]
+    response = await client.post("/api/v1/users/bulk", json=items)
+    assert response.json()["created"] == 50
+    assert len(statements) == 2